@@ -0,0 +1,71 @@
+"""
+Benchmark the batched constellation propagation against looping over one pyorbital Orbital per satellite.
+
+Synthetic constellations are created from a single TLE by spreading the satellites over the orbit
+(mean anomaly) and over the RAAN. For each constellation size, the time to propagate all satellites
+for one simulation step is measured with both approaches.
+
+Usage:
+    python scripts/constellation_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from pyorbital.orbital import Orbital
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sim"))
+from constellation import Constellation  # noqa: E402
+
+LINE1 = "1 58469U 23185H   24092.52931972  .00003325  00000+0  25755-3 0  9995"
+LINE2 = "2 58469  97.6719 160.4649 0013302 174.6184 185.5186 15.02057459 18273"
+SIZES = [1, 10, 100, 1000, 5000]
+REPEATS = 20
+
+
+def tle_checksum(line):
+    return sum(int(c) if c.isdigit() else (1 if c == "-" else 0) for c in line[:68]) % 10
+
+
+def synthetic_tles(n):
+    tles = []
+    for i in range(n):
+        catalog = f"{90000 + i:05d}"[-5:]
+        raan = (160.4649 + 360.0 * (i % 36) / 36) % 360
+        mean_anomaly = (185.5186 + 360.0 * i / max(n, 1)) % 360
+        line1 = "1 " + catalog + LINE1[7:68]
+        line2 = "2 " + catalog + LINE2[7:17] + f"{raan:8.4f}" + LINE2[25:43] + f"{mean_anomaly:8.4f}" + LINE2[51:68]
+        tles.append((None, line1 + str(tle_checksum(line1)), line2 + str(tle_checksum(line2))))
+    return tles
+
+
+def time_per_step(func, t0):
+    func(t0)  # warm up
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        func(t0 + 20.0 * i)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    t0 = time.time()
+    print(f"{'satellites':>10} | {'batched [ms]':>12} | {'per sat [us]':>12} | {'loop [ms]':>10} | {'per sat [us]':>12} | {'speedup':>7}")
+    for n in SIZES:
+        tles = synthetic_tles(n)
+        constellation = Constellation(tles)
+        batched = time_per_step(constellation.get_lonlatalt, t0)
+
+        orbitals = [Orbital(line1[2:7], line1=line1, line2=line2) for _, line1, line2 in tles]
+
+        def loop(t):
+            np_t = np.datetime64(int(t), "s")
+            return [orbital.get_lonlatalt(np_t) for orbital in orbitals]
+
+        looped = time_per_step(loop, t0)
+        print(f"{n:>10} | {batched * 1e3:>12.3f} | {batched / n * 1e6:>12.2f} | {looped * 1e3:>10.3f} | {looped / n * 1e6:>12.2f} | {looped / batched:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark the dispatch cost of the simulator event bus against pydispatch.
+
+One simulation step publishes five events (four step forward events and one ground position).
+For a growing number of subscribers per topic, the time to dispatch one step is measured with
+pydispatch (dict payloads, as the simulator used to send them) and with the event bus (dataclass
+payloads). The subscribers do nothing, so the numbers are the pure dispatch overhead.
+
+pydispatcher is no longer a dependency of the simulator, install it to run the comparison:
+    pip install pydispatcher
+    python scripts/eventbus_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sim"))
+from eventbus import EventBus, StepForward, GroundPosition  # noqa: E402
+
+try:
+    from pydispatch import dispatcher
+except ImportError:
+    dispatcher = None
+
+TOPIC_STEP_FORWARD = "benchmark.step_forward"
+TOPIC_GROUND_POSITION = "benchmark.ground_position"
+SUBSCRIBERS = [1, 5, 20, 50]
+STEPS = 20000
+
+
+class Subscriber:
+    # bound methods like the simulator subsystems (pydispatch holds them through weak references)
+    def on_pydispatch(self, sender, data, time):
+        pass
+
+    def on_event(self, event):
+        pass
+
+
+def pydispatch_step(step):
+    for i in range(3, -1, -1):
+        dispatcher.send(signal=TOPIC_STEP_FORWARD, sender="sim", data={'counter': i}, time=step, time_epsec=step)
+    dispatcher.send(signal=TOPIC_GROUND_POSITION, sender="sim",
+                    data={'lon': 1.0, 'lat': 2.0, 'alt': 500.0, 'time_unix': step},
+                    time="2024-01-01T00:00:00", time_epsec=step)
+
+
+def eventbus_step(bus, step):
+    for i in range(3, -1, -1):
+        bus.publish(TOPIC_STEP_FORWARD, StepForward(i, step, step))
+    bus.publish(TOPIC_GROUND_POSITION, GroundPosition(1.0, 2.0, 500.0, "2024-01-01T00:00:00", step, step))
+
+
+def time_per_step(func):
+    func(0.0)  # warm up
+    start = time.perf_counter()
+    for step in range(STEPS):
+        func(float(step))
+    return (time.perf_counter() - start) / STEPS
+
+
+def main():
+    if dispatcher is None:
+        print("pydispatcher is not installed, only the event bus is measured")
+    print(f"{'subscribers':>11} | {'eventbus [us]':>13} | {'pydispatch [us]':>15} | {'speedup':>7}")
+    for n in SUBSCRIBERS:
+        subscribers = [Subscriber() for _ in range(n)]
+
+        bus = EventBus()
+        for subscriber in subscribers:
+            bus.subscribe(TOPIC_STEP_FORWARD, subscriber.on_event)
+            bus.subscribe(TOPIC_GROUND_POSITION, subscriber.on_event)
+        bus_time = time_per_step(lambda step: eventbus_step(bus, step))
+
+        if dispatcher is None:
+            print(f"{n:>11} | {bus_time * 1e6:>13.2f} | {'-':>15} | {'-':>7}")
+            continue
+
+        for subscriber in subscribers:
+            dispatcher.connect(subscriber.on_pydispatch, signal=TOPIC_STEP_FORWARD)
+            dispatcher.connect(subscriber.on_pydispatch, signal=TOPIC_GROUND_POSITION)
+        pydispatch_time = time_per_step(pydispatch_step)
+        for subscriber in subscribers:
+            dispatcher.disconnect(subscriber.on_pydispatch, signal=TOPIC_STEP_FORWARD)
+            dispatcher.disconnect(subscriber.on_pydispatch, signal=TOPIC_GROUND_POSITION)
+
+        print(f"{n:>11} | {bus_time * 1e6:>13.2f} | {pydispatch_time * 1e6:>15.2f} | {pydispatch_time / bus_time:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
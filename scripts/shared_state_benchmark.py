@@ -0,0 +1,80 @@
+"""
+Benchmark reading the satellite position from the shared state block against the multiprocessing Manager dict.
+
+A writer process updates the position as fast as it can (all four values are the same counter, so a torn
+read is easy to detect) while the main process reads it. Reports the time per read for both ways of
+sharing the state and the number of torn reads seen from the state block (expected: 0).
+
+Usage:
+    python scripts/shared_state_benchmark.py
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sim"))
+from shared_state import SharedStateBlock  # noqa: E402
+
+READS = 200_000
+MANAGER_READS = 5_000
+
+
+def block_writer(name, stop):
+    block = SharedStateBlock.attach(name)
+    k = 0.0
+    while not stop.is_set():
+        k += 1
+        block.write_primary(k, k, k, k)
+    block.close()
+
+
+def dict_writer(shared_data_dict, stop):
+    k = 0.0
+    while not stop.is_set():
+        k += 1
+        shared_data_dict["satellite_position"] = (k, k, k)
+        shared_data_dict["last_updated_unix"] = k
+
+
+def main():
+    stop = multiprocessing.Event()
+
+    block = SharedStateBlock.create()
+    writer = multiprocessing.Process(target=block_writer, args=(block.name, stop))
+    writer.start()
+    time.sleep(0.5)
+    torn = 0
+    start = time.perf_counter()
+    for _ in range(READS):
+        position, time_unix = block.read_primary()
+        if position is not None and not (position[0] == position[1] == position[2] == time_unix):
+            torn += 1
+    block_time = (time.perf_counter() - start) / READS
+    stop.set()
+    writer.join()
+    block.close(unlink=True)
+
+    stop.clear()
+    manager = multiprocessing.Manager()
+    shared_data_dict = manager.dict()
+    writer = multiprocessing.Process(target=dict_writer, args=(shared_data_dict, stop))
+    writer.start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    for _ in range(MANAGER_READS):
+        # two calls, as the API did: position and timestamp are not read atomically
+        shared_data_dict.get("satellite_position")
+        shared_data_dict.get("last_updated_unix")
+    dict_time = (time.perf_counter() - start) / MANAGER_READS
+    stop.set()
+    writer.join()
+
+    print(f"state block:  {block_time * 1e6:8.3f} us per read ({torn} torn reads in {READS})")
+    print(f"manager dict: {dict_time * 1e6:8.3f} us per read")
+    print(f"speedup:      {dict_time / block_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { TelemetryPoint, fetchRecentTelemetry } from "./api";
+import { TelemetryPoint, TelemetryStreamEvent, columnsToPoints, fetchTelemetryColumns, subscribeTelemetry } from "./api";
 import { GlobeView } from "./GlobeView";
 import { TelemetryPanel } from "./TelemetryPanel";
 import { SimulationControls } from "./SimulationControls";
@@ -7,15 +7,17 @@ import { SimulationControls } from "./SimulationControls";
 export const App: React.FC = () => {
   const [telemetry, setTelemetry] = useState<TelemetryPoint[]>([]);
 
-  // Poll telemetry ~1 Hz
+  // Telemetry pushed by the server (SSE), polling ~1 Hz (binary payload) if the stream is not available
   useEffect(() => {
     let cancelled = false;
+    let pollHandle: ReturnType<typeof setInterval> | null = null;
+    let points = new Map<string, TelemetryPoint>();
 
     const poll = async () => {
       try {
-        const data = await fetchRecentTelemetry();
+        const data = await fetchTelemetryColumns();
         if (!cancelled) {
-          setTelemetry(data);
+          setTelemetry(columnsToPoints(data));
         }
       } catch (err) {
         // eslint-disable-next-line no-console
@@ -23,12 +25,39 @@ export const App: React.FC = () => {
       }
     };
 
-    poll();
-    const handle = setInterval(poll, 1000);
+    const startPolling = () => {
+      if (cancelled || pollHandle !== null) {
+        return;
+      }
+      poll();
+      pollHandle = setInterval(poll, 1000);
+    };
+
+    const apply = (event: TelemetryStreamEvent, snapshot: boolean) => {
+      if (snapshot) {
+        points = new Map();
+      }
+      for (const point of event.telemetry) {
+        points.set(point.satellite, point);
+      }
+      for (const satellite of event.left) {
+        points.delete(satellite);
+      }
+      setTelemetry(Array.from(points.values()));
+    };
+
+    const unsubscribe = subscribeTelemetry(
+      (event) => apply(event, true),
+      (event) => apply(event, false),
+      startPolling
+    );
 
     return () => {
       cancelled = true;
-      clearInterval(handle);
+      unsubscribe();
+      if (pollHandle !== null) {
+        clearInterval(pollHandle);
+      }
     };
   }, []);
 
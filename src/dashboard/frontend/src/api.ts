@@ -27,6 +27,106 @@ export async function fetchRecentTelemetry(): Promise<TelemetryPoint[]> {
   return res.data.telemetry ?? [];
 }
 
+/** Latest telemetry as parallel arrays (binary format of /api/telemetry/recent/). */
+export interface TelemetryColumns {
+  /** satellites matching the query; larger than `satellite.length` if the limit cut the result */
+  total: number;
+  satellite: string[];
+  /** seconds since the epoch */
+  timestamp: Float64Array;
+  latitude: Float32Array;
+  longitude: Float32Array;
+  /** km, NaN if unknown */
+  altitude: Float32Array;
+}
+
+export interface TelemetryQuery {
+  /** [min_lon, min_lat, max_lon, max_lat], min_lon > max_lon crosses the antimeridian */
+  bbox?: [number, number, number, number];
+  limit?: number;
+}
+
+/** Decode the binary telemetry payload (layout: simulation/columnar.py). */
+export function decodeTelemetryBinary(buffer: ArrayBuffer): TelemetryColumns {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "FSTM" || view.getUint32(4, true) !== 1) {
+    throw new Error("Unsupported telemetry payload");
+  }
+  const n = view.getUint32(8, true);
+  const total = view.getUint32(12, true);
+  // typed arrays use the platform byte order, which is little-endian in every browser
+  let offset = 16;
+  const timestamp = new Float64Array(buffer, offset, n);
+  offset += 8 * n;
+  const latitude = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const longitude = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const altitude = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const names = new TextDecoder().decode(new Uint8Array(buffer, offset));
+  const satellite = n ? names.split("\n") : [];
+  return { total, satellite, timestamp, latitude, longitude, altitude };
+}
+
+export async function fetchTelemetryColumns(query: TelemetryQuery = {}): Promise<TelemetryColumns> {
+  const params: Record<string, string> = { format: "binary" };
+  if (query.bbox) {
+    params.bbox = query.bbox.join(",");
+  }
+  if (query.limit !== undefined) {
+    params.limit = String(query.limit);
+  }
+  const res = await api.get<ArrayBuffer>("/telemetry/recent/", { params, responseType: "arraybuffer" });
+  return decodeTelemetryBinary(res.data);
+}
+
+/** Points of a columnar payload, for the components that take TelemetryPoint objects (no `extra`). */
+export function columnsToPoints(columns: TelemetryColumns): TelemetryPoint[] {
+  return columns.satellite.map((satellite, i) => ({
+    satellite,
+    timestamp: new Date(columns.timestamp[i] * 1000).toISOString(),
+    latitude: columns.latitude[i],
+    longitude: columns.longitude[i],
+    altitude: Number.isNaN(columns.altitude[i]) ? null : columns.altitude[i],
+    extra: null,
+  }));
+}
+
+export interface TelemetryStreamEvent {
+  telemetry: TelemetryPoint[];
+  left: string[];
+  cursor: number;
+}
+
+/**
+ * Subscribe to the server-sent telemetry events (/api/telemetry/stream/).
+ * `onSnapshot` gets all satellites (on connect and on every reconnect), `onDelta` only the
+ * satellites that changed. `onUnavailable` is called if the stream can't be used, the
+ * EventSource is closed then. Returns a function that closes the stream.
+ */
+export function subscribeTelemetry(
+  onSnapshot: (event: TelemetryStreamEvent) => void,
+  onDelta: (event: TelemetryStreamEvent) => void,
+  onUnavailable: () => void
+): () => void {
+  if (typeof EventSource === "undefined") {
+    onUnavailable();
+    return () => {};
+  }
+  const source = new EventSource("/api/telemetry/stream/");
+  source.addEventListener("snapshot", (e) => onSnapshot(JSON.parse((e as MessageEvent).data)));
+  source.addEventListener("delta", (e) => onDelta(JSON.parse((e as MessageEvent).data)));
+  source.onerror = () => {
+    // the browser reconnects by itself, unless the endpoint doesn't answer with an event stream
+    if (source.readyState === EventSource.CLOSED) {
+      onUnavailable();
+    }
+  };
+  return () => source.close();
+}
+
 export async function sendCommand(
   command: Command["command"],
   parameters?: Command["parameters"]
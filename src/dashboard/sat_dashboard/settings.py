@@ -1,3 +1,4 @@
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -96,6 +97,23 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Telemetry history: how long points are kept ("raw" points and rollups by resolution in seconds),
+# counted from when they were pushed
+TELEMETRY_HISTORY_RETENTION = {
+    "raw": timedelta(days=1),
+    1: timedelta(days=7),
+    60: timedelta(days=90),
+    600: timedelta(days=365),
+}
+
+# Write-behind telemetry ingest (see simulation.write_behind): the ingested points are buffered in
+# memory and written to the database in one transaction every interval (milliseconds, 0: disabled,
+# every ingest request commits). Beyond MAX_POINTS buffered points the ingest flushes itself, and
+# is refused with 503 if that fails (the buffer doesn't grow while the database is down).
+TELEMETRY_WRITE_BEHIND_INTERVAL_MS = int(os.environ.get("TELEMETRY_WRITE_BEHIND_INTERVAL_MS", "0"))
+TELEMETRY_WRITE_BEHIND_MAX_POINTS = 200_000
+
+
 # CORS – allow local dev front-end
 CORS_ALLOW_ALL_ORIGINS = True
 
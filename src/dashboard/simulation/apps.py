@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+
+def _configure_sqlite(sender, connection, **kwargs) -> None:
+    """
+    WAL journal for every SQLite connection: the dashboard's readers don't block the telemetry
+    writes (and vice versa), and with synchronous=NORMAL a commit doesn't wait for an fsync
+    (a power loss can only lose the last commits, the database stays consistent).
+    """
+
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+
+
+class SimulationConfig(AppConfig):
+    name = "simulation"
+
+    def ready(self) -> None:
+        connection_created.connect(_configure_sqlite)
+
+        from .models import Satellite
+        from .push import satellite_deleted, satellite_saved
+
+        # the telemetry hub drops satellites that are deactivated or deleted
+        post_save.connect(satellite_saved, sender=Satellite)
+        post_delete.connect(satellite_deleted, sender=Satellite)
@@ -0,0 +1,57 @@
+"""
+Compact encodings of the latest telemetry for large constellations (?format= of /api/telemetry/recent/).
+
+"columns": JSON with one array per field instead of one object per satellite:
+
+    {"total": 1200, "satellite": ["SAT-1", ...], "timestamp": ["2026-01-27T12:00:00+00:00", ...],
+     "latitude": [40.0, ...], "longitude": [-75.0, ...], "altitude": [500.0, ...]}
+
+"binary" (application/octet-stream, little-endian), for typed arrays on the client:
+
+    offset 0     4 bytes   b"FSTM"
+    offset 4     uint32    format version (1)
+    offset 8     uint32    n, number of points in the payload
+    offset 12    uint32    total, number of points matching the query (n is smaller with a limit)
+    offset 16    float64[n] timestamp, seconds since the epoch
+    then         float32[n] latitude, float32[n] longitude, float32[n] altitude (km, NaN if unknown)
+    then         satellite names, UTF-8, separated by "\n"
+
+`extra` is not part of either encoding.
+"""
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Any
+
+BINARY_MAGIC = b"FSTM"
+BINARY_VERSION = 1
+
+
+def to_columns(points: list[dict[str, Any]], total: int) -> dict[str, Any]:
+    return {
+        "total": total,
+        "satellite": [point["satellite"] for point in points],
+        "timestamp": [point["timestamp"] for point in points],
+        "latitude": [point["latitude"] for point in points],
+        "longitude": [point["longitude"] for point in points],
+        "altitude": [point["altitude"] for point in points],
+    }
+
+
+def to_binary(points: list[dict[str, Any]], total: int) -> bytes:
+    nan = float("nan")
+    timestamps = array("d", (datetime.fromisoformat(point["timestamp"]).timestamp() for point in points))
+    latitudes = array("f", (point["latitude"] for point in points))
+    longitudes = array("f", (point["longitude"] for point in points))
+    altitudes = array("f", (nan if point["altitude"] is None else point["altitude"] for point in points))
+    if sys.byteorder == "big":
+        for column in (timestamps, latitudes, longitudes, altitudes):
+            column.byteswap()
+    names = "\n".join(point["satellite"] for point in points).encode()
+    header = BINARY_MAGIC + struct.pack("<III", BINARY_VERSION, len(points), total)
+    return b"".join(
+        [header, timestamps.tobytes(), latitudes.tobytes(), longitudes.tobytes(), altitudes.tobytes(), names]
+    )
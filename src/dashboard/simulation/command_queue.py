@@ -0,0 +1,113 @@
+"""
+Cursor-based consumption of the SimulationCommand queue.
+
+Command ids only grow, so a consumer's position in the queue is a single number: the id
+of the last command it acknowledged (CommandConsumer.cursor). Reading the commands after
+a cursor is a range scan on the primary key, independent of how many commands came before.
+
+- claim(): returns the commands after the cursor and moves the cursor past them in one
+  compare-and-set UPDATE. Two concurrent claims never return the same command, and a
+  command inserted during a claim is simply returned by the next one.
+- acknowledge(): moves the cursor forward (never back), for consumers that read with an
+  explicit cursor (the long-poll endpoint) and acknowledge what they handled.
+- compact(): deletes old commands all active consumers are past, in batches.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import timedelta
+from itertools import takewhile
+
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import CommandConsumer, SimulationCommand
+
+DEFAULT_CONSUMER = "simulator"
+# acknowledged commands are kept this long; consumers not seen for this long don't hold back compaction
+COMMAND_RETENTION = timedelta(days=1)
+# compaction runs at most once per interval (seconds), triggered by new commands
+COMPACT_INTERVAL = 300.0
+COMPACT_BATCH_SIZE = 1000
+CLAIM_LIMIT = 1000
+
+_last_compact = 0.0
+_compact_lock = threading.Lock()
+
+
+def get_consumer(name: str = DEFAULT_CONSUMER) -> CommandConsumer:
+    consumer, _ = CommandConsumer.objects.get_or_create(name=name)
+    return consumer
+
+
+def pending(cursor: int, limit: int = CLAIM_LIMIT) -> list[SimulationCommand]:
+    """Commands after the cursor, oldest first."""
+
+    return list(SimulationCommand.objects.filter(id__gt=cursor).order_by("id")[:limit])
+
+
+def claim(name: str = DEFAULT_CONSUMER, limit: int = CLAIM_LIMIT) -> list[SimulationCommand]:
+    """Commands after the consumer's cursor, acknowledged in the same step."""
+
+    consumer = get_consumer(name)
+    while True:
+        commands = pending(consumer.cursor, limit)
+        if not commands:
+            return []
+        # compare-and-set: only one of several concurrent claims moves the cursor from here
+        claimed = CommandConsumer.objects.filter(pk=consumer.pk, cursor=consumer.cursor).update(
+            cursor=commands[-1].id, updated_at=timezone.now()
+        )
+        if claimed:
+            return commands
+        consumer.refresh_from_db(fields=["cursor"])
+
+
+def acknowledge(cursor: int, name: str = DEFAULT_CONSUMER) -> int:
+    """Move the consumer's cursor to `cursor` if that is forward. Returns the resulting cursor."""
+
+    consumer = get_consumer(name)
+    CommandConsumer.objects.filter(pk=consumer.pk, cursor__lt=cursor).update(cursor=cursor, updated_at=timezone.now())
+    consumer.refresh_from_db(fields=["cursor"])
+    return consumer.cursor
+
+
+def maybe_compact() -> None:
+    """Compact the queue if the last compaction was more than COMPACT_INTERVAL seconds ago."""
+
+    global _last_compact
+    with _compact_lock:
+        if time.monotonic() - _last_compact < COMPACT_INTERVAL:
+            return
+        _last_compact = time.monotonic()
+    compact()
+
+
+def compact() -> int:
+    """
+    Delete the commands older than COMMAND_RETENTION that every active consumer has
+    acknowledged. Returns the number of deleted commands.
+    """
+
+    now = timezone.now()
+    cutoff = now - COMMAND_RETENTION
+    active = CommandConsumer.objects.filter(updated_at__gte=cutoff)
+    min_cursor = active.aggregate(cursor=Min("cursor"))["cursor"]
+
+    deleted = 0
+    while True:
+        # ids grow with created_at: the expired commands are a prefix of the queue
+        batch = list(SimulationCommand.objects.order_by("id").values_list("id", "created_at")[:COMPACT_BATCH_SIZE])
+        expired = [
+            command_id
+            for command_id, _ in takewhile(
+                lambda row: row[1] < cutoff and (min_cursor is None or row[0] <= min_cursor), batch
+            )
+        ]
+        if not expired:
+            return deleted
+        n, _ = SimulationCommand.objects.filter(id__lte=expired[-1]).delete()
+        deleted += n
+        if len(expired) < len(batch) or len(batch) < COMPACT_BATCH_SIZE:
+            return deleted
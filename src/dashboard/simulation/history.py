@@ -0,0 +1,159 @@
+"""
+Telemetry history: append-only raw points, downsampled rollups, retention and range queries.
+
+Every ingested point is appended to TelemetryHistory and offered to the rollup of each
+resolution in TelemetryRollup.RESOLUTIONS, where the first point of a satellite in a bucket
+wins (INSERT ... ON CONFLICT DO NOTHING, batched per resolution and request). A range query uses
+the raw points if there are at most `max_points` of them, otherwise the finest rollup that
+fits, so a 24 h track is read from ~1440 rows of the 1 min rollup through its unique index.
+Only tables whose retention still covers the start of the range are considered: a range older
+than the raw retention is read from the rollups.
+
+Rows are pruned by age (settings.TELEMETRY_HISTORY_RETENTION). Ids grow with received_at, so
+the oldest rows are the ones with the smallest ids: pruning deletes id ranges in batches of
+PRUNE_BATCH_SIZE rows, each batch in its own short transaction, and needs no extra index.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime
+from itertools import takewhile
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
+
+from .models import TelemetryHistory, TelemetryRollup
+
+# range queries return at most this many points by default
+DEFAULT_MAX_POINTS = 2000
+# pruning runs at most once per interval (seconds), triggered by the ingest
+PRUNE_INTERVAL = 60.0
+PRUNE_BATCH_SIZE = 5000
+
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def record(points: Iterable[tuple[int, dict[str, Any]]]) -> None:
+    """
+    Append points, given as (satellite id, point from _parse_telemetry_point), to the history
+    and the rollups. Meant to run in the transaction of the ingest.
+    """
+
+    # plain executemany instead of bulk_create: compiling the INSERT through the ORM costs ~20x
+    # more than executing it, and this runs for every ingested point
+    points = list(points)
+    if not points:
+        return
+    adapt = connection.ops.adapt_datetimefield_value
+    received_at = adapt(timezone.now())  # one received_at for the whole request
+    rows = [
+        (satellite_id, point["timestamp"].timestamp(), adapt(point["timestamp"]),
+         point["latitude"], point["longitude"], point["altitude"])
+        for satellite_id, point in points
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {TelemetryHistory._meta.db_table} "
+            "(satellite_id, timestamp, latitude, longitude, altitude, received_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(satellite_id, timestamp, lat, lon, alt, received_at) for satellite_id, _, timestamp, lat, lon, alt in rows],
+        )
+        for resolution in TelemetryRollup.RESOLUTIONS:
+            # first point of a bucket wins
+            cursor.executemany(
+                f"INSERT INTO {TelemetryRollup._meta.db_table} "
+                "(satellite_id, resolution, bucket, timestamp, latitude, longitude, altitude, received_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING",
+                [
+                    (satellite_id, resolution, int(unix_time // resolution), timestamp, lat, lon, alt, received_at)
+                    for satellite_id, unix_time, timestamp, lat, lon, alt in rows
+                ],
+            )
+
+
+def maybe_prune() -> None:
+    """Prune the history if the last pruning was more than PRUNE_INTERVAL seconds ago."""
+
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+            return
+        _last_prune = time.monotonic()
+    prune()
+
+
+def prune(now: datetime | None = None) -> int:
+    """Delete the points older than their retention. Returns the number of deleted rows."""
+
+    now = now or timezone.now()
+    deleted = 0
+    for resolution, retention in settings.TELEMETRY_HISTORY_RETENTION.items():
+        if resolution == "raw":
+            queryset: models.QuerySet = TelemetryHistory.objects.all()
+        else:
+            queryset = TelemetryRollup.objects.filter(resolution=resolution)
+        deleted += _prune_oldest(queryset, now - retention)
+    return deleted
+
+
+def query(satellite_id: int, start: datetime, end: datetime, max_points: int = DEFAULT_MAX_POINTS) -> tuple[int, list[tuple]]:
+    """
+    Points of a satellite with start <= timestamp <= end, oldest first, as
+    (timestamp, latitude, longitude, altitude) tuples.
+
+    Returns (resolution, points): resolution 0 for the raw points, otherwise the bucket size of
+    the rollup (the finest one with at most `max_points` buckets in the range, or the coarsest).
+    Tables that are pruned after less than the age of `start` are skipped (the coarsest rollup
+    is used if none covers it).
+    """
+
+    fields = ("timestamp", "latitude", "longitude", "altitude")
+    now = timezone.now()
+    if _retained("raw", start, now):
+        raw = TelemetryHistory.objects.filter(satellite_id=satellite_id, timestamp__gte=start, timestamp__lte=end)
+        points = list(raw.order_by("timestamp").values_list(*fields)[: max_points + 1])
+        if len(points) <= max_points:
+            return 0, points
+
+    span = (end - start).total_seconds()
+    resolutions = [r for r in TelemetryRollup.RESOLUTIONS if _retained(r, start, now)] or TelemetryRollup.RESOLUTIONS[-1:]
+    resolution = next((r for r in resolutions if span / r <= max_points), resolutions[-1])
+    rollup = TelemetryRollup.objects.filter(
+        satellite_id=satellite_id,
+        resolution=resolution,
+        bucket__gte=int(start.timestamp() // resolution),
+        bucket__lte=int(end.timestamp() // resolution),
+        timestamp__gte=start,
+        timestamp__lte=end,
+    )
+    return resolution, list(rollup.order_by("bucket").values_list(*fields))
+
+
+# --------------------------------------------------------
+# Helper functions
+# --------------------------------------------------------
+
+
+def _retained(resolution: int | str, start: datetime, now: datetime) -> bool:
+    # whether the retention of a table ("raw" or a rollup resolution) still covers `start`
+    retention = settings.TELEMETRY_HISTORY_RETENTION.get(resolution)
+    return retention is None or start >= now - retention
+
+
+def _prune_oldest(queryset: models.QuerySet, cutoff: datetime) -> int:
+    deleted = 0
+    ordered = queryset.order_by("id")
+    while True:
+        oldest = ordered.values_list("received_at", flat=True).first()
+        if oldest is None or oldest >= cutoff:
+            return deleted
+        # oldest rows first (smallest ids), expired up to the first row received after the cutoff
+        batch = list(ordered.values_list("id", "received_at")[:PRUNE_BATCH_SIZE])
+        expired = [row_id for row_id, received_at in takewhile(lambda row: row[1] < cutoff, batch)]
+        n, _ = queryset.filter(id__lte=expired[-1]).delete()
+        deleted += n
+        if len(expired) < len(batch) or len(batch) < PRUNE_BATCH_SIZE:
+            return deleted
@@ -0,0 +1,109 @@
+"""
+Storage of ingested telemetry points: the latest point per satellite (one upsert for all
+satellites) and the history, in one transaction. Used by the bulk ingest endpoint and by
+the write-behind buffer (see simulation.write_behind).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Iterable
+
+from django.db import IntegrityError, transaction
+
+from . import history
+from .models import Satellite, Telemetry
+
+TELEMETRY_FIELDS = ("timestamp", "latitude", "longitude", "altitude", "extra")
+
+# Satellite name -> id, shared by the ingest requests of this process. Satellites are only
+# created by the ingest endpoints, a stale entry (satellite deleted in the admin) is dropped when
+# the upsert fails.
+_satellite_ids: dict[str, int] = {}
+_satellite_ids_lock = threading.Lock()
+
+# Names of the inactive satellites (Satellite.active false): their telemetry is stored, but not shown
+# on the dashboards. Read again after SATELLITE_STATE_MAX_AGE seconds, and right away when a satellite
+# is saved or deleted in this process (forget_satellite).
+SATELLITE_STATE_MAX_AGE = 5.0
+_inactive: frozenset[str] = frozenset()
+_inactive_read_at = float("-inf")
+
+
+def resolve_satellites(names: set[str]) -> dict[str, int]:
+    """Ids of the given satellites, creating the missing ones (one query each for lookup and creation)."""
+
+    with _satellite_ids_lock:
+        ids = {name: _satellite_ids[name] for name in names if name in _satellite_ids}
+    missing = names - ids.keys()
+    if missing:
+        found = dict(Satellite.objects.filter(name__in=missing).values_list("name", "id"))
+        if len(found) < len(missing):
+            Satellite.objects.bulk_create(
+                [Satellite(name=name) for name in missing - found.keys()], ignore_conflicts=True
+            )
+            found = dict(Satellite.objects.filter(name__in=missing).values_list("name", "id"))
+        ids.update(found)
+        with _satellite_ids_lock:
+            _satellite_ids.update(found)
+    return ids
+
+
+def inactive_satellites() -> frozenset[str]:
+    """Names of the inactive satellites (one query at most every SATELLITE_STATE_MAX_AGE seconds)."""
+
+    global _inactive, _inactive_read_at
+    with _satellite_ids_lock:
+        if time.monotonic() - _inactive_read_at < SATELLITE_STATE_MAX_AGE:
+            return _inactive
+    inactive = frozenset(Satellite.objects.filter(active=False).values_list("name", flat=True))
+    with _satellite_ids_lock:
+        _inactive, _inactive_read_at = inactive, time.monotonic()
+    return inactive
+
+
+def forget_satellite(name: str) -> None:
+    """Drop what is cached about a satellite that was changed or deleted."""
+
+    global _inactive_read_at
+    with _satellite_ids_lock:
+        _satellite_ids.pop(name, None)
+        _inactive_read_at = float("-inf")
+
+
+def store_points(points: Iterable[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """
+    Write parsed points (oldest first) in one transaction: all of them to the history, the last
+    one of each satellite as its latest telemetry. Returns the latest point by satellite.
+    """
+
+    points = list(points)
+    latest: dict[str, dict[str, Any]] = {}
+    for point in points:
+        latest[point["satellite"]] = point
+    if not latest:
+        return latest
+
+    for attempt in range(2):
+        satellite_ids = resolve_satellites(set(latest))
+        rows = [
+            Telemetry(satellite_id=satellite_ids[name], **{field: point[field] for field in TELEMETRY_FIELDS})
+            for name, point in latest.items()
+        ]
+        try:
+            with transaction.atomic():
+                Telemetry.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=["satellite"],
+                    update_fields=[*TELEMETRY_FIELDS, "updated_at"],
+                )
+                history.record((satellite_ids[point["satellite"]], point) for point in points)
+            return latest
+        except IntegrityError:
+            if attempt:
+                raise
+            # a cached satellite doesn't exist anymore -> look them up again
+            with _satellite_ids_lock:
+                _satellite_ids.clear()
+    return latest
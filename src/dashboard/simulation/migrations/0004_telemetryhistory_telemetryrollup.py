@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulation', '0003_alter_telemetry_options_remove_telemetry_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(help_text='Simulation timestamp (UTC).')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('altitude', models.FloatField(blank=True, help_text='Altitude in kilometers.', null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True, help_text='When the point was pushed (retention)')),
+                ('satellite', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='history', to='simulation.satellite')),
+            ],
+            options={
+                'verbose_name_plural': 'Telemetry history',
+                'indexes': [models.Index(fields=['satellite', 'timestamp'], name='simulation__satelli_7bbfb5_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(help_text='Bucket size in seconds.')),
+                ('bucket', models.BigIntegerField(help_text='Unix time of the timestamp // resolution.')),
+                ('timestamp', models.DateTimeField(help_text='Simulation timestamp (UTC) of the point.')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('altitude', models.FloatField(blank=True, help_text='Altitude in kilometers.', null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True, help_text='When the point was pushed (retention)')),
+                ('satellite', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='simulation.satellite')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('satellite', 'resolution', 'bucket'), name='unique_telemetry_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:29
+
+from django.db import migrations, models
+
+
+def create_simulator_consumer(apps, schema_editor):
+    # the simulator continues where the consumed flag left off: at the first unconsumed command
+    SimulationCommand = apps.get_model("simulation", "SimulationCommand")
+    CommandConsumer = apps.get_model("simulation", "CommandConsumer")
+    first_unconsumed = SimulationCommand.objects.filter(consumed=False).order_by("id").values_list("id", flat=True).first()
+    if first_unconsumed is not None:
+        cursor = first_unconsumed - 1
+    else:
+        cursor = SimulationCommand.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    CommandConsumer.objects.create(name="simulator", cursor=cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulation', '0004_telemetryhistory_telemetryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandConsumer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('cursor', models.BigIntegerField(default=0, help_text='Id of the last command the consumer acknowledged')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_simulator_consumer, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='simulationcommand',
+            name='simulation__consume_1567dd_idx',
+        ),
+        migrations.RemoveField(
+            model_name='simulationcommand',
+            name='consumed',
+        ),
+    ]
@@ -45,12 +45,74 @@ class Telemetry(models.Model):
         return f"{self.satellite} @ {self.timestamp.isoformat()}"
 
 
+class TelemetryHistory(models.Model):
+    """
+    Append-only telemetry history: every point pushed by the simulator.
+
+    Kept for settings.TELEMETRY_HISTORY_RETENTION["raw"], longer ranges are served
+    from the downsampled TelemetryRollup (see simulation.history).
+    """
+
+    satellite = models.ForeignKey(
+        Satellite,
+        on_delete=models.CASCADE,
+        related_name="history",
+        db_index=False,  # covered by the (satellite, timestamp) index
+    )
+    timestamp = models.DateTimeField(help_text="Simulation timestamp (UTC).")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    altitude = models.FloatField(null=True, blank=True, help_text="Altitude in kilometers.")
+    received_at = models.DateTimeField(auto_now_add=True, help_text="When the point was pushed (retention)")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["satellite", "timestamp"]),
+        ]
+        verbose_name_plural = "Telemetry history"
+
+    def __str__(self) -> str:
+        return f"{self.satellite} @ {self.timestamp.isoformat()}"
+
+
+class TelemetryRollup(models.Model):
+    """
+    Downsampled telemetry history: the first point of each satellite in every
+    bucket of `resolution` seconds (simulation time).
+    """
+
+    RESOLUTIONS = [1, 60, 600]
+
+    satellite = models.ForeignKey(
+        Satellite,
+        on_delete=models.CASCADE,
+        related_name="rollups",
+        db_index=False,  # covered by the unique (satellite, resolution, bucket) index
+    )
+    resolution = models.PositiveIntegerField(help_text="Bucket size in seconds.")
+    bucket = models.BigIntegerField(help_text="Unix time of the timestamp // resolution.")
+    timestamp = models.DateTimeField(help_text="Simulation timestamp (UTC) of the point.")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    altitude = models.FloatField(null=True, blank=True, help_text="Altitude in kilometers.")
+    received_at = models.DateTimeField(auto_now_add=True, help_text="When the point was pushed (retention)")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["satellite", "resolution", "bucket"], name="unique_telemetry_rollup_bucket"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.satellite} @ {self.timestamp.isoformat()} ({self.resolution} s)"
+
+
 class SimulationCommand(models.Model):
     """
     Command queue for simulation control.
     
-    The dashboard adds commands here, and the simulator polls /api/commands/
-    to get all commands since the last poll, then they are marked as consumed.
+    The dashboard adds commands here. Consumers (the simulator) read the commands
+    after their cursor, the id of the last command they acknowledged (see
+    CommandConsumer and simulation.command_queue).
     """
 
     COMMAND_TYPES = [
@@ -69,13 +131,9 @@ class SimulationCommand(models.Model):
         help_text="Command-specific parameters (e.g., start_time, step_size, replay_speed)",
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    consumed = models.BooleanField(default=False, help_text="True when simulator has fetched this command")
 
     class Meta:
         ordering = ["created_at"]
-        indexes = [
-            models.Index(fields=["consumed", "created_at"]),
-        ]
 
     def __str__(self) -> str:
         return f"{self.command_type} @ {self.created_at.isoformat()}"
@@ -87,3 +145,15 @@ class SimulationCommand(models.Model):
             "parameters": self.parameters or {},
         }
 
+
+class CommandConsumer(models.Model):
+    """
+    Position of a consumer in the command queue.
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    cursor = models.BigIntegerField(default=0, help_text="Id of the last command the consumer acknowledged")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.cursor}"
@@ -0,0 +1,331 @@
+"""
+Server push of the latest telemetry to the dashboards (GET /api/telemetry/stream/, SSE).
+
+The ingest views publish the points they stored to the process-wide `telemetry_hub`. The
+hub keeps the latest point per satellite, ordered by when it last changed, and a version
+counter: a connected dashboard remembers the version it has seen and gets only the
+satellites that changed since (a delta), read from the end of the ordered dict. Nothing is
+queried from the database per dashboard or per update.
+
+Under ASGI each stream is a coroutine woken up through its event loop; under WSGI
+(runserver) each stream holds a server thread that waits on a condition.
+
+The hub also indexes the latest points in a grid of GRID_CELL_DEGREES cells, so the
+viewport queries of /api/telemetry/recent/ (?bbox=) only look at the cells the box covers.
+
+Only active satellites are published: points of inactive ones are dropped, and a satellite that
+is deactivated or deleted is removed from the hub (listed in "left" of the next delta).
+
+The hub is per process: dashboards only see telemetry ingested by their server process.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import math
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from .ingest import forget_satellite, inactive_satellites
+from .snapshot import build_recent_telemetry
+
+# minimum time between two events of a stream (changes in between are sent as one delta)
+STREAM_MIN_INTERVAL = 0.2
+# a comment line is sent after this long without events, so proxies keep the connection open
+STREAM_KEEPALIVE = 15.0
+# size of the cells of the spatial index (degrees of latitude and longitude)
+GRID_CELL_DEGREES = 10.0
+GRID_ROWS = int(180 / GRID_CELL_DEGREES)
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+
+
+def _grid_row(latitude: float) -> int:
+    return min(max(int((latitude + 90) // GRID_CELL_DEGREES), 0), GRID_ROWS - 1)
+
+
+def _grid_column(longitude: float) -> int:
+    return int(((longitude + 180) % 360) // GRID_CELL_DEGREES)
+
+
+class TelemetryHub:
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.version = 0
+        # satellite -> (version, point), least recently changed first
+        self.latest: dict[str, tuple[int, dict[str, Any]]] = {}
+        # spatial index of `latest`: (row, column) -> satellites, and satellite -> its cell
+        self.cells: dict[tuple[int, int], set[str]] = {}
+        self.cell_of: dict[str, tuple[int, int]] = {}
+        # satellite -> version it was removed at (deactivated or deleted)
+        self.removed: dict[str, int] = {}
+        self.loaded = False
+        self._async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def publish(self, points: list[dict[str, Any]]) -> None:
+        """Store new points (format of /api/telemetry/recent/) and wake up the streams."""
+
+        inactive = inactive_satellites()
+        with self.condition:
+            self._load()
+            changed = self._remove(inactive & self.latest.keys())
+            for point in points:
+                name = point["satellite"]
+                if name in inactive:
+                    continue
+                previous = self.latest.pop(name, None)
+                if previous is not None and previous[1] == point:
+                    self.latest[name] = previous  # unchanged: not part of the next delta
+                    continue
+                if not changed:
+                    self.version += 1
+                    changed = True
+                self.latest[name] = (self.version, point)
+                self.removed.pop(name, None)
+                self._index(name, point)
+            if not changed:
+                return
+        self._notify()
+
+    def remove(self, names: set[str]) -> None:
+        """Drop satellites (deactivated or deleted) and wake up the streams."""
+
+        with self.condition:
+            if not self._remove(names & self.latest.keys()):
+                return
+        self._notify()
+
+    def changes_since(self, version: int) -> tuple[list[dict[str, Any]], list[str], int]:
+        """
+        Points that changed after `version` (all points for version 0), the satellites removed
+        after it, and the current version.
+        """
+
+        with self.condition:
+            self._load()
+            changed = []
+            for point_version, point in reversed(self.latest.values()):
+                if point_version <= version:
+                    break
+                changed.append(point)
+            removed = [name for name, removed_version in self.removed.items() if removed_version > version] if version else []
+            return changed[::-1], removed, self.version
+
+    def query(self, viewport: Viewport | None = None, limit: int | None = None) -> tuple[list[dict[str, Any]], int]:
+        """
+        Latest points of the active satellites inside the viewport (all of them without one), and
+        how many there are. With a limit, only the `limit` most recently changed of them are returned.
+        """
+
+        inactive = inactive_satellites()
+        with self.condition:
+            self._load()
+            # deactivated without a signal (e.g. a queryset update or another process)
+            removed = self._remove(inactive & self.latest.keys())
+            if viewport is None:
+                total = len(self.latest)
+                if limit is None or limit >= total:
+                    points = [point for _, point in self.latest.values()]
+                else:
+                    points = []
+                    for _, point in reversed(self.latest.values()):
+                        if len(points) == limit:
+                            break
+                        points.append(point)
+            else:
+                inside = []
+                for cell in viewport.cells():
+                    for name in self.cells.get(cell, ()):
+                        version, point = self.latest[name]
+                        if viewport.contains(point):
+                            inside.append((version, point))
+        if removed:
+            self._notify()
+        if viewport is None:
+            return points, total
+        total = len(inside)
+        if limit is not None and limit < total:
+            inside = heapq.nlargest(limit, inside, key=lambda item: item[0])
+        return [point for _, point in inside], total
+
+    def wait(self, version: int, timeout: float) -> None:
+        with self.condition:
+            if self.version == version:
+                self.condition.wait(timeout)
+
+    async def wait_async(self, version: int, timeout: float) -> None:
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.condition:
+            if self.version != version:
+                return
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self._async_waiters.discard(waiter)
+
+    def load(self) -> None:
+        """Load the latest points from the database if not done yet (from a sync context)."""
+
+        with self.condition:
+            self._load()
+
+    def _load(self) -> None:
+        # first use in this process: start from the database (called with the condition held)
+        if self.loaded:
+            return
+        self.loaded = True
+        self.version += 1
+        for point in build_recent_telemetry():
+            self.latest[point["satellite"]] = (self.version, point)
+            self._index(point["satellite"], point)
+
+    def _notify(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _remove(self, names: set[str]) -> bool:
+        # drop satellites from the latest points and the index (called with the condition held)
+        if not names:
+            return False
+        self.version += 1
+        for name in names:
+            del self.latest[name]
+            self.cells[self.cell_of.pop(name)].discard(name)
+            self.removed[name] = self.version
+        return True
+
+    def _index(self, name: str, point: dict[str, Any]) -> None:
+        # move the satellite to the cell of its new position (called with the condition held)
+        cell = (_grid_row(point["latitude"]), _grid_column(point["longitude"]))
+        previous = self.cell_of.get(name)
+        if previous == cell:
+            return
+        if previous is not None:
+            self.cells[previous].discard(name)
+        self.cells.setdefault(cell, set()).add(name)
+        self.cell_of[name] = cell
+
+
+telemetry_hub = TelemetryHub()
+
+
+def satellite_saved(sender: Any, instance: Any, **kwargs: Any) -> None:
+    # post_save of Satellite (e.g. deactivated in the admin)
+    forget_satellite(instance.name)
+    if not instance.active:
+        telemetry_hub.remove({instance.name})
+
+
+def satellite_deleted(sender: Any, instance: Any, **kwargs: Any) -> None:
+    # post_delete of Satellite
+    forget_satellite(instance.name)
+    telemetry_hub.remove({instance.name})
+
+
+class Viewport:
+    """
+    Longitude/latitude box of a dashboard. min_lon > max_lon means the box crosses the antimeridian.
+    """
+
+    def __init__(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> None:
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = min_lon, min_lat, max_lon, max_lat
+
+    @classmethod
+    def parse(cls, bbox: str) -> Viewport:
+        """From "min_lon,min_lat,max_lon,max_lat", ValueError if invalid."""
+
+        values = [float(value) for value in bbox.split(",")]
+        if len(values) != 4 or not all(math.isfinite(value) for value in values) or values[1] > values[3]:
+            raise ValueError(bbox)
+        return cls(*values)
+
+    def cells(self) -> Iterator[tuple[int, int]]:
+        """Cells of the hub's grid the viewport overlaps (and possibly a few more)."""
+
+        span = self.max_lon - self.min_lon if self.min_lon <= self.max_lon else self.max_lon - self.min_lon + 360
+        if span >= 360 - GRID_CELL_DEGREES:
+            columns = range(GRID_COLUMNS)
+        else:
+            first = _grid_column(self.min_lon)
+            columns = [(first + i) % GRID_COLUMNS for i in range(int(span // GRID_CELL_DEGREES) + 2)]
+        for row in range(_grid_row(self.min_lat), _grid_row(self.max_lat) + 1):
+            for column in columns:
+                yield row, column
+
+    def contains(self, point: dict[str, Any]) -> bool:
+        lon, lat = point["longitude"], point["latitude"]
+        if not self.min_lat <= lat <= self.max_lat:
+            return False
+        if self.min_lon <= self.max_lon:
+            return self.min_lon <= lon <= self.max_lon
+        return lon >= self.min_lon or lon <= self.max_lon
+
+
+class TelemetryStream:
+    """
+    Events of one dashboard: a "snapshot" event with all satellites first, then "delta" events
+    with the satellites that changed, at most one per `min_interval` seconds. Satellites removed from
+    the hub are listed in "left". With a viewport, only satellites inside it are sent, and satellites
+    that moved out are listed in "left" as well.
+    """
+
+    def __init__(self, hub: TelemetryHub, viewport: Viewport | None = None, min_interval: float = STREAM_MIN_INTERVAL) -> None:
+        self.hub = hub
+        self.viewport = viewport
+        self.min_interval = min_interval
+        self.version = 0
+        self.visible: set[str] = set()  # satellites the dashboard has (with a viewport)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            event = self._next_event()
+            if event:
+                yield event
+                time.sleep(self.min_interval)
+            self.hub.wait(self.version, STREAM_KEEPALIVE)
+            if self.hub.version == self.version:
+                yield b": keep-alive\n\n"
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            event = self._next_event()
+            if event:
+                yield event
+                await asyncio.sleep(self.min_interval)
+            await self.hub.wait_async(self.version, STREAM_KEEPALIVE)
+            if self.hub.version == self.version:
+                yield b": keep-alive\n\n"
+
+    def _next_event(self) -> bytes | None:
+        kind = "delta" if self.version else "snapshot"
+        points, removed, self.version = self.hub.changes_since(self.version)
+        left: list[str] = []
+        if self.viewport is None:
+            left = removed
+        else:
+            for name in removed:
+                if name in self.visible:
+                    self.visible.discard(name)
+                    left.append(name)
+            inside = []
+            for point in points:
+                if self.viewport.contains(point):
+                    inside.append(point)
+                    self.visible.add(point["satellite"])
+                elif point["satellite"] in self.visible:
+                    self.visible.discard(point["satellite"])
+                    left.append(point["satellite"])
+            points = inside
+        if kind == "delta" and not points and not left:
+            return None
+        data = json.dumps({"telemetry": points, "left": left, "cursor": self.version})
+        return f"event: {kind}\ndata: {data}\n\n".encode()
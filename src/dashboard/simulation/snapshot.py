@@ -0,0 +1,110 @@
+"""
+Process cache of the /api/telemetry/recent/ response.
+
+The response is built (one query) and JSON encoded once, then served as is to every
+viewer until an ingest invalidates it, with a content hash as ETag so an unchanged
+snapshot costs a 304. The read load no longer depends on the number of open dashboards.
+
+Points buffered by the write-behind ingest (simulation.write_behind) are part of the snapshot
+before they reach the database.
+
+The cache is per process: telemetry pushed to another server process (or satellites
+changed in the admin) shows up after at most SNAPSHOT_MAX_AGE seconds.
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import threading
+import time
+from datetime import timezone as dt_timezone
+from typing import Any
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Telemetry
+from .write_behind import telemetry_buffer
+
+SNAPSHOT_MAX_AGE = 5.0
+
+
+class RecentTelemetrySnapshot:
+    def __init__(self, max_age: float = SNAPSHOT_MAX_AGE) -> None:
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self.version = 0  # bumped by invalidate()
+        self.built_version = -1
+        self.built_at = 0.0
+        self.body = b""
+        self.etag = ""
+
+    def invalidate(self) -> None:
+        # no lock: called by the ingest, which shouldn't wait for a rebuild
+        self.version = next(self._versions)
+
+    def get(self) -> tuple[bytes, str]:
+        """Encoded response body and its ETag, rebuilt if invalidated or older than max_age."""
+
+        with self.lock:
+            if self.built_version != self.version or time.monotonic() - self.built_at >= self.max_age:
+                # an invalidation during the build leaves the snapshot stale for the next request
+                self.built_version = self.version
+                self.body = json.dumps({"telemetry": build_recent_telemetry()}, cls=DjangoJSONEncoder).encode()
+                self.etag = content_etag(self.body)
+                self.built_at = time.monotonic()
+            return self.body, self.etag
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def recent_point(point: dict[str, Any]) -> dict[str, Any]:
+    """Parsed ingest point in the format of /api/telemetry/recent/."""
+
+    return {
+        "satellite": point["satellite"],
+        "timestamp": point["timestamp"].astimezone(dt_timezone.utc).isoformat(),
+        "latitude": point["latitude"],
+        "longitude": point["longitude"],
+        "altitude": point["altitude"],
+        "extra": point["extra"],
+    }
+
+
+def build_recent_telemetry() -> list[dict[str, Any]]:
+    """Latest telemetry of each active satellite (ordered by satellite, not yet stored ones last)."""
+
+    rows = Telemetry.objects.order_by("satellite_id").values_list(
+        "satellite__name", "satellite__active", "timestamp", "latitude", "longitude", "altitude", "extra"
+    )
+    if telemetry_buffer is None:
+        rows = rows.filter(satellite__active=True)
+    buffered = telemetry_buffer.overlay() if telemetry_buffer is not None else {}
+
+    telemetry = []
+    for name, active, timestamp, latitude, longitude, altitude, extra in rows:
+        point = buffered.pop(name, None)
+        if not active:
+            continue
+        if point is not None:
+            telemetry.append(recent_point(point))
+            continue
+        telemetry.append(
+            {
+                "satellite": name,
+                "timestamp": timestamp.isoformat(),
+                "latitude": latitude,
+                "longitude": longitude,
+                "altitude": altitude,
+                "extra": extra,
+            }
+        )
+    # satellites whose first point is still buffered
+    telemetry.extend(recent_point(point) for point in buffered.values())
+    return telemetry
+
+
+recent_telemetry = RecentTelemetrySnapshot()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from . import history
+from .models import Satellite
+from .write_behind import WriteBehindBuffer
+
+
+class HistoryQueryTests(TestCase):
+    def setUp(self) -> None:
+        self.satellite = Satellite.objects.create(name="SAT-1")
+
+    def _record(self, start, seconds: int, step: int = 10) -> None:
+        history.record(
+            (
+                self.satellite.id,
+                {
+                    "timestamp": start + timedelta(seconds=offset),
+                    "latitude": 1.0,
+                    "longitude": 2.0,
+                    "altitude": 500.0,
+                },
+            )
+            for offset in range(0, seconds, step)
+        )
+
+    def test_recent_range_is_read_from_raw_points(self) -> None:
+        start = timezone.now() - timedelta(hours=1)
+        self._record(start, 1800)
+
+        resolution, points = history.query(self.satellite.id, start, start + timedelta(minutes=30))
+
+        self.assertEqual(resolution, 0)
+        self.assertEqual(len(points), 180)
+
+    def test_range_older_than_raw_retention_is_read_from_rollup(self) -> None:
+        # older than the raw retention (1 day), within the one of the 1 s rollup (7 days)
+        start = timezone.now() - timedelta(days=3)
+        self._record(start, 1800)
+
+        resolution, points = history.query(self.satellite.id, start, start + timedelta(minutes=30))
+
+        self.assertEqual(resolution, 1)
+        self.assertEqual(len(points), 180)
+
+    def test_range_older_than_fine_rollups_is_read_from_coarser_rollup(self) -> None:
+        # only the 60 s (90 days) and 600 s (365 days) rollups are kept that long
+        # aligned to the 60 s buckets, so the 30 minutes are 30 buckets
+        start = (timezone.now() - timedelta(days=30)).replace(second=0, microsecond=0)
+        self._record(start, 1800)
+
+        resolution, points = history.query(self.satellite.id, start, start + timedelta(minutes=30))
+
+        self.assertEqual(resolution, 60)
+        self.assertEqual(len(points), 30)
+
+
+class WriteBehindFlushTests(TestCase):
+    def test_failed_flush_keeps_points_whatever_the_error(self) -> None:
+        buffer = WriteBehindBuffer(interval=60, max_points=100)
+        buffer.pending = [{"satellite": "SAT-1"}]
+        buffer.pending_latest = {"SAT-1": buffer.pending[0]}
+        buffer.pending_since = 0.0
+
+        with mock.patch("simulation.write_behind.store_points", side_effect=ValueError("bad point")):
+            with self.assertLogs("simulation.write_behind", "ERROR"):
+                self.assertFalse(buffer.flush())
+                buffer._tick()  # the background thread's iteration doesn't raise either
+
+        self.assertEqual(buffer.pending, [{"satellite": "SAT-1"}])
+        self.assertEqual(buffer.flushing, {})
+        self.assertEqual(buffer.flushing_points, 0)
+        self.assertTrue(buffer.failing)
+        self.assertEqual(buffer.failed_flushes, 2)
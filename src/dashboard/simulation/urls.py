@@ -5,7 +5,13 @@ from . import views
 
 urlpatterns = [
     path("telemetry/", views.telemetry_ingest, name="telemetry-ingest"),
+    path("telemetry/bulk/", views.telemetry_bulk_ingest, name="telemetry-bulk-ingest"),
     path("telemetry/recent/", views.telemetry_recent, name="telemetry-recent"),
+    path("telemetry/buffer/", views.telemetry_buffer_stats, name="telemetry-buffer"),
+    path("telemetry/stream/", views.telemetry_stream, name="telemetry-stream"),
+    path("telemetry/history/", views.telemetry_history, name="telemetry-history"),
     path("commands/", views.commands, name="commands"),
+    path("commands/poll/", views.commands_poll, name="commands-poll"),
+    path("commands/ack/", views.commands_ack, name="commands-ack"),
 ]
 
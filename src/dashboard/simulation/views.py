@@ -1,20 +1,182 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import Any
 
-from django.http import HttpRequest, JsonResponse, HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    HttpResponseBadRequest,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 
+from . import columnar, command_queue, history
+from .ingest import TELEMETRY_FIELDS, store_points
 from .models import Satellite, Telemetry, SimulationCommand
+from .push import TelemetryStream, Viewport, telemetry_hub
+from .snapshot import content_etag, recent_point, recent_telemetry
+from .write_behind import BufferFull, telemetry_buffer
+
+
+# Long polling of /api/commands/poll/: how long a request may wait for a new command, and how often a
+# waiting request re-checks the database (commands posted through another server process don't wake it up)
+COMMAND_POLL_DEFAULT_TIMEOUT = 25.0
+COMMAND_POLL_MAX_TIMEOUT = 60.0
+COMMAND_POLL_RECHECK_INTERVAL = 1.0
+# largest number of points accepted by one bulk telemetry request
+TELEMETRY_BULK_MAX_POINTS = 100_000
+
+
+class _CommandSignal:
+    """
+    Wakes up the long-poll requests of this process when a command is posted.
+
+    The generation counter is read before the database is queried, so a command posted between the
+    query and the wait is not missed. The long-poll requests are coroutines, each waiting on an
+    asyncio event of its event loop.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.generation = 0
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def notify(self) -> None:
+        with self.lock:
+            self.generation += 1
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, generation: int, timeout: float) -> None:
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.lock:
+            if self.generation != generation:
+                return
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                self._waiters.discard(waiter)
+
+
+_command_signal = _CommandSignal()
 
 
 def _json_error(message: str, status: int = 400) -> JsonResponse:
     return JsonResponse({"error": message}, status=status)
 
 
+def _buffer_full_error() -> JsonResponse:
+    response = _json_error("Telemetry buffer is full, the database is not available", status=503)
+    response["Retry-After"] = "1"
+    return response
+
+
+def _parse_telemetry_point(payload: Any) -> tuple[dict[str, Any] | None, str | None]:
+    """
+    Validate one telemetry point (see telemetry_ingest for the format).
+
+    Returns (point, None) with the satellite name and the Telemetry fields, or (None, error message).
+    """
+
+    if not isinstance(payload, dict):
+        return None, "Expected a JSON object"
+
+    sat_name = payload.get("satellite")
+    if not sat_name:
+        return None, "Missing 'satellite' field"
+
+    timestamp_str = payload.get("timestamp")
+    if not timestamp_str:
+        return None, "Missing 'timestamp' field"
+
+    try:
+        timestamp: datetime | None = parse_datetime(timestamp_str)
+    except (TypeError, ValueError):
+        timestamp = None
+    if timestamp is None:
+        return None, "Invalid 'timestamp' format, expected ISO-8601"
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+
+    try:
+        latitude = float(payload["latitude"])
+        longitude = float(payload["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None, "Invalid or missing 'latitude'/'longitude'"
+
+    altitude = payload.get("altitude")
+    try:
+        altitude_val = float(altitude) if altitude is not None else None
+    except (TypeError, ValueError):
+        return None, "Invalid 'altitude'"
+
+    return {
+        "satellite": str(sat_name),
+        "timestamp": timestamp,
+        "latitude": latitude,
+        "longitude": longitude,
+        "altitude": altitude_val,
+        "extra": payload.get("extra") or None,
+    }, None
+
+
+def _query_datetime(request: HttpRequest, name: str) -> datetime | None:
+    """Optional ISO-8601 query parameter (UTC if it has no offset), ValueError if it is invalid."""
+
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid '{name}'")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _read_telemetry_points(request: HttpRequest) -> tuple[list[Any] | None, str | None]:
+    """Items of a bulk ingest body: a JSON array, or one JSON object per line for application/x-ndjson."""
+
+    body = request.body.decode("utf-8")
+    if request.content_type == "application/x-ndjson":
+        items: list[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(None)  # reported as invalid item, the other lines are still ingested
+        return items, None
+
+    try:
+        items = json.loads(body)
+    except json.JSONDecodeError:
+        return None, "Invalid JSON payload"
+    if not isinstance(items, list):
+        return None, "Expected a JSON array of telemetry points"
+    return items, None
+
+
 @csrf_exempt
 def telemetry_ingest(request: HttpRequest) -> JsonResponse:
     """
@@ -29,6 +191,10 @@ def telemetry_ingest(request: HttpRequest) -> JsonResponse:
       "altitude": float?,          # km
       "extra": {...}?              # optional telemetry payload
     }
+
+    With the write-behind buffer enabled (see simulation.write_behind) the point is stored later,
+    the response is 202 {"satellite": ..., "timestamp": ..., "buffered": true}, or 503 if the
+    buffer is full because the database is not available.
     """
 
     if request.method != "POST":
@@ -39,44 +205,35 @@ def telemetry_ingest(request: HttpRequest) -> JsonResponse:
     except json.JSONDecodeError:
         return _json_error("Invalid JSON payload")
 
-    sat_name = payload.get("satellite")
-    if not sat_name:
-        return _json_error("Missing 'satellite' field")
-
-    timestamp_str = payload.get("timestamp")
-    if not timestamp_str:
-        return _json_error("Missing 'timestamp' field")
-
-    timestamp: datetime | None = parse_datetime(timestamp_str)
-    if timestamp is None:
-        return _json_error("Invalid 'timestamp' format, expected ISO-8601")
-
-    try:
-        latitude = float(payload["latitude"])
-        longitude = float(payload["longitude"])
-    except (KeyError, TypeError, ValueError):
-        return _json_error("Invalid or missing 'latitude'/'longitude'")
-
-    altitude = payload.get("altitude")
-    try:
-        altitude_val = float(altitude) if altitude is not None else None
-    except (TypeError, ValueError):
-        return _json_error("Invalid 'altitude'")
-
-    satellite, _ = Satellite.objects.get_or_create(name=sat_name)
-
-    # Update or create the latest telemetry record for this satellite
-    # This ensures we only store the most recently pushed position
-    telemetry, created = Telemetry.objects.update_or_create(
-        satellite=satellite,
-        defaults={
-            "timestamp": timestamp,
-            "latitude": latitude,
-            "longitude": longitude,
-            "altitude": altitude_val,
-            "extra": payload.get("extra") or None,
-        },
-    )
+    point, error = _parse_telemetry_point(payload)
+    if error is not None:
+        return _json_error(error)
+
+    if telemetry_buffer is not None:
+        try:
+            telemetry_buffer.submit([point])
+        except BufferFull:
+            return _buffer_full_error()
+        recent_telemetry.invalidate()
+        telemetry_hub.publish([recent_point(point)])
+        return JsonResponse(
+            {"satellite": point["satellite"], "timestamp": point["timestamp"].isoformat(), "buffered": True},
+            status=202,
+        )
+
+    with transaction.atomic():
+        satellite, _ = Satellite.objects.get_or_create(name=point["satellite"])
+
+        # Update or create the latest telemetry record for this satellite
+        # This ensures we only store the most recently pushed position
+        telemetry, created = Telemetry.objects.update_or_create(
+            satellite=satellite,
+            defaults={field: point[field] for field in TELEMETRY_FIELDS},
+        )
+        history.record([(satellite.id, point)])
+    recent_telemetry.invalidate()
+    telemetry_hub.publish([recent_point(point)])
+    history.maybe_prune()
 
     return JsonResponse(
         {
@@ -89,54 +246,248 @@ def telemetry_ingest(request: HttpRequest) -> JsonResponse:
     )
 
 
-def telemetry_recent(request: HttpRequest) -> JsonResponse:
+@csrf_exempt
+def telemetry_bulk_ingest(request: HttpRequest) -> JsonResponse:
+    """
+    POST /api/telemetry/bulk/
+
+    Many telemetry points (any number of satellites) in one request: a JSON array of points in the
+    format of POST /api/telemetry/, or with Content-Type application/x-ndjson one point per line.
+    Invalid points are reported and skipped, the valid ones are written in one transaction (one
+    upsert for all satellites), or buffered if the write-behind buffer is enabled (503 if the
+    buffer is full because the database is not available). If a satellite appears more than
+    once, its last point is kept as its latest telemetry.
+
+    Response:
+    {
+      "accepted": 2,
+      "rejected": 1,
+      "results": [{"status": "ok"}, {"status": "error", "error": "..."}, {"status": "ok"}]
+    }
     """
-    GET /api/telemetry/recent/
+
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        items, error = _read_telemetry_points(request)
+    except UnicodeDecodeError:
+        items, error = None, "Invalid JSON payload"
+    if error is not None:
+        return _json_error(error)
+    if len(items) > TELEMETRY_BULK_MAX_POINTS:
+        return _json_error(f"At most {TELEMETRY_BULK_MAX_POINTS} points per request", status=413)
+
+    results: list[dict[str, str]] = []
+    points: list[dict[str, Any]] = []
+    latest: dict[str, dict[str, Any]] = {}  # satellite -> last valid point
+    for item in items:
+        point, error = _parse_telemetry_point(item) if item is not None else (None, "Invalid JSON")
+        if error is not None:
+            results.append({"status": "error", "error": error})
+            continue
+        results.append({"status": "ok"})
+        points.append(point)
+        latest[point["satellite"]] = point
+
+    if points:
+        if telemetry_buffer is not None:
+            try:
+                telemetry_buffer.submit(points)
+            except BufferFull:
+                return _buffer_full_error()
+        else:
+            store_points(points)
+            history.maybe_prune()
+        recent_telemetry.invalidate()
+        telemetry_hub.publish([recent_point(point) for point in latest.values()])
+
+    accepted = sum(result["status"] == "ok" for result in results)
+    return JsonResponse({"accepted": accepted, "rejected": len(results) - accepted, "results": results})
+
+
+def telemetry_recent(request: HttpRequest) -> HttpResponse:
+    """
+    GET /api/telemetry/recent/?bbox=<min_lon>,<min_lat>,<max_lon>,<max_lat>&limit=<n>&format=json|columns|binary
 
     Returns the latest telemetry for each active satellite (most recently pushed, by updated_at).
+    Without parameters it is served from a process cache (see simulation.snapshot).
+
+    With `bbox` only the satellites inside the box are returned (min_lon > max_lon: the box
+    crosses the antimeridian), with `limit` at most that many (the most recently updated ones),
+    both answered from the spatial index of the telemetry hub (see simulation.push), so the cost
+    depends on the number of returned satellites, not on the size of the constellation.
+    `format=columns` or `format=binary` return the compact encodings of simulation.columnar;
+    the JSON format then also has "total", the number of satellites before the limit.
+
+    All responses carry an ETag; a request with a matching If-None-Match gets 304 Not Modified.
     """
 
     if request.method != "GET":
         return _json_error("Method not allowed", status=405)
 
-    latest_points: list[dict[str, Any]] = []
-    satellites = Satellite.objects.filter(active=True).select_related("latest_telemetry")
-    
-    for sat in satellites:
-        # Use OneToOne relationship - each satellite has exactly one latest_telemetry record
-        # Check if telemetry exists using hasattr or try/except
-        if hasattr(sat, "latest_telemetry"):
-            latest = sat.latest_telemetry
-            latest_points.append(
-                {
-                    "satellite": sat.name,
-                    "timestamp": latest.timestamp.isoformat(),
-                    "latitude": latest.latitude,
-                    "longitude": latest.longitude,
-                    "altitude": latest.altitude,
-                    "extra": latest.extra,
-                }
-            )
-
-    return JsonResponse({"telemetry": latest_points})
+    if not {"bbox", "limit", "format"} & request.GET.keys():
+        body, etag = recent_telemetry.get()
+        content_type = "application/json"
+    else:
+        viewport = None
+        if "bbox" in request.GET:
+            try:
+                viewport = Viewport.parse(request.GET["bbox"])
+            except ValueError:
+                return _json_error("'bbox' must be min_lon,min_lat,max_lon,max_lat")
+        limit = None
+        if "limit" in request.GET:
+            try:
+                limit = int(request.GET["limit"])
+                if limit <= 0:
+                    raise ValueError
+            except ValueError:
+                return _json_error("'limit' must be a positive integer")
+        output = request.GET.get("format", "json")
+        if output not in ("json", "columns", "binary"):
+            return _json_error("'format' must be json, columns or binary")
+
+        points, total = telemetry_hub.query(viewport, limit)
+        if output == "binary":
+            body, content_type = columnar.to_binary(points, total), "application/octet-stream"
+        else:
+            data = columnar.to_columns(points, total) if output == "columns" else {"telemetry": points, "total": total}
+            body, content_type = json.dumps(data).encode(), "application/json"
+        etag = content_etag(body)
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == "*"):
+        response: HttpResponse = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"  # browsers revalidate every poll
+    return response
+
+
+def telemetry_buffer_stats(request: HttpRequest) -> JsonResponse:
+    """
+    GET /api/telemetry/buffer/
+
+    State of the write-behind buffer of this process: buffered points, age of the oldest one,
+    flush count and latencies, largest observed staleness (time from buffering a point to its
+    commit), all durations in milliseconds. {"enabled": false} if the buffer is disabled.
+    """
+
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+    if telemetry_buffer is None:
+        return JsonResponse({"enabled": False})
+    return JsonResponse(telemetry_buffer.stats())
+
+
+def telemetry_stream(request: HttpRequest) -> HttpResponse:
+    """
+    GET /api/telemetry/stream/?bbox=<min_lon>,<min_lat>,<max_lon>,<max_lat>
+
+    Server-sent events with the latest telemetry (see simulation.push): first a "snapshot" event
+    with all satellites, then "delta" events with only the satellites that changed, as they are
+    ingested. With `bbox` only the satellites inside the box are sent, satellites that moved out
+    are listed in "left" (min_lon > max_lon: the box crosses the antimeridian).
+
+    event: delta
+    data: {"telemetry": [{"satellite": "SAT-1", ...}], "left": ["SAT-7"], "cursor": 42}
+    """
+
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    viewport = None
+    if "bbox" in request.GET:
+        try:
+            viewport = Viewport.parse(request.GET["bbox"])
+        except ValueError:
+            return _json_error("'bbox' must be min_lon,min_lat,max_lon,max_lat")
+
+    telemetry_hub.load()  # queries the database on first use: not possible from the async stream
+    stream = TelemetryStream(telemetry_hub, viewport)
+    # under ASGI the stream runs as a coroutine, under WSGI it holds a server thread
+    content = stream.__aiter__() if isinstance(request, ASGIRequest) else iter(stream)
+    response = StreamingHttpResponse(content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # no buffering in nginx
+    return response
+
+
+def telemetry_history(request: HttpRequest) -> JsonResponse:
+    """
+    GET /api/telemetry/history/?satellite=<name>&start=<ISO-8601>&end=<ISO-8601>&max_points=<n>
+
+    Track of a satellite between start and end (simulation time, default: the 24 h before its
+    latest point). Returns the raw points if there are at most `max_points` (default 2000) of
+    them, otherwise the points of the finest rollup that fits; `resolution` is the bucket size
+    in seconds (0 for raw points).
+
+    {
+      "satellite": "SAT-1",
+      "resolution": 60,
+      "points": [{"timestamp": "...", "latitude": 40.0, "longitude": -75.0, "altitude": 500.0}, ...]
+    }
+    """
+
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    sat_name = request.GET.get("satellite")
+    if not sat_name:
+        return _json_error("Missing 'satellite' parameter")
+    satellite = Satellite.objects.filter(name=sat_name).select_related("latest_telemetry").first()
+    if satellite is None:
+        return _json_error(f"Unknown satellite '{sat_name}'", status=404)
+
+    try:
+        end = _query_datetime(request, "end")
+        start = _query_datetime(request, "start")
+    except ValueError:
+        return _json_error("Invalid 'start'/'end', expected ISO-8601")
+    if end is None:
+        if not hasattr(satellite, "latest_telemetry"):
+            return JsonResponse({"satellite": satellite.name, "resolution": 0, "points": []})
+        end = satellite.latest_telemetry.timestamp
+    if start is None:
+        start = end - timedelta(hours=24)
+    if start > end:
+        return _json_error("'start' must be before 'end'")
+
+    try:
+        max_points = int(request.GET.get("max_points", history.DEFAULT_MAX_POINTS))
+        if max_points <= 0:
+            raise ValueError
+    except ValueError:
+        return _json_error("'max_points' must be a positive integer")
+
+    resolution, points = history.query(satellite.id, start, end, max_points)
+    return JsonResponse(
+        {
+            "satellite": satellite.name,
+            "resolution": resolution,
+            "points": [
+                {"timestamp": timestamp.isoformat(), "latitude": latitude, "longitude": longitude, "altitude": altitude}
+                for timestamp, latitude, longitude, altitude in points
+            ],
+        }
+    )
 
 
 @csrf_exempt
 def commands(request: HttpRequest) -> JsonResponse:
     """
-    GET /api/commands/  -> simulator polls to fetch all unconsumed commands (in order)
+    GET /api/commands/?consumer=<name>  -> simulator polls to fetch all new commands (in order)
     POST /api/commands/ -> dashboard adds a command to the queue
+
+    GET claims the commands after the consumer's cursor (default consumer: "simulator") and
+    acknowledges them in the same step, see simulation.command_queue.
     """
 
     if request.method == "GET":
-        # Return all unconsumed commands in order, then mark them as consumed
-        unconsumed = SimulationCommand.objects.filter(consumed=False).order_by("created_at")
-        commands_list = [cmd.to_dict() for cmd in unconsumed]
-        
-        # Mark commands as consumed
-        unconsumed.update(consumed=True)
-        
-        return JsonResponse({"commands": commands_list})
+        claimed = command_queue.claim(request.GET.get("consumer", command_queue.DEFAULT_CONSUMER))
+        return JsonResponse({"commands": [{"id": cmd.id, **cmd.to_dict()} for cmd in claimed]})
 
     if request.method != "POST":
         return _json_error("Method not allowed", status=405)
@@ -218,6 +569,8 @@ def commands(request: HttpRequest) -> JsonResponse:
         command_type=command_type,
         parameters=parameters,
     )
+    _command_signal.notify()
+    command_queue.maybe_compact()
 
     return JsonResponse(
         {
@@ -229,3 +582,80 @@ def commands(request: HttpRequest) -> JsonResponse:
         status=201,
     )
 
+
+
+async def commands_poll(request: HttpRequest) -> JsonResponse:
+    """
+    GET /api/commands/poll/?after=<id>&timeout=<seconds>&consumer=<name>
+
+    Long-poll variant of GET /api/commands/ for the simulator: returns the commands with an id greater
+    than `after` (in order) as soon as there are any, or an empty list once `timeout` seconds
+    (default 25, at most 60) have passed. The response carries the cursor for the next request:
+
+    {"commands": [{"id": 3, "command": "start", "parameters": {...}}, ...], "cursor": 3}
+
+    `after` acknowledges the commands up to it for the consumer (default "simulator"); without
+    `after`, the poll starts at the consumer's acknowledged cursor, so commands issued while the
+    simulator was not connected are not lost.
+
+    An async view: a waiting poll holds no server thread, under ASGI it doesn't block the sync
+    views either. The database queries run in the thread pool (not the thread of the sync views).
+    """
+
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        after = int(request.GET["after"]) if "after" in request.GET else None
+        timeout = float(request.GET.get("timeout", COMMAND_POLL_DEFAULT_TIMEOUT))
+    except ValueError:
+        return _json_error("'after' must be an integer and 'timeout' a number")
+    timeout = min(max(timeout, 0.0), COMMAND_POLL_MAX_TIMEOUT)
+
+    consumer = request.GET.get("consumer", command_queue.DEFAULT_CONSUMER)
+    if after is None:
+        after = (await sync_to_async(command_queue.get_consumer, thread_sensitive=False)(consumer)).cursor
+    else:
+        await sync_to_async(command_queue.acknowledge, thread_sensitive=False)(after, consumer)
+
+    pending_after = sync_to_async(command_queue.pending, thread_sensitive=False)
+    deadline = time.monotonic() + timeout
+    while True:
+        generation = _command_signal.generation
+        pending = await pending_after(after)
+        remaining = deadline - time.monotonic()
+        if pending or remaining <= 0:
+            break
+        await _command_signal.wait(generation, min(remaining, COMMAND_POLL_RECHECK_INTERVAL))
+
+    if pending:
+        after = pending[-1].id
+    return JsonResponse({"commands": [{"id": cmd.id, **cmd.to_dict()} for cmd in pending], "cursor": after})
+
+
+@csrf_exempt
+def commands_ack(request: HttpRequest) -> JsonResponse:
+    """
+    POST /api/commands/ack/
+
+    {"cursor": 42, "consumer": "simulator"?}
+
+    Acknowledges the commands up to id `cursor` for the consumer (the cursor never moves back).
+    Returns the consumer's cursor.
+    """
+
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        payload: dict[str, Any] = json.loads(request.body.decode("utf-8"))
+    except json.JSONDecodeError:
+        return _json_error("Invalid JSON payload")
+
+    try:
+        cursor = int(payload["cursor"])
+    except (KeyError, TypeError, ValueError):
+        return _json_error("Invalid or missing 'cursor'")
+    consumer = str(payload.get("consumer") or command_queue.DEFAULT_CONSUMER)
+
+    return JsonResponse({"consumer": consumer, "cursor": command_queue.acknowledge(cursor, consumer)})
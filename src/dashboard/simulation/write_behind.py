@@ -0,0 +1,198 @@
+"""
+Optional write-behind buffer for the telemetry ingest (settings.TELEMETRY_WRITE_BEHIND_INTERVAL_MS).
+
+With the buffer, the ingest views don't write to the database: they add the points to
+`telemetry_buffer` and return. A background thread writes everything buffered in one
+transaction (see ingest.store_points) every interval, so the number of commits no longer
+grows with the ingest rate - a point overwritten before the flush only costs a history row.
+
+- Reads see buffered points immediately: /api/telemetry/recent/ and the stream overlay the
+  latest buffered point of each satellite on the database (the history endpoint sees points
+  once they are flushed).
+- Bounded staleness: a point is committed at most one interval (or one flush, if a flush takes
+  longer than the interval) plus the duration of its own flush after it was ingested.
+  A failed flush (whatever the error) keeps its points buffered and is retried at the next
+  interval; the background thread survives any error and logs it.
+- Bounded memory: an ingest that would buffer more than max_points points flushes the buffer
+  itself, which slows down the ingest instead of growing the buffer. While flushes fail (the
+  database is down), such points are refused instead (BufferFull, the views answer 503) until
+  the background thread manages to flush again.
+- The buffer is flushed on a normal shutdown of the process (atexit). A killed process loses
+  at most the buffered points.
+
+The buffer is per process, like the snapshot and the hub: other server processes see the
+points once they are flushed.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from django.conf import settings
+from django.db import connection
+
+from . import history
+from .ingest import store_points
+
+logger = logging.getLogger(__name__)
+
+# number of recent flushes the latency percentiles are computed from
+FLUSH_LATENCY_WINDOW = 1000
+
+
+class BufferFull(Exception):
+    """The buffer holds max_points points and can't be flushed."""
+
+
+class WriteBehindBuffer:
+    def __init__(self, interval: float, max_points: int) -> None:
+        self.interval = interval
+        self.max_points = max_points
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # one flush at a time
+        self.pending: list[dict[str, Any]] = []  # parsed points, oldest first
+        self.pending_latest: dict[str, dict[str, Any]] = {}  # satellite -> last pending point
+        self.pending_since: float | None = None  # when the oldest pending point was buffered
+        self.flushing: dict[str, dict[str, Any]] = {}  # latest points of the flush in progress
+        self.flushing_since: float | None = None
+        self.flushing_points = 0  # number of points of the flush in progress
+        self.failing = False  # the last flush failed
+        self.thread: threading.Thread | None = None
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_points = 0
+        self.rejected_points = 0
+        self.max_staleness = 0.0
+        self.latencies: deque[float] = deque(maxlen=FLUSH_LATENCY_WINDOW)
+
+    def submit(self, points: list[dict[str, Any]]) -> None:
+        """
+        Buffer parsed points (oldest first), see views._parse_telemetry_point. Raises BufferFull
+        if they don't fit into max_points and the buffered points can't be flushed.
+        """
+
+        with self.lock:
+            if self.thread is None:
+                self._start()
+            full = len(self.pending) + self.flushing_points + len(points) > self.max_points
+            failing = self.failing
+        # while the database fails, only the background thread retries (no flush per request)
+        if full and (failing or not self.flush()):
+            with self.lock:
+                self.rejected_points += len(points)
+            raise BufferFull(f"{self.max_points} telemetry points buffered, flushing failed")
+        with self.lock:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.extend(points)
+            for point in points:
+                self.pending_latest[point["satellite"]] = point
+
+    def overlay(self) -> dict[str, dict[str, Any]]:
+        """Latest buffered (not yet committed) point of each satellite."""
+
+        with self.lock:
+            return {**self.flushing, **self.pending_latest}
+
+    def flush(self) -> bool:
+        """Write the buffered points in one transaction. False if that failed (the points stay buffered)."""
+
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return True
+                points, latest, since = self.pending, self.pending_latest, self.pending_since
+                self.pending, self.pending_latest, self.pending_since = [], {}, None
+                self.flushing, self.flushing_since = latest, since
+                self.flushing_points = len(points)
+            start = time.monotonic()
+            try:
+                store_points(points)
+            except Exception:
+                logger.exception("Flushing %d telemetry points failed, retrying in %.3f s", len(points), self.interval)
+                with self.lock:
+                    # newer points buffered during the flush win
+                    self.pending = points + self.pending
+                    self.pending_latest = {**latest, **self.pending_latest}
+                    self.pending_since = since
+                    self.flushing, self.flushing_since, self.flushing_points = {}, None, 0
+                    self.failed_flushes += 1
+                    self.failing = True
+                return False
+            end = time.monotonic()
+            with self.lock:
+                self.flushing, self.flushing_since, self.flushing_points = {}, None, 0
+                self.failing = False
+                self.flushes += 1
+                self.flushed_points += len(points)
+                self.latencies.append(end - start)
+                self.max_staleness = max(self.max_staleness, end - since)
+            return True
+
+    def stats(self) -> dict[str, Any]:
+        """Buffer size and flush latencies (milliseconds), for GET /api/telemetry/buffer/."""
+
+        with self.lock:
+            last = self.latencies[-1] if self.latencies else 0.0
+            latencies = sorted(self.latencies)
+            since = self.flushing_since if self.flushing_since is not None else self.pending_since
+            oldest = time.monotonic() - since if since is not None else 0.0
+            stats = {
+                "enabled": True,
+                "interval_ms": self.interval * 1000,
+                "pending_points": len(self.pending),
+                "pending_satellites": len(self.pending_latest),
+                "oldest_pending_ms": oldest * 1000,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "flushed_points": self.flushed_points,
+                "rejected_points": self.rejected_points,
+                "max_staleness_ms": self.max_staleness * 1000,
+            }
+        if latencies:
+            stats["flush_ms"] = {
+                "last": last * 1000,
+                "mean": sum(latencies) / len(latencies) * 1000,
+                "p50": latencies[len(latencies) // 2] * 1000,
+                "p95": latencies[int(len(latencies) * 0.95)] * 1000,
+                "max": latencies[-1] * 1000,
+            }
+        return stats
+
+    def _start(self) -> None:
+        # first submit in this process (called with the lock held)
+        self.thread = threading.Thread(target=self._run, name="telemetry-write-behind", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        started = time.monotonic()
+        while True:
+            # flushes start every interval (right after the previous one if it took longer)
+            time.sleep(max(0.0, started + self.interval - time.monotonic()))
+            started = time.monotonic()
+            try:
+                self._tick()
+            except Exception:
+                # whatever happens, the thread keeps flushing (requests only flush a full buffer)
+                logger.exception("Telemetry write-behind failed, retrying in %.3f s", self.interval)
+
+    def _tick(self) -> None:
+        if not self.flush():
+            connection.close()  # the next flush reconnects
+            return
+        try:
+            history.maybe_prune()
+        except Exception:
+            logger.exception("Pruning the telemetry history failed")
+            connection.close()
+
+
+_interval_ms = settings.TELEMETRY_WRITE_BEHIND_INTERVAL_MS
+telemetry_buffer: WriteBehindBuffer | None = (
+    WriteBehindBuffer(_interval_ms / 1000, settings.TELEMETRY_WRITE_BEHIND_MAX_POINTS) if _interval_ms else None
+)
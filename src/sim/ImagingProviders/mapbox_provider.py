@@ -4,6 +4,7 @@ import requests
 
 import numpy as np
 EARTH_RADIUS_KM = 6371.0
+MIN_ELEVATION_DEG = 30.0  # targets below this elevation angle can not be imaged
 
 class MapboxlProvider:
 
@@ -50,7 +51,7 @@ class MapboxlProvider:
             bearing += 360
         
         # ensure elevation angle is above 30 degrees
-        if elevation_degrees < 30:
+        if elevation_degrees < MIN_ELEVATION_DEG:
             raise ValueError(f"Target location is not visible from satellite position (elevation angle: {elevation_degrees:.2f} degrees)")
         
         # get image from mapbox
@@ -0,0 +1,197 @@
+"""
+Cache of STAC search results, so consecutive images of nearly the same area don't each pay
+a search round trip.
+
+Entries are keyed by collection, date window, query and the bbox center and size quantized
+to `quantum` degrees (requests a few hundred metres apart mostly share an entry; the caller
+checks that a cached result fits its exact bbox, see get_or_search). They expire after `ttl`
+seconds, and beyond `max_entries` the least recently used entry is evicted. Every entry
+is also written to a SQLite file, so the cache survives a restart of the API; the file is
+loaded when the cache is created. Hits don't write to the file: the time an entry was last
+used (which entries are kept on a restart) is updated in memory and written in one batch every
+USED_WRITE_INTERVAL seconds or USED_WRITE_BATCH hits, and when the cache is closed.
+
+An empty search result is cached as well (the area has no image in the date window).
+Concurrent lookups of the same missing key wait for a single search instead of all
+searching (`get_or_search`).
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_QUANTUM = 0.05  # degrees, ~5 km
+# the last use of the entries hit since the last write is written to the file after this many
+# seconds or hits, whichever comes first
+USED_WRITE_INTERVAL = 60.0
+USED_WRITE_BATCH = 256
+
+
+class SearchCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, quantum=DEFAULT_QUANTUM, name="stac_search"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (created, value), least recently used first
+        self.in_flight = {}  # key -> Event set when its search is done
+        self.used = {}  # key -> last use not written to the file yet
+        self.used_written = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.db.execute("CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, created REAL, used REAL)")
+            self._load()
+            atexit.register(self.close)
+        for counter in ("hits", "misses", "expired", "evictions"):
+            metrics.gauge(f"{name}.cache_{counter}", lambda counter=counter: getattr(self, counter))
+        metrics.gauge(f"{name}.cache_entries", lambda: len(self.entries))
+
+    def key(self, collection, bbox, datetime, query=None, offset=(0, 0)):
+        """Cache key of a search; with an offset, of the same search moved by (lon, lat) cells."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        center_and_size = ((min_lon + max_lon) / 2, (min_lat + max_lat) / 2, max_lon - min_lon, max_lat - min_lat)
+        cells = [round(value / self.quantum) for value in center_and_size]
+        cells[0] += offset[0]
+        cells[1] += offset[1]
+        return json.dumps([collection, cells, datetime, query], sort_keys=True)
+
+    def neighbor_keys(self, collection, bbox, datetime, query=None):
+        """Keys of the same search moved by one cell in any direction."""
+        return [
+            self.key(collection, bbox, datetime, query, (d_lon, d_lat))
+            for d_lon in (-1, 0, 1) for d_lat in (-1, 0, 1) if d_lon or d_lat
+        ]
+
+    def get(self, key, accept=None, count=True):
+        """
+        (True, value) for a cached entry, (False, None) if there is none, it expired or
+        `accept(value)` is false.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None or (accept is not None and not accept(entry[1])):
+                self.misses += count
+                return False, None
+            value = entry[1]
+            self.entries.move_to_end(key)
+            self.hits += count
+            if self.db is not None:
+                self.used[key] = time.time()
+                if len(self.used) >= USED_WRITE_BATCH or time.monotonic() - self.used_written >= USED_WRITE_INTERVAL:
+                    self._write_used()
+            return True, value
+
+    def put(self, key, value):
+        """Store a JSON serializable value."""
+        now = time.time()
+        with self.lock:
+            self.entries[key] = (now, value)
+            self.entries.move_to_end(key)
+            if self.db is not None:
+                self.used.pop(key, None)
+                self.db.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def get_or_search(self, key, search, accept=None):
+        """
+        Cached value of `key`, or the result of `search()` (stored in the cache). A cached value
+        for which `accept(value)` is false is searched again. Only the lookups that search count
+        as misses, the ones that waited for another thread's search count as hits.
+        """
+        while True:
+            found, value = self.get(key, accept, count=False)
+            with self.lock:
+                if found:
+                    self.hits += 1
+                    return value
+                event = self.in_flight.get(key)
+                if event is None:
+                    event = self.in_flight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # the same search is running in another thread: wait for it and look again
+            event.wait()
+        try:
+            value = search()
+            self.put(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+    def close(self):
+        """Write the pending last uses and close the file (also done at exit)."""
+        with self.lock:
+            if self.db is None:
+                return
+            self._write_used()
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------
+    # Helper Functions
+    # ------------------------------------
+
+    def _remove(self, key):
+        # called with the lock held
+        del self.entries[key]
+        if self.db is not None:
+            self.used.pop(key, None)
+            self.db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+
+    def _write_used(self):
+        # called with the lock held: one transaction for all the hits since the last write
+        self.used_written = time.monotonic()
+        if not self.used:
+            return
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany("UPDATE search_cache SET used = ? WHERE key = ?", [(used, key) for key, used in self.used.items()])
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        self.used.clear()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        self.db.execute("DELETE FROM search_cache WHERE created < ?", (cutoff,))
+        rows = self.db.execute(
+            "SELECT key, value, created FROM search_cache ORDER BY used DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, value, created in reversed(rows):
+            self.entries[key] = (created, json.loads(value))
+        self.db.execute(
+            "DELETE FROM search_cache WHERE key NOT IN (SELECT key FROM search_cache ORDER BY used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
@@ -1,20 +1,58 @@
 from PIL import Image
 import io
+import os
+import threading
+import time
 import matplotlib.pyplot as plt
+import pystac
 from pystac_client import Client
+from pystac_client.exceptions import APIError
 import odc.stac
+from odc.geo.xr import xr_coords
 import numpy as np
+import xarray as xr
+
+from ImagingProviders.search_cache import SearchCache
+from ImagingProviders.tile_cache import TileCache
+from metrics import metrics
+
+STAC_URL = "https://earth-search.aws.element84.com/v1"
+COLLECTION = "sentinel-2-l2a"
+SEARCH_QUERY = {"eo:cloud_cover": {"lt": 100}}
+# opening the catalog is retried this many times, waiting 1 s, 2 s, ... in between
+CLIENT_OPEN_ATTEMPTS = 3
+CLIENT_OPEN_RETRY_DELAY = 1.0
+# search results (and later other imagery caches) are kept here across restarts
+CACHE_DIR = os.environ.get("IMAGERY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fakesat"))
+# size limit of the decoded raster tiles in CACHE_DIR/tiles
+TILE_CACHE_MAX_BYTES = int(os.environ.get("IMAGERY_TILE_CACHE_MB", "2048")) * 1024 ** 2
+RESOLUTION = 10  # m, coarser bands are upsampled
+# placeholder for datetime handling: every image is searched in this window
+IMAGE_DATE_WINDOW = "2023-06-01/2023-06-30"
 
 class SentinelProvider:
 
 
-    def __init__(self):
-        self.client = Client.open("https://earth-search.aws.element84.com/v1")
+    def __init__(self, cache_dir=CACHE_DIR):
+        # the catalog is opened on the first search (see client), not when the API is imported
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.search_cache = SearchCache(os.path.join(cache_dir, "stac_search.sqlite") if cache_dir else None)
+        # without a cache directory every image is downloaded
+        self.tile_cache = TileCache(os.path.join(cache_dir, "tiles"), max_bytes=TILE_CACHE_MAX_BYTES) if cache_dir else None
+        self.search_histogram = metrics.histogram("sentinel.stac_search")
         #self.bands = ['aot', 'blue', 'coastal', 'green', 'nir', 'nir08', 'nir09', 'red', 'rededge1', 'rededge2', 'rededge3', 'scl', 'swir16', 'swir22', 'visual', 'wvp']
 
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self._open_client()
+            return self._client
+
     def get_single_image_lon_lat(self, lon, lat, datetime, data_type="png", spectral_bands=['red', 'green', 'blue'], size_km=10):
         # placeholder for datetime handling
-        datetime = "2023-06-01/2023-06-30"
+        datetime = IMAGE_DATE_WINDOW
 
         bbox = self.get_bbox_around_lon_lat(lon, lat, image_size_km=size_km)
 
@@ -28,16 +66,9 @@ class SentinelProvider:
             raise ValueError("data_type must be either 'png' or 'array'")
         
     def get_single_array_image_bbox(self, bbox, datetime, spectral_bands=['red', 'green', 'blue']):
-        search = self.client.search(
-            collections=["sentinel-2-l2a"],
-            bbox=bbox,
-            datetime=datetime,
-            query={"eo:cloud_cover": {"lt": 100}},
-            max_items=1
-        )
-
-        # Get the first item to extract metadata
-        item = next(search.items())
+        item = self.search_item(bbox, datetime)
+        if item is None:
+            raise ValueError(f"No Sentinel-2 image found for bbox {bbox} in {datetime}")
 
         metadata = {
             "id": item.id,
@@ -47,20 +78,105 @@ class SentinelProvider:
             "available_bands": list(item.assets.keys())
         }
 
+        if self.tile_cache is not None:
+            return self.load_tiled(item, bbox, spectral_bands)
+
         image_data = odc.stac.load(
             [item],
             bands=spectral_bands,
             bbox=bbox,
-            resolution=10, # Note: Coarser bands will be upsampled to 10m
+            resolution=RESOLUTION, # Note: Coarser bands will be upsampled to 10m
             chunks={"x": 2048, "y": 2048}
         ).isel(time=0)
 
         return image_data
-    
+
+    def load_tiled(self, item, bbox, spectral_bands, downloaded=None):
+        """
+        Same result as odc.stac.load(...).isel(time=0) for the bbox, assembled from the tile cache:
+        only the tiles that are not cached yet are downloaded (their size in bytes is appended to
+        the `downloaded` list if given).
+        """
+        geobox = odc.stac.output_geobox(list(odc.stac.parse_items([item])), spectral_bands, bbox=bbox, resolution=RESOLUTION)
+
+        def fetch(bands, tiles_geobox):
+            data = odc.stac.load([item], bands=bands, geobox=tiles_geobox).isel(time=0)
+            pixels = {band: data[band].values for band in bands}
+            if downloaded is not None:
+                downloaded.append(sum(array.nbytes for array in pixels.values()))
+            return pixels
+
+        pixels = self.tile_cache.read(item.id, spectral_bands, geobox, fetch)
+        image_data = xr.Dataset({band: (("y", "x"), pixels[band]) for band in spectral_bands}, coords=xr_coords(geobox))
+        return image_data.assign_coords(time=np.datetime64(item.datetime.replace(tzinfo=None), "ns"))
+
+    def search_item(self, bbox, datetime):
+        """
+        First catalog item intersecting the bbox in the date window, None if there is none.
+        Results are cached (see SearchCache): a cached item is reused for any bbox it intersects,
+        also the item of a neighboring cell, so moving along the ground track rarely searches.
+        """
+        key = self.search_cache.key(COLLECTION, bbox, datetime, SEARCH_QUERY)
+        accept = lambda item: item is None or self._bbox_intersects(item["bbox"], bbox)
+
+        def search():
+            for neighbor in self.search_cache.neighbor_keys(COLLECTION, bbox, datetime, SEARCH_QUERY):
+                found, item = self.search_cache.get(neighbor, lambda item: item is not None and accept(item), count=False)
+                if found:
+                    return item
+            return self._search(bbox, datetime)
+
+        item = self.search_cache.get_or_search(key, search, accept=accept)
+        return pystac.Item.from_dict(item) if item is not None else None
+
+    def prefetch_image(self, lon, lat, size_km=10, spectral_bands=['red', 'green', 'blue']):
+        """
+        Load the image around lon/lat into the caches (search result and raster tiles) without
+        returning it. Returns the number of bytes downloaded (decoded pixels).
+        """
+        bbox = self.get_bbox_around_lon_lat(lon, lat, image_size_km=size_km)
+        item = self.search_item(bbox, IMAGE_DATE_WINDOW)
+        if item is None or self.tile_cache is None:
+            return 0
+        downloaded = []
+        self.load_tiled(item, bbox, spectral_bands, downloaded)
+        return sum(downloaded)
+
     # ------------------------------------
     # Helper Functions
     # ------------------------------------
 
+    def _open_client(self):
+        for attempt in range(CLIENT_OPEN_ATTEMPTS):
+            try:
+                return Client.open(STAC_URL)
+            except APIError as e:
+                if attempt == CLIENT_OPEN_ATTEMPTS - 1:
+                    raise
+                delay = CLIENT_OPEN_RETRY_DELAY * 2 ** attempt
+                print(f"[SENTINEL] Opening the STAC catalog failed ({e}), retrying in {delay:.0f} s")
+                time.sleep(delay)
+
+    def _search(self, bbox, datetime):
+        # item as a dict (what the cache stores), None if the search found nothing
+        start = time.perf_counter()
+        try:
+            search = self.client.search(
+                collections=[COLLECTION],
+                bbox=bbox,
+                datetime=datetime,
+                query=SEARCH_QUERY,
+                max_items=1
+            )
+            item = next(search.items(), None)
+        finally:
+            self.search_histogram.record(time.perf_counter() - start)
+        return item.to_dict() if item is not None else None
+
+    @staticmethod
+    def _bbox_intersects(a, b):
+        return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
     def get_bbox_around_lon_lat(self, lon, lat, image_size_km=1):
         """
         Create a bounding box (min_lon, min_lat, max_lon, max_lat) 
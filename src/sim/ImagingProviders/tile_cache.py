@@ -0,0 +1,220 @@
+"""
+On-disk cache of decoded raster tiles, so repeated images of overlapping areas (e.g. along
+the ground track) are mostly local reads instead of COG downloads.
+
+The pixel grid of a source (a STAC item in its native CRS and resolution) is cut into
+`tile_size` x `tile_size` tiles at fixed positions: tile (tx, ty) of a band covers the
+pixels [ty * tile_size, (ty + 1) * tile_size) x [tx * tile_size, (tx + 1) * tile_size)
+counted from the CRS origin. Each tile of each band is stored decoded as a .npy file and
+read back memory-mapped. `read()` assembles the pixels of any grid-aligned geobox from the
+tiles and fetches only the missing ones (in one request for their bounding rectangle).
+
+The cache is bounded to `max_bytes`: the least recently used tiles are deleted first. The
+files survive a restart (the directory is scanned when the cache is created, by last use).
+Concurrent reads that miss the same tiles fetch them once.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from affine import Affine
+from odc.geo.geobox import GeoBox
+
+from metrics import metrics
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class TileCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, tile_size=DEFAULT_TILE_SIZE, name="raster_tiles"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # relative path -> size in bytes, least recently used first
+        self.size = 0
+        self.in_flight = {}  # relative path -> Event set when its fetch is done
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fetch_histogram = metrics.histogram(f"{name}.fetch")
+        os.makedirs(path, exist_ok=True)
+        self._scan()
+        for counter in ("hits", "misses", "evictions", "size"):
+            metrics.gauge(f"{name}.cache_{counter}", lambda counter=counter: getattr(self, counter))
+        metrics.gauge(f"{name}.cache_tiles", lambda: len(self.files))
+
+    def read(self, source, bands, geobox, fetch):
+        """
+        Pixels of `bands` of `source` (an id, e.g. the STAC item id) on `geobox` as {band: 2D array}.
+        `fetch(bands, geobox)` loads pixels from the source in the same format; it is called for the
+        missing tiles only. Geoboxes not aligned to the pixel grid of the source are fetched directly.
+        """
+        grid = self._grid(geobox)
+        if grid is None:
+            return fetch(bands, geobox)
+        row0, col0 = grid
+        rows, cols = geobox.shape
+        t = self.tile_size
+        tiles = [
+            (tx, ty)
+            for ty in range(row0 // t, (row0 + rows - 1) // t + 1)
+            for tx in range(col0 // t, (col0 + cols - 1) // t + 1)
+        ]
+        keys = {(band, tile): self._key(source, band, geobox, tile) for band in bands for tile in tiles}
+
+        out = {}
+        first = True
+        while True:
+            found = {}
+            for (band, tile), key in keys.items():
+                array = self._get(key)
+                if array is not None:
+                    found[band, tile] = array
+            missing = [band_tile for band_tile in keys if band_tile not in found]
+            if first:
+                self._count(len(found), len(missing))
+                first = False
+            for (band, (tx, ty)), array in found.items():
+                self._copy(out, band, geobox, array, row0, col0, ty * t, tx * t)
+            if not missing:
+                return out
+
+            with self.lock:
+                mine = [band_tile for band_tile in missing if keys[band_tile] not in self.in_flight]
+                waiting = [self.in_flight[keys[band_tile]] for band_tile in missing if keys[band_tile] in self.in_flight]
+                for band_tile in mine:
+                    self.in_flight[keys[band_tile]] = threading.Event()
+            if mine:
+                self._fetch(geobox, fetch, keys, mine, out, row0, col0)
+            # tiles another read is fetching: wait for them and read them from the cache
+            for event in waiting:
+                event.wait()
+            keys = {band_tile: keys[band_tile] for band_tile in missing if band_tile not in mine}
+            if not keys:
+                return out
+
+    def stats(self):
+        with self.lock:
+            return {"tiles": len(self.files), "bytes": self.size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    # ------------------------------------
+    # Helper Functions
+    # ------------------------------------
+
+    def _grid(self, geobox):
+        # (row, col) of the first pixel of the geobox in the pixel grid of its CRS, None if not on a grid
+        a = geobox.affine
+        if a.b != 0 or a.d != 0:
+            return None
+        col, row = a.c / a.a, a.f / a.e
+        if abs(col - round(col)) > 1e-6 or abs(row - round(row)) > 1e-6:
+            return None
+        return round(row), round(col)
+
+    def _key(self, source, band, geobox, tile):
+        a = geobox.affine
+        crs = str(geobox.crs).replace(":", "_")
+        safe_source = "".join(c if c.isalnum() or c in "-_." else "_" for c in source)
+        return os.path.join(safe_source, band, f"{crs}_{a.a:g}_{a.e:g}_{tile[0]}_{tile[1]}.npy")
+
+    def _tiles_geobox(self, geobox, tiles):
+        # geobox of the bounding rectangle of the tiles (same CRS and resolution)
+        t = self.tile_size
+        tx0, tx1 = min(tx for tx, _ in tiles), max(tx for tx, _ in tiles)
+        ty0, ty1 = min(ty for _, ty in tiles), max(ty for _, ty in tiles)
+        a = geobox.affine
+        affine = Affine(a.a, 0, tx0 * t * a.a, 0, a.e, ty0 * t * a.e)
+        return GeoBox(((ty1 - ty0 + 1) * t, (tx1 - tx0 + 1) * t), affine, geobox.crs), tx0, ty0
+
+    def _fetch(self, geobox, fetch, keys, band_tiles, out, row0, col0):
+        t = self.tile_size
+        try:
+            bands = sorted({band for band, _ in band_tiles})
+            tiles_geobox, tx0, ty0 = self._tiles_geobox(geobox, {tile for _, tile in band_tiles})
+            start = time.perf_counter()
+            try:
+                data = fetch(bands, tiles_geobox)
+            finally:
+                self.fetch_histogram.record(time.perf_counter() - start)
+            for band, (tx, ty) in band_tiles:
+                y, x = (ty - ty0) * t, (tx - tx0) * t
+                tile = np.ascontiguousarray(data[band][y:y + t, x:x + t])
+                self._put(keys[band, (tx, ty)], tile)
+                self._copy(out, band, geobox, tile, row0, col0, ty * t, tx * t)
+        finally:
+            with self.lock:
+                for band_tile in band_tiles:
+                    self.in_flight.pop(keys[band_tile]).set()
+
+    def _copy(self, out, band, geobox, tile, row0, col0, tile_row, tile_col):
+        # copy the part of a tile (first pixel at tile_row, tile_col) that overlaps the geobox
+        rows, cols = geobox.shape
+        if band not in out:
+            out[band] = np.zeros((rows, cols), dtype=tile.dtype)
+        r0, r1 = max(tile_row, row0), min(tile_row + tile.shape[0], row0 + rows)
+        c0, c1 = max(tile_col, col0), min(tile_col + tile.shape[1], col0 + cols)
+        out[band][r0 - row0:r1 - row0, c0 - col0:c1 - col0] = tile[r0 - tile_row:r1 - tile_row, c0 - tile_col:c1 - tile_col]
+
+    def _count(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _get(self, key):
+        with self.lock:
+            if key not in self.files:
+                return None
+            self.files.move_to_end(key)
+        path = os.path.join(self.path, key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            os.utime(path)  # last use, for the order after a restart
+            return array
+        except (OSError, ValueError):
+            # deleted by an eviction in the meantime, or a damaged file
+            with self.lock:
+                self.size -= self.files.pop(key, 0)
+            return None
+
+    def _put(self, key, array):
+        path = os.path.join(self.path, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.size += size - self.files.pop(key, 0)
+            self.files[key] = size
+            self._evict()
+
+    def _evict(self):
+        # delete the least recently used tiles until the cache fits (called with the lock held)
+        while self.size > self.max_bytes and len(self.files) > 1:
+            key, size = self.files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+
+    def _scan(self):
+        found = []
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)  # left over by an interrupted write
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, self.path), stat.st_size))
+        for _, key, size in sorted(found):
+            self.files[key] = size
+            self.size += size
+        self._evict()
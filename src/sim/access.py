@@ -0,0 +1,155 @@
+"""
+Access window prediction for ground targets.
+
+An access window is a time interval during which a target is seen from the
+satellite above a minimum elevation (by default the 30 degree limit of the
+mapbox imaging provider). The elevation uses the same spherical earth model as
+MapboxlProvider.get_target_image, so a window predicted here is a window in
+which the imaging request is accepted.
+
+The satellite is propagated once over a regular time grid for all targets.
+Visibility on the grid reduces to comparing the cosine of the central angle
+between target and sub-satellite point (one matrix product) with a per-time
+threshold. Window start and end are then refined by vectorized bisection and
+the peak elevation by golden section search. Passes shorter than `grid_step`
+can be missed, the default of 10 s is well below the shortest useful pass at
+30 degrees elevation for a LEO satellite.
+"""
+import numpy as np
+
+from ImagingProviders.mapbox_provider import EARTH_RADIUS_KM, MIN_ELEVATION_DEG
+
+GOLDEN = (np.sqrt(5) - 1) / 2
+
+
+def lonlat_to_unit_vectors(lon, lat):
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def satellite_vectors(ephemeris, t):
+    """Unit vectors (T, 3) of the sub-satellite points and orbit radii (T,) in km."""
+    lon, lat, alt = ephemeris.get_lonlatalt(t)
+    return lonlat_to_unit_vectors(lon, lat), EARTH_RADIUS_KM + np.asarray(alt)
+
+
+def elevation_from_cos(cos_angle, radius):
+    """Elevation (degrees) of a satellite at `radius` km and central angle acos(cos_angle) from the target."""
+    sin_angle = np.sqrt(np.clip(1 - cos_angle ** 2, 0.0, None))
+    return np.degrees(np.arctan2(radius * cos_angle - EARTH_RADIUS_KM, radius * sin_angle))
+
+
+def elevation(ephemeris, target_vectors, t):
+    """Elevation (degrees) of the satellite at times t[i] seen from target_vectors[i]."""
+    sat_vectors, radius = satellite_vectors(ephemeris, t)
+    return elevation_from_cos(np.sum(sat_vectors * target_vectors, axis=-1), radius)
+
+
+def min_cos_angle(radius, min_elevation):
+    """Smallest cosine of the central angle at which the satellite is still above min_elevation."""
+    # central angle = 90 - elevation - nadir angle, with sin(nadir) = R cos(elevation) / r
+    el = np.radians(min_elevation)
+    nadir = np.arcsin(EARTH_RADIUS_KM * np.cos(el) / radius)
+    return np.cos(np.pi / 2 - el - nadir)
+
+
+def compute_access_windows(ephemeris, lon, lat, start, end, min_elevation=MIN_ELEVATION_DEG,
+                           grid_step=10.0, tolerance=0.05, chunk_size=1000):
+    """
+    Compute all access windows between unix times `start` and `end` for targets at `lon`, `lat` (degrees).
+
+    Returns one list per target with dicts {'start', 'end', 'peak_time', 'peak_elevation'}
+    (times as unix seconds). Windows that are open at `start` or `end` are clipped.
+    """
+    lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    targets = lonlat_to_unit_vectors(lon, lat)
+
+    n_grid = max(2, int(np.ceil((end - start) / grid_step)) + 1)
+    t = np.linspace(start, end, n_grid)
+    step = t[1] - t[0]
+    sat_vectors, radius = satellite_vectors(ephemeris, t)
+    threshold = min_cos_angle(radius, min_elevation)
+
+    windows = [[] for _ in range(len(targets))]
+    for first in range(0, len(targets), chunk_size):
+        chunk = targets[first:first + chunk_size]
+        visible = (chunk @ sat_vectors.T) >= threshold  # (M, T)
+
+        # pad with "not visible" so that windows open at start/end produce edges as well. Edges alternate
+        # between rise and set within a row and nonzero returns row-major order -> even entries are rises
+        padded = np.pad(visible, ((0, 0), (1, 1)))
+        edge_target, edge_index = np.nonzero(padded[:, 1:] != padded[:, :-1])
+        if len(edge_target) == 0:
+            continue
+        rise_target = edge_target[0::2]
+        rise_index = edge_index[0::2]  # first visible grid index
+        set_index = edge_index[1::2]  # first invisible grid index after the window
+        window_targets = chunk[rise_target]
+
+        rise = _refine_crossing(ephemeris, window_targets, t, rise_index, step, min_elevation, rising=True, tolerance=tolerance)
+        set_ = _refine_crossing(ephemeris, window_targets, t, set_index, step, min_elevation, rising=False, tolerance=tolerance)
+
+        peak_time, peak_elevation = _refine_peak(ephemeris, window_targets, rise, set_, tolerance)
+
+        for i, target in enumerate(rise_target):
+            windows[first + target].append({
+                'start': float(rise[i]),
+                'end': float(set_[i]),
+                'peak_time': float(peak_time[i]),
+                'peak_elevation': float(peak_elevation[i]),
+            })
+    return windows
+
+
+def _refine_crossing(ephemeris, target_vectors, t, index, step, min_elevation, rising, tolerance):
+    """
+    Bisect the elevation crossing for each window. For rises, `index` is the first visible grid point,
+    for sets the first invisible one. Crossings at the grid boundary are kept as they are (clipped windows).
+    """
+    if rising:
+        at_boundary = index == 0
+        hi = t[index]
+        lo = np.where(at_boundary, hi, hi - step)
+    else:
+        at_boundary = index == len(t)
+        lo = t[index - 1]
+        hi = np.where(at_boundary, lo, lo + step)
+    lo, hi = lo.copy(), hi.copy()
+
+    while np.max(hi - lo, initial=0.0) > tolerance:
+        mid = (lo + hi) / 2
+        above = elevation(ephemeris, target_vectors, mid) >= min_elevation
+        if rising:
+            hi = np.where(above, mid, hi)
+            lo = np.where(above, lo, mid)
+        else:
+            lo = np.where(above, mid, lo)
+            hi = np.where(above, hi, mid)
+    return hi if rising else lo
+
+
+def _refine_peak(ephemeris, target_vectors, lo, hi, tolerance):
+    """Golden section search for the maximum elevation within [lo, hi]."""
+    lo, hi = lo.copy(), hi.copy()
+    a = hi - GOLDEN * (hi - lo)
+    b = lo + GOLDEN * (hi - lo)
+    fa = elevation(ephemeris, target_vectors, a)
+    fb = elevation(ephemeris, target_vectors, b)
+    while np.max(hi - lo, initial=0.0) > tolerance:
+        left = fa > fb  # maximum is in [lo, b]
+        hi = np.where(left, b, hi)
+        lo = np.where(left, lo, a)
+        new_a = hi - GOLDEN * (hi - lo)
+        new_b = lo + GOLDEN * (hi - lo)
+        # the inner point that stays inside the interval becomes the other inner point of the next iteration
+        fb_next = np.where(left, fa, np.nan)
+        fa_next = np.where(left, np.nan, fb)
+        if left.any():
+            fa_next[left] = elevation(ephemeris, target_vectors[left], new_a[left])
+        if (~left).any():
+            fb_next[~left] = elevation(ephemeris, target_vectors[~left], new_b[~left])
+        a, b, fa, fb = new_a, new_b, fa_next, fb_next
+    peak = (lo + hi) / 2
+    return peak, elevation(ephemeris, target_vectors, peak)
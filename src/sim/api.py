@@ -1,15 +1,39 @@
-from fastapi import FastAPI, Request, HTTPException, Query, Response, APIRouter
+from fastapi import FastAPI, Request, HTTPException, Query, Response, APIRouter, WebSocket, WebSocketDisconnect
 from typing import List, Literal
+import asyncio
 import io
 import base64
 import numpy as np
 from ImagingProviders.sentinel_provider import SentinelProvider
 from ImagingProviders.mapbox_provider import MapboxlProvider
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from pyorbital.orbital import Orbital
+import datetime
+import json
+import threading
+import time
 import traceback
 
+from clock import sim_time_at
+from ephemeris import ChebyshevEphemeris, unix_to_datetime64
+from access import compute_access_windows
+from groundtrack import GroundTrackIndex
+from stream import PositionBroadcaster
+from metrics import metrics as api_metrics
+from shared_state import TornReadError
+from ImagingProviders.mapbox_provider import MIN_ELEVATION_DEG
+
 api = FastAPI()
 
+# /data/position: maximum number of samples per request, longer responses are streamed in chunks
+MAX_POSITION_SAMPLES = 1_000_000
+POSITION_CHUNK_SIZE = 10_000
+# binary format of /data/position: one little endian float64 record (time, lon, lat, alt) per sample
+POSITION_RECORD = np.dtype([("time", "<f8"), ("lon", "<f8"), ("lat", "<f8"), ("alt", "<f8")])
+# position stream: frames buffered per client before the oldest are dropped
+STREAM_QUEUE_SIZE = 100
+
 sentinel = SentinelProvider()
 mapbox = MapboxlProvider()
 
@@ -30,11 +54,293 @@ def serialize_xarray_dataset(ds):
 
 @api.get("/data/current/position")
 async def get_metrics():
-    # We access the shared data that the orchestrator will inject
+    position, timestamp = get_satellite_position()
+    return {
+        "lon-lat-alt": position if position is not None else [0, 0, 0],
+        "timestamp": timestamp or 0
+    }
+
+
+def get_state_block():
+    """Shared memory block with the latest simulation state, written by the sim process (see shared_state.py)."""
+    block = getattr(api.state, "state_block", None)
+    if block is None:
+        raise HTTPException(status_code=503, detail="No simulation state available - is the simulator running?")
+    return block
+
+
+@api.exception_handler(TornReadError)
+async def torn_read_error(request: Request, exc: TornReadError):
+    # the simulator died in the middle of publishing the state
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+def get_satellite_position(satellite_id=None):
+    """
+    (lon, lat, alt) of the primary satellite, or of a constellation member if satellite_id is given.
+    While the simulation follows the wall clock, the position is evaluated from the ephemeris at
+    the current simulation time, i.e. also between two simulation steps. Otherwise (paused or as
+    fast as possible) the last published position is returned.
+    Returns (position, timestamp); position is None if unknown.
+    """
+    block = get_state_block()
+    if satellite_id is not None and satellite_id not in block.read_constellation_ids():
+        raise HTTPException(status_code=404, detail=f"Unknown satellite id '{satellite_id}'")
+
+    t = sim_time_at(block.read_clock())
+    if t is not None:
+        position = get_ephemeris(satellite_id).get_lonlatalt(t)
+    elif satellite_id is None:
+        position, t = block.read_primary()
+    else:
+        position, t = block.read_satellite(satellite_id)
+    if position is None:
+        return None, None
+    return position, datetime.datetime.fromtimestamp(t).isoformat()
+
+
+def get_sim_time():
+    """Current unix time of the simulation (wall clock time if the simulator has not published yet)."""
+    block = getattr(api.state, "state_block", None)
+    if block is None:
+        return time.time()
+    return sim_time_at(block.read_clock()) or block.read_primary()[1] or time.time()
+
+
+def get_ephemeris(satellite_id=None):
+    """
+    Ephemeris of the primary satellite or of a constellation member. The API builds its own
+    ephemeris from the TLEs the simulator uses (api.state.primary_tle / api.state.constellation).
+    """
+    if not hasattr(api.state, "ephemerides"):
+        api.state.ephemerides = {}
+    ephemeris = api.state.ephemerides.get(satellite_id)
+    if ephemeris is not None:
+        return ephemeris
+
+    constellation = getattr(api.state, "constellation", None)
+    if satellite_id is None:
+        tle = getattr(api.state, "primary_tle", None)
+        if tle is None:
+            raise HTTPException(status_code=503, detail="No orbit configured for the API")
+    elif constellation is not None and satellite_id in constellation.index:
+        tle = constellation.get_tle(satellite_id)
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown satellite id '{satellite_id}'")
+
+    ephemeris = ChebyshevEphemeris(Orbital(satellite_id or "primary", line1=tle[0], line2=tle[1]))
+    api.state.ephemerides[satellite_id] = ephemeris
+    return ephemeris
+
+
+ground_track_lock = threading.Lock()
+
+
+def get_ground_track_index(satellite_id=None):
+    """Ground track index of the satellite, moved forward to the current simulation time."""
+    if not hasattr(api.state, "ground_track_indices"):
+        api.state.ground_track_indices = {}
+    index = api.state.ground_track_indices.get(satellite_id)
+    if index is None:
+        index = GroundTrackIndex(get_ephemeris(satellite_id))
+        api.state.ground_track_indices[satellite_id] = index
+    index.advance(get_sim_time())
+    return index
+
+
+@api.get("/data/satellites")
+async def get_satellites():
+    return {"satellites": list(get_state_block().read_constellation_ids())}
+
+
+@api.get("/data/satellites/{satellite_id}/position")
+async def get_satellite_position_by_id(satellite_id: str):
+    position, timestamp = get_satellite_position(satellite_id)
+    return {
+        "lon-lat-alt": position if position is not None else [0, 0, 0],
+        "timestamp": timestamp or 0
+    }
+
+
+@api.get("/data/position")
+def get_position_range(
+    end: float = Query(..., allow_inf_nan=False, description="Unix time"),
+    start: float | None = Query(default=None, allow_inf_nan=False, description="Unix time, default: current simulation time"),
+    step: float = Query(default=10.0, gt=0, allow_inf_nan=False, description="Seconds between two samples"),
+    format: Literal["json", "binary"] = "json",
+    satellite_id: str | None = None
+):
+    # plain def: the propagation is CPU bound and runs in the threadpool instead of blocking the event loop
+    # vectorized SGP4 instead of the ephemeris: exact, and fitting segments for long sparse ranges costs more
+    # than it saves (it would also evict the segments around the current time)
+    satellite = get_ephemeris(satellite_id).satellite
+    if start is None:
+        start = get_sim_time()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    count = int(np.floor((end - start) / step)) + 1
+    if count > MAX_POSITION_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"Too many samples ({count}), at most {MAX_POSITION_SAMPLES} per request - increase step or split the range")
+
+    def chunks():
+        for first in range(0, count, POSITION_CHUNK_SIZE):
+            records = np.empty(min(POSITION_CHUNK_SIZE, count - first), dtype=POSITION_RECORD)
+            records["time"] = start + step * np.arange(first, first + len(records))
+            records["lon"], records["lat"], records["alt"] = satellite.get_lonlatalt(unix_to_datetime64(records["time"]))
+            yield records
+
+    headers = {"X-Sample-Count": str(count)}
+    if format == "binary":
+        if count <= POSITION_CHUNK_SIZE:
+            return Response(content=next(chunks()).tobytes(), media_type="application/octet-stream", headers=headers)
+        return StreamingResponse((records.tobytes() for records in chunks()), media_type="application/octet-stream", headers=headers)
+
+    def json_chunks():
+        yield f'{{"start": {start}, "step": {step}, "count": {count}, "fields": ["time", "lon", "lat", "alt"], "positions": ['
+        for i, records in enumerate(chunks()):
+            rows = json.dumps(records.tolist())[1:-1]  # records are tuples -> json arrays
+            yield rows if i == 0 else "," + rows
+        yield "]}"
+
+    if count <= POSITION_CHUNK_SIZE:
+        return Response(content="".join(json_chunks()), media_type="application/json", headers=headers)
+    return StreamingResponse(json_chunks(), media_type="application/json", headers=headers)
+
+
+class AccessTarget(BaseModel):
+    lon: float = Field(..., ge=-180, le=180)
+    lat: float = Field(..., ge=-90, le=90)
+    id: str | None = None
+
+
+class AccessWindowRequest(BaseModel):
+    targets: List[AccessTarget] = Field(..., max_length=100_000)
+    start: float | None = Field(default=None, description="Unix time, default: current simulation time")
+    horizon_s: float = Field(default=86400.0, gt=0, le=7 * 86400)
+    min_elevation: float = Field(default=MIN_ELEVATION_DEG, ge=0, lt=90)
+    satellite_id: str | None = None
+
+
+@api.post("/data/access-windows")
+def get_access_windows(request: AccessWindowRequest):
+    # plain def: the computation is CPU bound and runs in the threadpool instead of blocking the event loop
+    ephemeris = get_ephemeris(request.satellite_id)
+    start = request.start if request.start is not None else get_sim_time()
+    end = start + request.horizon_s
+
+    windows = compute_access_windows(
+        ephemeris,
+        [target.lon for target in request.targets],
+        [target.lat for target in request.targets],
+        start, end, min_elevation=request.min_elevation,
+    )
+    return {
+        "start": start,
+        "end": end,
+        "targets": [
+            {"id": target.id, "lon": target.lon, "lat": target.lat, "windows": target_windows}
+            for target, target_windows in zip(request.targets, windows)
+        ],
+    }
+
+
+@api.get("/data/passes")
+def get_passes(
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat (min_lon > max_lon for regions across the antimeridian)"),
+    start: float | None = Query(default=None, description="Unix time, default: current simulation time"),
+    end: float | None = Query(default=None, description="Unix time, default: end of the indexed horizon (24 h)"),
+    satellite_id: str | None = None
+):
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise HTTPException(status_code=400, detail="bbox is out of range")
+
+    with ground_track_lock:
+        index = get_ground_track_index(satellite_id)
+        passes = index.query(min_lon, min_lat, max_lon, max_lat, start=start, end=end)
+        horizon = (index.start, index.built_until)
+    return {
+        "horizon": horizon,
+        "passes": [{"start": enter, "end": exit} for enter, exit in passes],
+    }
+
+
+def get_broadcaster():
+    if getattr(api.state, "broadcaster", None) is None:
+        api.state.broadcaster = PositionBroadcaster(get_state_block())
+    return api.state.broadcaster
+
+
+@api.websocket("/stream/position")
+async def stream_position_websocket(
+    websocket: WebSocket,
+    every_n: int = Query(default=1, ge=1, description="Only send every n-th simulation step"),
+    min_interval: float = Query(default=0.0, ge=0, description="Minimum wall clock seconds between two frames")
+):
+    await websocket.accept()
+    broadcaster = get_broadcaster()
+    client = broadcaster.connect(every_n=every_n, min_interval=min_interval, queue_size=STREAM_QUEUE_SIZE)
+
+    async def send_frames():
+        async for frame in client.frames():
+            await websocket.send_json(frame)
+
+    async def wait_for_disconnect():
+        # no frames are sent while the simulation is paused, so a closed connection is noticed here
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_frames()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        broadcaster.disconnect(client)
+
+
+@api.get("/stream/position/sse")
+async def stream_position_sse(
+    every_n: int = Query(default=1, ge=1, description="Only send every n-th simulation step"),
+    min_interval: float = Query(default=0.0, ge=0, description="Minimum wall clock seconds between two frames")
+):
+    broadcaster = get_broadcaster()
+    client = broadcaster.connect(every_n=every_n, min_interval=min_interval, queue_size=STREAM_QUEUE_SIZE)
+
+    async def events():
+        try:
+            async for frame in client.frames():
+                yield f"data: {json.dumps(frame)}\n\n"
+        finally:
+            broadcaster.disconnect(client)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@api.get("/metrics")
+async def get_sim_metrics():
+    """
+    Latency histograms of the simulator (published by the sim process about once per second) and clock stats,
+    with the metrics of the API process itself (e.g. the imagery caches) merged in.
+    """
     data = getattr(api.state, "shared_data", {})
+    metrics = data.get("metrics", None)
+    if metrics is None:
+        raise HTTPException(status_code=503, detail="No metrics published yet - is the simulator running?")
+    local = api_metrics.snapshot()
     return {
-        "lon-lat-alt": data.get("satellite_position", [0, 0, 0]),
-        "timestamp": data.get("last_updated", 0)
+        **metrics,
+        "histograms": {**local["histograms"], **metrics["histograms"]},
+        "gauges": {**local["gauges"], **metrics["gauges"]},
+        "clock": data.get("clock_stats", {}),
     }
 
 
@@ -42,10 +348,10 @@ async def get_metrics():
 async def get_sentinel_image(
     spectral_bands: List[str] = Query(default=["red", "green", "blue"]),
     size_km: float = 10.0,
-    return_type: Literal["array", "png"] = "png"
+    return_type: Literal["array", "png"] = "png",
+    satellite_id: str | None = Query(default=None, description="Constellation member to image from (default: primary satellite)")
 ):
-    data = getattr(api.state, "shared_data", {}).get("satellite_position", None)
-    timestamp = getattr(api.state, "shared_data", {}).get("last_updated", None)
+    data, timestamp = get_satellite_position(satellite_id)
     # if data is none return an error
     if data is None:
         raise HTTPException(status_code=500, detail="Error fetching satellite position from shared data - is the simulator running?")
@@ -66,13 +372,17 @@ async def get_sentinel_image(
 @api.get("/data/current/image/mapbox")
 async def get_mapbox_image(
     lat: float = Query(..., description="The latitude of the location", ge=-90, le=90),
-    lon: float = Query(..., description="The longitude of the location", ge=-180, le=180)
+    lon: float = Query(..., description="The longitude of the location", ge=-180, le=180),
+    satellite_id: str | None = Query(default=None, description="Constellation member to image from (default: primary satellite)")
 ):
+    satellite_position, _ = get_satellite_position(satellite_id)
     try:
-        satellite_position = getattr(api.state, "shared_data", {}).get("satellite_position", None)
         image = mapbox.get_target_image(satellite_position[0], satellite_position[1], satellite_position[2], lon, lat)
         
         return Response(content=image, media_type="image/png")
+    except ValueError as e:
+        # target below the elevation limit -> see /data/access-windows for when it can be imaged
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error fetching Mapbox image: " + str(e))
@@ -0,0 +1,126 @@
+"""
+Headless batch runs: compute a whole trajectory without dashboard, API or real time pacing
+and stream it to a columnar file.
+
+The trajectory is computed vectorized in chunks, so the memory use is bounded by the chunk
+size and not by the length of the run. Two output formats are supported, chosen by the
+file extension:
+
+- `.parquet`: one row group per chunk (requires pyarrow)
+- anything else: `.npz` with a structured array `trajectory` (fields time, lon, lat, alt
+  and, for constellations, satellite) and, for constellations, the satellite ids in
+  `satellites`. `time` is the unix time in seconds, `satellite` indexes into `satellites`.
+"""
+import io
+import time
+import zipfile
+
+import numpy as np
+
+from simulator import ConstellationSimulator
+
+
+class NpzTrajectoryWriter:
+    def __init__(self, path, n_rows, satellite_ids=None):
+        fields = [('time', 'f8'), ('lon', 'f8'), ('lat', 'f8'), ('alt', 'f8')]
+        if satellite_ids is not None:
+            fields.append(('satellite', 'i4'))
+        self.dtype = np.dtype(fields)
+        self.n_rows = n_rows
+        self.rows_written = 0
+
+        self.zip = zipfile.ZipFile(path, 'w', allowZip64=True)
+        if satellite_ids is not None:
+            buffer = io.BytesIO()
+            np.save(buffer, np.array(satellite_ids))
+            self.zip.writestr('satellites.npy', buffer.getvalue())
+
+        # the total number of rows is known up front -> write the npy header once and stream the rows behind it
+        self.file = self.zip.open('trajectory.npy', 'w', force_zip64=True)
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (n_rows,)}
+        np.lib.format.write_array_header_2_0(self.file, header)
+
+    def write(self, columns):
+        rows = np.empty(len(columns['time']), dtype=self.dtype)
+        for name in self.dtype.names:
+            rows[name] = columns[name]
+        self.file.write(rows.tobytes())
+        self.rows_written += len(rows)
+
+    def close(self, complete=True):
+        self.file.close()
+        self.zip.close()
+        if complete and self.rows_written != self.n_rows:
+            raise RuntimeError(f"Trajectory file is inconsistent: expected {self.n_rows} rows, wrote {self.rows_written}")
+
+
+class ParquetTrajectoryWriter:
+    def __init__(self, path, n_rows, satellite_ids=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing parquet files requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.satellite_ids = None if satellite_ids is None else pa.array(satellite_ids)
+
+        fields = [('time', pa.float64()), ('lon', pa.float64()), ('lat', pa.float64()), ('alt', pa.float64())]
+        if satellite_ids is not None:
+            fields.append(('satellite', pa.dictionary(pa.int32(), pa.string())))
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns):
+        arrays = [self.pa.array(columns[name]) for name in ('time', 'lon', 'lat', 'alt')]
+        if self.satellite_ids is not None:
+            arrays.append(self.pa.DictionaryArray.from_arrays(self.pa.array(columns['satellite'], type=self.pa.int32()), self.satellite_ids))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self, complete=True):
+        self.writer.close()
+
+
+def run_batch(sim_engine, start, end, step, out, chunk_size=100_000):
+    """
+    Compute the trajectory from unix time `start` to `end` (inclusive) every `step` seconds
+    and write it to `out`. `chunk_size` is the number of rows computed and written at once.
+    """
+    if step <= 0:
+        raise ValueError("step must be positive")
+    if end < start:
+        raise ValueError("end must not be before start")
+
+    n_steps = int(np.floor((end - start) / step)) + 1
+    is_constellation = isinstance(sim_engine, ConstellationSimulator)
+    n_sats = len(sim_engine.constellation) if is_constellation else 1
+    satellite_ids = sim_engine.constellation.ids if is_constellation else None
+    steps_per_chunk = max(1, chunk_size // n_sats)
+
+    writer_class = ParquetTrajectoryWriter if str(out).endswith('.parquet') else NpzTrajectoryWriter
+    writer = writer_class(out, n_steps * n_sats, satellite_ids=satellite_ids)
+
+    print(f"[BATCH] Computing {n_steps} steps for {n_sats} satellite(s) -> {out}")
+    wall_start = time.time()
+    try:
+        for i in range(0, n_steps, steps_per_chunk):
+            t = start + step * np.arange(i, min(i + steps_per_chunk, n_steps))
+            if is_constellation:
+                # (N, T) -> long format, ordered by time then satellite
+                lon, lat, alt = (a.T.ravel() for a in sim_engine.get_constellation_location(t))
+                columns = {
+                    'time': np.repeat(t, n_sats),
+                    'satellite': np.tile(np.arange(n_sats, dtype=np.int32), len(t)),
+                    'lon': lon, 'lat': lat, 'alt': alt,
+                }
+            else:
+                lon, lat, alt = sim_engine.get_orbital_location(t)
+                columns = {'time': t, 'lon': lon, 'lat': lat, 'alt': alt}
+            writer.write(columns)
+            print(f"[BATCH] {min(i + steps_per_chunk, n_steps)}/{n_steps} steps done")
+    except BaseException:
+        writer.close(complete=False)
+        raise
+    writer.close()
+
+    elapsed = time.time() - wall_start
+    print(f"[BATCH] Finished in {elapsed:.1f} s ({n_steps / max(elapsed, 1e-9):.0f} steps/s)")
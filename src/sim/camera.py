@@ -1,19 +1,35 @@
-from pydispatch import dispatcher
+import numpy as np
 
-TOPIC_SATELLITE_GROUND_POSITION = "satellite.ground_position"
-TOPIC_SIMULATION_STEP_FORWARD = "simulation.step_forward"
+from eventbus import bus, TOPIC_SATELLITE_GROUND_POSITION, TOPIC_CONSTELLATION_GROUND_POSITION, TOPIC_SIMULATION_CLOCK
 
 class Camera:
-    def __init__(self, shared_data_dict):
-        dispatcher.connect(self.on_satellite_ground_position, signal=TOPIC_SATELLITE_GROUND_POSITION)
+    def __init__(self, state_block):
+        bus.subscribe(TOPIC_SATELLITE_GROUND_POSITION, self.on_satellite_ground_position)
+        bus.subscribe(TOPIC_CONSTELLATION_GROUND_POSITION, self.on_constellation_ground_position)
+        bus.subscribe(TOPIC_SIMULATION_CLOCK, self.on_clock_state)
         self.current_satellite_position = (0.0, 0.0, 0.0)  # (lon, lat, alt)
-        self.shared_data_dict = shared_data_dict
+        self.constellation_ids = []
+        self.constellation_index = {}
+        self.constellation_positions = np.zeros((0, 3))  # (N, 3) -> (lon, lat, alt) per satellite
+        self.state_block = state_block  # SharedStateBlock read by the API
 
-    def on_satellite_ground_position(self, sender, data, time):
-        lon = data.get('lon', 0.0)
-        lat = data.get('lat', 0.0)
-        alt = data.get('alt', 0.0)
-        self.current_satellite_position = (lon, lat, alt)
-        self.shared_data_dict["satellite_position"] = self.current_satellite_position
-        self.shared_data_dict["last_updated"] = time
+    def on_satellite_ground_position(self, event):
+        self.current_satellite_position = (event.lon, event.lat, event.alt)
+        self.state_block.write_primary(event.lon, event.lat, event.alt, event.time_unix)
 
+    def on_constellation_ground_position(self, event):
+        ids = event.ids
+        if ids != self.constellation_ids:
+            self.constellation_ids = list(ids)
+            self.constellation_index = {sat_id: i for i, sat_id in enumerate(ids)}
+        self.constellation_positions = np.column_stack((event.lon, event.lat, event.alt))
+        self.state_block.write_constellation(ids, event.lon, event.lat, event.alt, event.time_unix)
+
+    def on_clock_state(self, event):
+        self.state_block.write_clock(event.running, event.speed, event.anchor_wall, event.anchor_epsec, event.sim_t0, event.time_epsec)
+
+    def get_satellite_position(self, sat_id):
+        i = self.constellation_index.get(sat_id)
+        if i is None:
+            return None
+        return tuple(self.constellation_positions[i])
@@ -0,0 +1,104 @@
+"""
+Wall clock to simulation time mapping.
+
+The clock is anchored when the simulation is started (or the speed changes):
+the simulation time that should have been reached at wall time `now` is
+
+    anchor_epsec + (now - anchor_wall) * speed
+
+Steps are scheduled against this target instead of against the time of the
+previous step, so the timeline does not drift when a step or a sleep takes
+longer than planned. If the simulator falls behind it takes several steps per
+wake (up to `max_catch_up_steps`); anything beyond that is dropped, i.e. the
+simulation time jumps directly to the wall clock mapped time.
+
+The simulator publishes the mapping (ClockState), so other processes can
+compute the simulation time at any wall time with `sim_time_at`.
+"""
+import math
+import time
+
+
+class SimulationClock:
+    def __init__(self, max_catch_up_steps=10):
+        self.max_catch_up_steps = max_catch_up_steps
+        self.speed = 0  # 0 = as fast as possible
+        self.anchor_wall = None
+        self.anchor_epsec = 0.0
+
+        # statistics
+        self.lag_seconds = 0.0  # simulation seconds the last step was taken behind the wall clock mapped time
+        self.max_lag_seconds = 0.0
+        self.caught_up_steps = 0  # extra steps taken in a single wake to catch up
+        self.dropped_steps = 0  # steps skipped because the simulator was too far behind
+
+    def start(self, current_epsec, speed, now=None):
+        """(Re-)anchor the clock at the current simulation time, e.g. on start or speed change."""
+        self.speed = speed if speed > 0 else 0
+        self.anchor_wall = time.time() if now is None else now
+        self.anchor_epsec = current_epsec
+
+    def reset(self):
+        self.anchor_wall = None
+        self.anchor_epsec = 0.0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.caught_up_steps = 0
+        self.dropped_steps = 0
+
+    def target_epsec(self, now=None):
+        """Simulation time (seconds since sim start) that corresponds to the wall time `now`."""
+        if self.anchor_wall is None or self.speed == 0:
+            return None
+        now = time.time() if now is None else now
+        return self.anchor_epsec + (now - self.anchor_wall) * self.speed
+
+    def steps_due(self, current_epsec, time_step, now=None):
+        """
+        Number of steps to take now. As before, a step is taken as soon as the target time
+        has reached the current simulation time (the simulation leads by up to one step).
+        Returns (steps to publish, steps to drop).
+        """
+        target = self.target_epsec(now)
+        if target is None:
+            return 1, 0  # as fast as possible: one step per call
+        if target < current_epsec:
+            self.lag_seconds = 0.0
+            return 0, 0
+
+        due = int(math.floor((target - current_epsec) / time_step)) + 1
+        self.lag_seconds = target - current_epsec
+        self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+
+        dropped = max(0, due - self.max_catch_up_steps)
+        steps = due - dropped
+        self.caught_up_steps += steps - 1
+        self.dropped_steps += dropped
+        return steps, dropped
+
+    def time_until_next_step(self, current_epsec, now=None):
+        """Wall clock seconds until the next step is due (0 if it is due now or if running as fast as possible)."""
+        target = self.target_epsec(now)
+        if target is None:
+            return 0.0
+        return max(0.0, (current_epsec - target) / self.speed)
+
+    def get_stats(self):
+        return {
+            'speed': self.speed,
+            'lag_seconds': self.lag_seconds,
+            'max_lag_seconds': self.max_lag_seconds,
+            'caught_up_steps': self.caught_up_steps,
+            'dropped_steps': self.dropped_steps,
+        }
+
+
+def sim_time_at(state, now=None):
+    """
+    Unix simulation time at wall time `now` from a published clock state (dict with the ClockState
+    fields). None if the simulation does not follow the wall clock (paused or as fast as possible).
+    """
+    if not state or not state['running'] or state['speed'] <= 0 or state['anchor_wall'] is None:
+        return None
+    now = time.time() if now is None else now
+    return state['sim_t0'] + state['anchor_epsec'] + (now - state['anchor_wall']) * state['speed']
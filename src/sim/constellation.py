@@ -0,0 +1,96 @@
+"""
+Batched propagation of many satellites.
+
+All TLEs are loaded into one sgp4 `SatrecArray`, so a single call propagates
+the whole constellation for one or many timestamps. Satellites are addressed by
+their NORAD catalog number (as a string).
+"""
+import numpy as np
+from pyorbital.orbital import XKMPER
+from sgp4.api import Satrec, SatrecArray
+
+from ephemeris import eci_to_lonlatalt
+
+# julian date of the unix epoch (1970-01-01T00:00:00 UTC)
+UNIX_EPOCH_JD = 2440587.5
+
+
+def read_tle_file(path):
+    """
+    Read a TLE file in two- or three-line format.
+    Returns a list of (name, line1, line2); the name is None for two-line entries.
+    """
+    with open(path) as f:
+        lines = [line.rstrip() for line in f if line.strip()]
+
+    tles = []
+    name = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("1 ") and i + 1 < len(lines) and lines[i + 1].startswith("2 "):
+            tles.append((name, line, lines[i + 1]))
+            name = None
+            i += 2
+        else:
+            name = line[2:].strip() if line.startswith("0 ") else line.strip()
+            i += 1
+    return tles
+
+
+class Constellation:
+    def __init__(self, tles):
+        if len(tles) == 0:
+            raise ValueError("A constellation needs at least one TLE")
+
+        self.tles = []
+        self.ids = []
+        self.names = []
+        satrecs = []
+        for name, line1, line2 in tles:
+            sat_id = line1[2:7].strip()
+            if sat_id in self.ids:
+                print(f"[CONSTELLATION] Skipping duplicate satellite {sat_id}")
+                continue
+            self.tles.append((line1, line2))
+            self.ids.append(sat_id)
+            self.names.append(name or sat_id)
+            satrecs.append(Satrec.twoline2rv(line1, line2))
+
+        self.index = {sat_id: i for i, sat_id in enumerate(self.ids)}
+        self.satrecs = SatrecArray(satrecs)
+
+    @classmethod
+    def from_tle_file(cls, path):
+        return cls(read_tle_file(path))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_tle(self, sat_id):
+        return self.tles[self.index[sat_id]]
+
+    def get_lonlatalt(self, unix_time):
+        """
+        Propagate all satellites at once.
+
+        For a scalar timestamp lon, lat (degrees) and alt (km) have shape (N,),
+        for an array of T timestamps they have shape (N, T). Satellites for which
+        SGP4 fails (e.g. decayed orbits) are set to NaN.
+        """
+        t = np.atleast_1d(np.asarray(unix_time, dtype=np.float64))
+        days, seconds = np.divmod(t, 86400.0)
+        jd = UNIX_EPOCH_JD + days
+        fr = seconds / 86400.0
+
+        error, r, _ = self.satrecs.sgp4(jd, fr)  # r: (N, T, 3) in km, TEME frame
+        pos = np.moveaxis(r, -1, 0) / XKMPER
+        lon, lat, alt = eci_to_lonlatalt(pos, t)
+
+        failed = error != 0
+        if failed.any():
+            lon, lat, alt = (np.where(failed, np.nan, a) for a in (lon, lat, alt))
+
+        if np.ndim(unix_time) == 0:
+            return lon[:, 0], lat[:, 0], alt[:, 0]
+        return lon, lat, alt
@@ -0,0 +1,192 @@
+"""
+Piecewise Chebyshev ephemeris on top of a pyorbital Orbital.
+
+The SGP4 propagation is sampled over fixed windows (segments) of
+`segment_seconds` and the ECI position is approximated per segment with a
+Chebyshev series of degree `degree`. Position queries are then answered from
+the coefficients, which is much cheaper than a full SGP4 evaluation and works
+for scalars as well as arrays of timestamps.
+
+Accuracy: each segment is checked against SGP4 at the midpoints between the
+fit nodes when it is fitted. The largest deviation seen so far is available as
+`max_error_km`. With the defaults (10 minute segments, degree 11) the error for
+a LEO satellite is far below 1 m, i.e. well below the accuracy of SGP4 itself.
+If a fit exceeds `tolerance_km` a warning is printed.
+"""
+from collections import OrderedDict
+import math
+import threading
+
+import numpy as np
+from numpy.polynomial import chebyshev
+from pyorbital.orbital import XKMPER, F, A
+
+# 2000-01-01T12:00:00 UTC as unix time, used for the sidereal time
+J2000_UNIX = 946728000.0
+
+
+def gmst(unix_time):
+    """
+    Greenwich mean sidereal time in radians (same model as pyorbital.astronomy.gmst).
+    Works on plain floats as well as numpy arrays.
+    """
+    ut1 = (unix_time - J2000_UNIX) / 86400.0 / 36525.0
+    theta = 67310.54841 + ut1 * (876600 * 3600 + 8640184.812866 + ut1 * (0.093104 - ut1 * 6.2 * 10e-6))
+    return (theta / 240.0 * (math.pi / 180)) % (2 * math.pi)
+
+
+def eci_to_lonlatalt(pos, unix_time):
+    """
+    Convert normalized ECI positions (in earth radii, shape (3, ...)) to geodetic
+    lon, lat (degrees) and altitude (km). Mirrors Orbital.get_lonlatalt.
+    """
+    pos_x, pos_y, pos_z = pos
+    lon = (np.arctan2(pos_y, pos_x) - gmst(np.asarray(unix_time, dtype=np.float64))) % (2 * np.pi)
+    lon = np.where(lon > np.pi, lon - np.pi * 2, lon)
+
+    r = np.sqrt(pos_x ** 2 + pos_y ** 2)
+    lat = np.arctan2(pos_z, r)
+    e2 = F * (2 - F)
+    while True:
+        lat2 = lat
+        c = 1 / (np.sqrt(1 - e2 * (np.sin(lat2) ** 2)))
+        lat = np.arctan2(pos_z + c * e2 * np.sin(lat2), r)
+        if np.all(abs(lat - lat2) < 1e-10):
+            break
+    alt = (r / np.cos(lat) - c) * A
+    return np.rad2deg(lon), np.rad2deg(lat), alt
+
+
+def unix_to_datetime64(unix_time):
+    return (np.asarray(unix_time, dtype=np.float64) * 1e6).astype('datetime64[us]')
+
+
+class ChebyshevEphemeris:
+    def __init__(self, satellite, segment_seconds=600, degree=11, max_segments=32, tolerance_km=0.01):
+        self.satellite = satellite  # pyorbital Orbital
+        self.segment_seconds = float(segment_seconds)
+        self.degree = degree
+        self.max_segments = max_segments
+        self.tolerance_km = tolerance_km
+
+        self.segments = OrderedDict()  # segment index -> coefficients, shape (degree+1, 3)
+        self._lock = threading.Lock()  # the API queries the same ephemeris from several threads
+        self._last_segment = None
+        self.max_error_km = 0.0
+        self.fit_count = 0
+
+        # Chebyshev nodes on [-1, 1] and the midpoints between them (for validation)
+        n = degree + 1
+        self._nodes = np.cos(np.pi * (np.arange(n) + 0.5) / n)[::-1]
+        self._check_nodes = (self._nodes[:-1] + self._nodes[1:]) / 2
+
+    def invalidate(self, satellite=None):
+        """Drop all fitted segments, e.g. after a reset or when the TLE changed."""
+        with self._lock:
+            if satellite is not None:
+                self.satellite = satellite
+            self.segments.clear()
+            self._last_segment = None
+            self.max_error_km = 0.0
+
+    def get_position(self, unix_time):
+        """Normalized ECI position (earth radii) with shape (3,) or (3, N)."""
+        t = np.asarray(unix_time, dtype=np.float64)
+        if t.ndim == 0:
+            k = int(t // self.segment_seconds)
+            return chebyshev.chebval(self._to_unit(t, k), self._get_segment(k))
+
+        flat = t.ravel()
+        k = (flat // self.segment_seconds).astype(np.int64)
+        segs, inverse = np.unique(k, return_inverse=True)
+        table = np.stack([self._get_segment(int(seg), keep=len(segs)) for seg in segs])  # (segments, degree+1, 3)
+
+        # Clenshaw recurrence for all timestamps at once, each with the coefficients of its own segment
+        x = self._to_unit(flat, k)[:, None]
+        b1 = b2 = 0.0
+        for j in range(self.degree, 0, -1):
+            b1, b2 = table[inverse, j] + 2 * x * b1 - b2, b1
+        pos = (table[inverse, 0] + x * b1 - b2).T
+        return pos.reshape((3,) + t.shape)
+
+    def get_lonlatalt(self, unix_time):
+        """Geodetic lon, lat (degrees) and altitude (km) for one or many unix timestamps."""
+        if np.ndim(unix_time) == 0:
+            return self._get_lonlatalt_scalar(float(unix_time))
+        return eci_to_lonlatalt(self.get_position(unix_time), unix_time)
+
+    # --------------------------------------------------------
+    # Helper functions
+    # --------------------------------------------------------
+
+    def _to_unit(self, t, k):
+        # map [k * segment, (k + 1) * segment] to [-1, 1]
+        return 2 * (t / self.segment_seconds - k) - 1
+
+    def _from_unit(self, x, k):
+        return (k + (x + 1) / 2) * self.segment_seconds
+
+    def _get_lonlatalt_scalar(self, t):
+        # plain python version of get_lonlatalt: numpy call overhead dominates for single timestamps
+        k = int(t // self.segment_seconds)
+        coefs = self._get_segment_lists(k)
+        x = self._to_unit(t, k)
+        x2 = 2 * x
+        pos = []
+        for c in coefs:
+            b1 = b2 = 0.0
+            for ci in c[:0:-1]:
+                b1, b2 = ci + x2 * b1 - b2, b1
+            pos.append(c[0] + x * b1 - b2)
+        pos_x, pos_y, pos_z = pos
+
+        lon = (math.atan2(pos_y, pos_x) - gmst(t)) % (2 * math.pi)
+        if lon > math.pi:
+            lon -= 2 * math.pi
+        r = math.hypot(pos_x, pos_y)
+        lat = math.atan2(pos_z, r)
+        e2 = F * (2 - F)
+        while True:
+            lat2 = lat
+            c = 1 / math.sqrt(1 - e2 * math.sin(lat2) ** 2)
+            lat = math.atan2(pos_z + c * e2 * math.sin(lat2), r)
+            if abs(lat - lat2) < 1e-10:
+                break
+        alt = (r / math.cos(lat) - c) * A
+        return math.degrees(lon), math.degrees(lat), alt
+
+    def _get_segment_lists(self, k):
+        # coefficients of segment k as python lists per axis, cached for the most recent segment
+        if self._last_segment is None or self._last_segment[0] != k or self._last_segment[1] is not self.segments.get(k):
+            coefs = self._get_segment(k)
+            self._last_segment = (k, coefs, coefs.T.tolist())
+        return self._last_segment[2]
+
+    def _sgp4_position(self, unix_time):
+        pos, _ = self.satellite.get_position(unix_to_datetime64(unix_time), normalize=True)
+        return np.asarray(pos)
+
+    def _get_segment(self, k, keep=0):
+        # keep: number of segments needed by the current query, the cache may grow to this size so
+        # that queries spanning more than max_segments don't evict their own segments
+        with self._lock:
+            coefs = self.segments.get(k)
+            if coefs is not None:
+                self.segments.move_to_end(k)
+                return coefs
+            return self._fit_segment(k, keep)
+
+    def _fit_segment(self, k, keep):
+        coefs = chebyshev.chebfit(self._nodes, self._sgp4_position(self._from_unit(self._nodes, k)).T, self.degree)
+
+        check = self._sgp4_position(self._from_unit(self._check_nodes, k))
+        error_km = np.max(np.linalg.norm(chebyshev.chebval(self._check_nodes, coefs) - check, axis=0)) * XKMPER
+        self.max_error_km = max(self.max_error_km, error_km)
+        if error_km > self.tolerance_km:
+            print(f"[EPHEMERIS] Warning: segment {k} fit error {error_km * 1000:.2f} m exceeds tolerance")
+
+        self.fit_count += 1
+        self.segments[k] = coefs
+        while len(self.segments) > max(self.max_segments, keep):
+            self.segments.popitem(last=False)
+        return coefs
@@ -0,0 +1,193 @@
+"""
+In-process event bus connecting the simulator and its subsystems.
+
+Subscribers are kept in pre-resolved tuples per topic, so publishing is a dict
+lookup plus one call per subscriber (no weak reference resolution or signature
+inspection as in pydispatch). Events are slotted dataclasses instead of dicts.
+
+If the bus has a `Metrics` registry, the latency of every subscriber call is
+recorded in a histogram named "<topic>/<subscriber>".
+
+Subscribers are called synchronously in the publishing thread by default.
+A subscriber registered with `threaded=True` gets its own worker thread and a
+bounded queue instead: publishing only enqueues the event, and if the
+subscriber can't keep up the oldest queued events are dropped (and counted),
+so a slow subscriber can't stall the simulation step.
+"""
+from dataclasses import dataclass, field
+from collections import deque
+import threading
+import time
+
+from metrics import metrics
+
+TOPIC_SIMULATION_COMMAND = "simulation.command"
+TOPIC_SATELLITE_GROUND_POSITION = "satellite.ground_position"
+TOPIC_SIMULATION_STEP_FORWARD = "simulation.step_forward"
+TOPIC_SIMULATION_TICK = "simulation.tick"
+TOPIC_CONSTELLATION_GROUND_POSITION = "constellation.ground_position"
+TOPIC_SIMULATION_CLOCK = "simulation.clock"
+
+
+# --------------------------------------------------------
+# Events
+# --------------------------------------------------------
+
+@dataclass(slots=True)
+class SimulationCommand:
+    command: str
+    parameters: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class SimulationTick:
+    time: float  # unix time of the simulation
+    time_epsec: float  # seconds since the simulation start
+
+
+@dataclass(slots=True)
+class ClockState:
+    # published when the wall clock mapping changes (start, pause, speed change, reset)
+    running: bool
+    speed: float  # 0 = as fast as possible (no wall clock mapping)
+    anchor_wall: float | None  # wall time at which the simulation time was anchor_epsec
+    anchor_epsec: float
+    sim_t0: float  # unix time of the simulation start
+    time_epsec: float  # simulation time when the state was published
+
+
+@dataclass(slots=True)
+class StepForward:
+    counter: int
+    time: float
+    time_epsec: float
+
+
+@dataclass(slots=True)
+class GroundPosition:
+    lon: float
+    lat: float
+    alt: float  # km
+    time: str  # ISO-8601
+    time_unix: float
+    time_epsec: float
+
+
+@dataclass(slots=True)
+class ConstellationGroundPosition:
+    ids: list  # satellite ids, same order as the arrays
+    lon: object  # numpy arrays of shape (N,)
+    lat: object
+    alt: object
+    time: str
+    time_unix: float
+    time_epsec: float
+
+
+# --------------------------------------------------------
+# Bus
+# --------------------------------------------------------
+
+class ThreadedSubscriber:
+    """Runs a callback in its own thread, fed through a bounded queue that drops the oldest events."""
+
+    def __init__(self, callback, queue_size=1000, name=None):
+        self.callback = callback
+        self.queue = deque(maxlen=queue_size)
+        self.condition = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+        self.histogram = None  # set by an instrumented bus, records the callback latency in the worker thread
+        self.thread = threading.Thread(target=self._run, name=name or f"subscriber-{callback.__qualname__}", daemon=True)
+        self.thread.start()
+
+    def __call__(self, event):
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(event)
+            self.received += 1
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                event = self.queue.popleft()
+            try:
+                if self.histogram is None:
+                    self.callback(event)
+                else:
+                    start = time.perf_counter()
+                    self.callback(event)
+                    self.histogram.record(time.perf_counter() - start)
+            except Exception as e:
+                print(f"[EVENTBUS] Error in threaded subscriber {self.callback.__qualname__}: {e}")
+
+
+class EventBus:
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._subscribers = {}  # topic -> tuple of (callable, histogram or None)
+
+    def subscribe(self, topic, callback, threaded=False, queue_size=1000):
+        """
+        Call `callback(event)` for every event published on `topic`. Returns the registered
+        callable (needed for unsubscribe when threaded=True).
+        """
+        subscriber = ThreadedSubscriber(callback, queue_size=queue_size) if threaded else callback
+        self._subscribers[topic] = self._subscribers.get(topic, ()) + ((subscriber, None),)
+        self._instrument(topic)
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        self._subscribers[topic] = tuple((s, h) for s, h in self._subscribers.get(topic, ()) if s is not subscriber and s != subscriber)
+
+    def publish(self, topic, event):
+        if self.metrics is None:
+            for subscriber, _ in self._subscribers.get(topic, ()):
+                subscriber(event)
+            return
+        for subscriber, histogram in self._subscribers.get(topic, ()):
+            if histogram is None:
+                subscriber(event)  # threaded, timed in its worker
+                continue
+            start = time.perf_counter()
+            subscriber(event)
+            histogram.record(time.perf_counter() - start)
+
+    def subscribers(self, topic):
+        return tuple(s for s, _ in self._subscribers.get(topic, ()))
+
+    def set_metrics(self, metrics):
+        """Enable (or disable with None) the latency histograms for all current and future subscribers."""
+        self.metrics = metrics
+        for topic in self._subscribers:
+            self._instrument(topic)
+
+    # --------------------------------------------------------
+    # Helper functions
+    # --------------------------------------------------------
+
+    def _instrument(self, topic):
+        instrumented = []
+        for subscriber, _ in self._subscribers[topic]:
+            threaded = isinstance(subscriber, ThreadedSubscriber)
+            histogram = None
+            if self.metrics is not None:
+                name = f"{topic}/{(subscriber.callback if threaded else subscriber).__qualname__}"
+                histogram = self.metrics.histogram(name)
+                if threaded:
+                    self.metrics.gauge(f"{name}/received", lambda s=subscriber: s.received)
+                    self.metrics.gauge(f"{name}/dropped", lambda s=subscriber: s.dropped)
+                    self.metrics.gauge(f"{name}/queued", lambda s=subscriber: len(s.queue))
+            if threaded:
+                # the callback runs in the worker thread, which does the timing
+                subscriber.histogram, histogram = histogram, None
+            instrumented.append((subscriber, histogram))
+        self._subscribers[topic] = tuple(instrumented)
+
+
+# default bus of the process (like pydispatch's global dispatcher), instrumented with the process metrics
+bus = EventBus(metrics=metrics)
@@ -0,0 +1,145 @@
+"""
+Spatial index of the ground track for "when is the satellite over X" queries.
+
+The sub-satellite track is sampled every `sample_step` seconds over a rolling
+horizon and the samples are binned into a regular lon/lat grid of `cell_deg`
+degree cells. Each cell keeps the time intervals during which the track
+crosses it, so a region query only has to look at the cells of the region
+instead of stepping through the orbit. The cell intervals are then refined
+against the exact track to get the entry and exit time of the region.
+
+The index is extended incrementally: `advance(now)` drops intervals that are
+in the past and only propagates the part of the horizon that is new.
+"""
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class GroundTrackIndex:
+    def __init__(self, ephemeris, cell_deg=1.0, horizon_s=86400.0, sample_step=10.0, refine_step=1.0):
+        self.ephemeris = ephemeris
+        self.cell_deg = cell_deg
+        self.horizon_s = horizon_s
+        self.sample_step = sample_step
+        self.refine_step = refine_step
+        self.n_lon = int(np.ceil(360 / cell_deg))
+        self.n_lat = int(np.ceil(180 / cell_deg))
+        self.clear()
+
+    def clear(self):
+        self.cells = defaultdict(deque)  # cell id -> deque of [enter, exit] intervals, ordered by time
+        self.expiry = deque()  # (exit, cell id) in insertion order, used to drop old intervals
+        self.start = None  # index covers [start, built_until]
+        self.built_until = None
+        self._open_cell = None  # cell of the last sample, its interval may continue in the next extension
+
+    def advance(self, now):
+        """Move the index window to [now, now + horizon]."""
+        if self.start is None or now < self.start or now > self.built_until:
+            # first use, reset of the simulation or a jump beyond the horizon -> rebuild
+            self.clear()
+            self.start = now
+            self._extend(now, now + self.horizon_s)
+            return
+
+        self.start = now
+        while self.expiry and self.expiry[0][0] < now:
+            _, cell = self.expiry.popleft()
+            intervals = self.cells[cell]
+            intervals.popleft()
+            if not intervals:
+                del self.cells[cell]
+        if now + self.horizon_s > self.built_until:
+            self._extend(self.built_until, now + self.horizon_s)
+
+    def cell_ids(self, lon, lat):
+        lon_index = np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64) % self.n_lon
+        lat_index = np.clip(np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64), 0, self.n_lat - 1)
+        return lat_index * self.n_lon + lon_index
+
+    def cells_in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        lat_cells = range(int(np.floor((min_lat + 90) / self.cell_deg)), int(np.floor((max_lat + 90) / self.cell_deg)) + 1)
+        lon_first = int(np.floor((min_lon + 180) / self.cell_deg))
+        lon_last = int(np.floor((max_lon + 180) / self.cell_deg))
+        if max_lon < min_lon:
+            lon_last += self.n_lon  # bbox crosses the antimeridian
+        for lat_index in lat_cells:
+            if 0 <= lat_index < self.n_lat:
+                for lon_index in range(lon_first, lon_last + 1):
+                    yield lat_index * self.n_lon + lon_index % self.n_lon
+
+    def query(self, min_lon, min_lat, max_lon, max_lat, start=None, end=None):
+        """
+        Passes over the bbox (min_lon > max_lon for boxes across the antimeridian) within the indexed
+        horizon, optionally restricted to [start, end]. Returns a list of (enter, exit) unix times.
+        """
+        # include the ring of cells around the bbox: the track can cut a corner of the bbox between two samples
+        d = self.cell_deg
+        candidates = []
+        for cell in set(self.cells_in_bbox(min_lon - d, min_lat - d, max_lon + d, max_lat + d)):
+            for enter, exit in self.cells.get(cell, ()):
+                if (end is None or enter <= end) and (start is None or exit >= start):
+                    candidates.append((enter, exit))
+        if not candidates:
+            return []
+
+        # neighbouring cells of the same pass -> merge the intervals before refining
+        candidates.sort()
+        merged = [list(candidates[0])]
+        for enter, exit in candidates[1:]:
+            if enter <= merged[-1][1] + self.sample_step:
+                merged[-1][1] = max(merged[-1][1], exit)
+            else:
+                merged.append([enter, exit])
+
+        # refine against the exact track: one vectorized ephemeris call for all candidate passes
+        times = [np.arange(enter - self.sample_step, exit + self.sample_step + self.refine_step, self.refine_step) for enter, exit in merged]
+        lengths = [len(t) for t in times]
+        t = np.concatenate(times)
+        lon, lat, _ = self.ephemeris.get_lonlatalt(t)
+        if max_lon >= min_lon:
+            inside_lon = (lon >= min_lon) & (lon <= max_lon)
+        else:
+            inside_lon = (lon >= min_lon) | (lon <= max_lon)
+        inside = inside_lon & (lat >= min_lat) & (lat <= max_lat)
+        if start is not None:
+            inside &= t >= start
+        if end is not None:
+            inside &= t <= end
+
+        passes = []
+        for t_pass, inside_pass in zip(np.split(t, np.cumsum(lengths)[:-1]), np.split(inside, np.cumsum(lengths)[:-1])):
+            if not inside_pass.any():
+                continue
+            # a merged candidate can contain more than one pass (e.g. consecutive orbits close to the poles)
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], inside_pass, [False])).astype(np.int8)))
+            for enter, exit in zip(edges[0::2], edges[1::2] - 1):
+                passes.append((float(t_pass[enter]), float(t_pass[exit])))
+        return passes
+
+    # --------------------------------------------------------
+    # Helper functions
+    # --------------------------------------------------------
+
+    def _extend(self, start, end):
+        t = np.arange(start, end + self.sample_step, self.sample_step)
+        if len(t) == 0:
+            return
+        lon, lat, _ = self.ephemeris.get_lonlatalt(t)
+        cells = self.cell_ids(lon, lat)
+
+        # runs of samples in the same cell -> one interval per run
+        run_starts = np.concatenate(([0], np.flatnonzero(cells[1:] != cells[:-1]) + 1))
+        run_ends = np.append(run_starts[1:] - 1, len(t) - 1)
+        for first, last in zip(run_starts, run_ends):
+            cell = int(cells[first])
+            if first == 0 and cell == self._open_cell:
+                # continuation of the last interval of the previous extension (which is also the last expiry entry)
+                self.cells[cell][-1][1] = float(t[last])
+                self.expiry[-1] = (float(t[last]), cell)
+                continue
+            self.cells[cell].append([float(t[first]), float(t[last])])
+            self.expiry.append((float(t[last]), cell))
+        self._open_cell = int(cells[-1])
+        self.built_until = float(t[-1])
@@ -1,42 +1,43 @@
 
+import asyncio
 import datetime
+import queue
+import threading
+import time
 import requests
 
-from pydispatch import dispatcher
-
-TOPIC_SIMULATION_COMMAND = "simulation.command"
-TOPIC_SATELLITE_GROUND_POSITION = "satellite.ground_position"
-TOPIC_SIMULATION_STEP_FORWARD = "simulation.step_forward"
-TOPIC_SIMULATION_TICK = "simulation.tick"
+from eventbus import bus, TOPIC_SIMULATION_COMMAND, TOPIC_SATELLITE_GROUND_POSITION, TOPIC_CONSTELLATION_GROUND_POSITION, TOPIC_SIMULATION_TICK, SimulationCommand
+from metrics import metrics
 
 
 import os
 
 BASE_URL = os.environ.get("DASHBOARD_URL", "http://dashboard:8000")
+# how long (in seconds) the dashboard may hold a command long-poll request before answering with no commands
+COMMAND_POLL_TIMEOUT = 25.0
 
 
-class WebGuiConnector:
-    def __init__(self):
-        # register all the subscriber callbacks
-        dispatcher.connect(self.on_satellite_ground_position, signal=TOPIC_SATELLITE_GROUND_POSITION)
-        dispatcher.connect(self.on_sim_tick, signal=TOPIC_SIMULATION_TICK)
-        self.sim_status = None
+def telemetry_payload(lat, lon, alt_km, time, satellite="Test"):
+    return {
+        "satellite": satellite,
+        "timestamp": time,
+        "latitude": lat,
+        "longitude": lon,
+        "altitude": alt_km
+    }
 
-    def on_satellite_ground_position(self, sender, data, time):
-        # extract the data
-        lon = data.get('lon', 0.0)
-        lat = data.get('lat', 0.0)
-        alt = data.get('alt', 0.0)
 
-        self.send_telemetry(lat, lon, alt, time)
+def constellation_payloads(event):
+    """Telemetry of every constellation member of a ConstellationGroundPosition event."""
+    return [
+        telemetry_payload(lat, lon, alt, event.time, satellite=sat_id)
+        for sat_id, lon, lat, alt in zip(event.ids, event.lon.tolist(), event.lat.tolist(), event.alt.tolist())
+        if lat == lat  # NaN: propagation failed
+    ]
 
 
-    def on_sim_tick(self, sender, data):
-        json = self.fetch_commands()
-        commands = json.get('commands', [])
-        if len(commands) > 0:
-            for command in commands:
-                self.handle_commands(command['command'], command['parameters'])
+class GuiCommandHandler:
+    """Turns the commands of the dashboard into simulation commands on the event bus."""
 
     def handle_commands(self, command: str, parameters: dict):
         # check if there's a status in the command
@@ -46,64 +47,263 @@ class WebGuiConnector:
             self.pause_simulation(parameters)
         elif command == 'stop':
             self.reset_simulation(parameters)
-        
-        
-
-    def send_telemetry(self, lat, lon, alt_km, time ):
-        url = f"{BASE_URL}/api/telemetry/"
-        print(f"time: {time}, lat: {lat}, lon: {lon}, alt_km: {alt_km}")
-        payload = {
-            "satellite": "Test",
-            "timestamp": time,
-            "latitude": lat,
-            "longitude": lon,
-            "altitude": alt_km
-        }
 
+    def start_simulation(self, parameters):
+        print("Starting simulation...")
+        bus.publish(TOPIC_SIMULATION_COMMAND, SimulationCommand('start', parameters))
+
+
+    def pause_simulation(self, parameters):
+        print("Pausing simulation...")
+        bus.publish(TOPIC_SIMULATION_COMMAND, SimulationCommand('pause', parameters))
+
+    def reset_simulation(self, parameters):
+        print("Resetting simulation...")
+        bus.publish(TOPIC_SIMULATION_COMMAND, SimulationCommand('reset'))
+
+
+class TelemetryUploader:
+    """
+    Posts telemetry to the dashboard from a background thread over a keep-alive session.
+
+    submit() never blocks: points wait in a buffer that holds the latest point per satellite.
+    The dashboard only keeps the latest position of each satellite, so a newer point replaces
+    a pending older one (counted as coalesced) - under backpressure the upload rate simply
+    drops to what the dashboard can take, while the simulation keeps running at full speed.
+    All pending points (of any number of satellites) are sent in one request to the bulk
+    ingest endpoint, at most `max_batch` points per request. The points of a failed request
+    are counted as failed; the ones after it go back to the buffer.
+    """
+    def __init__(self, session=None, retry_delay=1.0, max_batch=5000):
+        self.session = session or requests.Session()
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay  # pause after a failed upload, so a dead dashboard isn't hammered
+        self.pending = {}  # satellite -> payload
+        self.condition = threading.Condition()
+        self.submitted = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.failed = 0
+        self.upload_histogram = metrics.histogram("gui.telemetry_upload")
+        for name in ("submitted", "coalesced", "sent", "failed"):
+            metrics.gauge(f"gui.telemetry_{name}", lambda name=name: getattr(self, name))
+        self.thread = threading.Thread(target=self._run, name="telemetry-uploader", daemon=True)
+        self.thread.start()
+
+    def submit(self, payload):
+        self.submit_many([payload])
+
+    def submit_many(self, payloads):
+        with self.condition:
+            for payload in payloads:
+                if payload["satellite"] in self.pending:
+                    self.coalesced += 1
+                self.pending[payload["satellite"]] = payload
+            self.submitted += len(payloads)
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                points, self.pending = list(self.pending.values()), {}
+            for i in range(0, len(points), self.max_batch):
+                if not self._post(points[i:i + self.max_batch]):
+                    self._requeue(points[i + self.max_batch:])
+                    time.sleep(self.retry_delay)
+                    break
+
+    def _requeue(self, points):
+        # the points after a failed request go back to the buffer, unless a newer point of the satellite arrived meanwhile
+        with self.condition:
+            for payload in points:
+                if payload["satellite"] in self.pending:
+                    self.coalesced += 1
+                else:
+                    self.pending[payload["satellite"]] = payload
+
+    def _post(self, points):
+        start = time.perf_counter()
         try:
-            resp = requests.post(url, json=payload, timeout=2)
+            resp = self.session.post(f"{BASE_URL}/api/telemetry/bulk/", json=points, timeout=5)
             resp.raise_for_status()
+            rejected = resp.json().get("rejected", 0)
         except Exception as e:
+            # any error (not only the network, e.g. a payload that can't be serialized) must not stop the uploader thread
+            self.failed += len(points)
             print(f"Error sending telemetry: {e}")
-        else:
-            # Optionally inspect the response
-            data = resp.json()
-            print(data)
-            
-        # TODO: send data to the web gui via the api
-
-    def fetch_commands(self) -> dict:
-        url = f"{BASE_URL}/api/commands/"
+            return False
+        finally:
+            self.upload_histogram.record(time.perf_counter() - start)
+        if rejected:
+            print(f"Dashboard rejected {rejected} of {len(points)} telemetry points")
+        self.failed += rejected
+        self.sent += len(points) - rejected
+        return True
+
+
+class CommandPoller:
+    """
+    Long-polls the commands of the dashboard from a background thread and queues them for the simulation.
+
+    The dashboard holds each request until a command is posted (or `timeout` passes), so a command
+    is received right away while an idle simulator makes one request per `timeout` seconds instead
+    of one per tick. The cursor (id of the last received command) is sent with every request, so
+    no command is received twice and none is skipped; it also acknowledges the received commands,
+    so after a restart the simulator continues where it left off.
+    """
+    def __init__(self, session=None, timeout=COMMAND_POLL_TIMEOUT, retry_delay=1.0):
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.retry_delay = retry_delay  # pause after a failed request, so a dead dashboard isn't hammered
+        self.cursor = None  # None: the dashboard starts after the last acknowledged command
+        self.commands = queue.SimpleQueue()
+        self.received = 0
+        self.failed = 0
+        for name in ("received", "failed"):
+            metrics.gauge(f"gui.commands_{name}", lambda name=name: getattr(self, name))
+        self.thread = threading.Thread(target=self._run, name="command-poller", daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        """Commands received since the last call, oldest first (never blocks)."""
+        commands = []
+        while True:
+            try:
+                commands.append(self.commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def _run(self):
+        while True:
+            json = self._poll()
+            if json is None:
+                time.sleep(self.retry_delay)
+                continue
+            for command in json.get('commands', []):
+                self.commands.put(command)
+                self.received += 1
+            self.cursor = json.get('cursor', self.cursor)
+
+    def _poll(self):
+        params = {'timeout': self.timeout}
+        if self.cursor is not None:
+            params['after'] = self.cursor
         try:
-            resp = requests.get(url, timeout=2)
+            # the request may legitimately take `timeout` seconds
+            resp = self.session.get(f"{BASE_URL}/api/commands/poll/", params=params, timeout=self.timeout + 5)
             resp.raise_for_status()
-        except requests.RequestException as e:
-            print(f"Error fetching commands: {e}")
-            return {"message": "error", "details": str(e)}
-        return resp.json()
-    
+            return resp.json()
+        except (requests.RequestException, ValueError) as e:
+            self.failed += 1
+            print(f"Error polling commands: {e}")
+            return None
 
-    def start_simulation(self, parameters):
-        print("Starting simulation...")
-        dispatcher.send(
-            signal=TOPIC_SIMULATION_COMMAND,
-            sender=self,
-            data={'command': 'start', 'parameters': parameters},
-        )
 
+class WebGuiConnector(GuiCommandHandler):
+    def __init__(self):
+        # background threads with their own keep-alive sessions (sessions are not meant to be shared between threads)
+        self.uploader = TelemetryUploader()
+        self.poller = CommandPoller()
+        # register all the subscriber callbacks
+        bus.subscribe(TOPIC_SATELLITE_GROUND_POSITION, self.on_satellite_ground_position)
+        bus.subscribe(TOPIC_CONSTELLATION_GROUND_POSITION, self.on_constellation_ground_position)
+        bus.subscribe(TOPIC_SIMULATION_TICK, self.on_sim_tick)
+        self.sim_status = None
 
-    def pause_simulation(self, parameters):
-        print("Pausing simulation...")
-        dispatcher.send(
-            signal=TOPIC_SIMULATION_COMMAND,
-            sender=self,
-            data={'command': 'pause', 'parameters': parameters},
-        )
+    def on_satellite_ground_position(self, event):
+        self.send_telemetry(event.lat, event.lon, event.alt, event.time)
 
-    def reset_simulation(self, parameters):
-        print("Resetting simulation...")
-        dispatcher.send(
-            signal=TOPIC_SIMULATION_COMMAND,
-            sender=self,
-            data={'command': 'reset'},
-        )
+    def on_constellation_ground_position(self, event):
+        self.uploader.submit_many(constellation_payloads(event))
+
+
+    def on_sim_tick(self, event):
+        # the commands are handled here, in the sim thread; the poller only receives them
+        for command in self.poller.drain():
+            self.handle_commands(command['command'], command['parameters'])
+
+    def send_telemetry(self, lat, lon, alt_km, time):
+        # queued, the upload happens in the background (see TelemetryUploader)
+        self.uploader.submit(telemetry_payload(lat, lon, alt_km, time))
+
+
+class AsyncWebGuiConnector(GuiCommandHandler):
+    """
+    Dashboard connector for the single process mode: runs as tasks in the event loop of the API
+    and talks to the dashboard with httpx.AsyncClient. Commands are long-polled by a task (see
+    CommandPoller), telemetry (of the primary satellite and of the constellation) goes through a
+    bounded queue of point batches that drops the oldest batches if the dashboard can't keep up.
+    """
+    def __init__(self, poll_timeout=COMMAND_POLL_TIMEOUT, retry_delay=1.0, queue_size=100):
+        bus.subscribe(TOPIC_SATELLITE_GROUND_POSITION, self.on_satellite_ground_position)
+        bus.subscribe(TOPIC_CONSTELLATION_GROUND_POSITION, self.on_constellation_ground_position)
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.cursor = None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.client = None
+        metrics.gauge("gui.telemetry_dropped", lambda: self.dropped)
+
+    def start(self):
+        """Start the sender and command polling tasks (must be called from the event loop)."""
+        import httpx  # only needed in the single process mode
+        self.client = httpx.AsyncClient(timeout=2)
+        return [asyncio.create_task(self.send_telemetry_loop()), asyncio.create_task(self.poll_commands_loop())]
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+    def on_satellite_ground_position(self, event):
+        # called synchronously by the simulator step (in the event loop thread)
+        self._enqueue([telemetry_payload(event.lat, event.lon, event.alt, event.time)])
+
+    def on_constellation_ground_position(self, event):
+        self._enqueue(constellation_payloads(event))
+
+    def _enqueue(self, points):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(points)
+
+    async def send_telemetry_loop(self):
+        while True:
+            # everything that queued up during the previous upload goes in one bulk request
+            points = list(await self.queue.get())
+            while not self.queue.empty():
+                points.extend(self.queue.get_nowait())
+            await self.send_telemetry_batch(points)
+
+    async def poll_commands_loop(self):
+        while True:
+            json = await self.fetch_commands()
+            if json is None:
+                await asyncio.sleep(self.retry_delay)
+                continue
+            for command in json.get('commands', []):
+                self.handle_commands(command['command'], command['parameters'])
+            self.cursor = json.get('cursor', self.cursor)
+
+    async def send_telemetry_batch(self, points):
+        try:
+            resp = await self.client.post(f"{BASE_URL}/api/telemetry/bulk/", json=points)
+            resp.raise_for_status()
+        except Exception as e:
+            print(f"Error sending telemetry: {e}")
+
+    async def fetch_commands(self):
+        """Long-poll for the commands after the cursor, None on error."""
+        params = {'timeout': self.poll_timeout}
+        if self.cursor is not None:
+            params['after'] = self.cursor
+        try:
+            resp = await self.client.get(f"{BASE_URL}/api/commands/poll/", params=params, timeout=self.poll_timeout + 5)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            print(f"Error fetching commands: {e}")
+            return None
@@ -1,32 +1,80 @@
+import asyncio
 import click
+import contextlib
 import time
+import datetime
+import signal
+import sys
 
 import uvicorn
 
-import api
 from camera import Camera
-from simulator import Simulator
-from gui import WebGuiConnector
-from api import api
+from simulator import Simulator, ConstellationSimulator
+from constellation import Constellation, read_tle_file
+from gui import WebGuiConnector, AsyncWebGuiConnector
+from batch import run_batch
+from metrics import metrics
+from shared_state import SharedStateBlock
 import multiprocessing
 
+# the simulator is woken up at least this often (in seconds) to handle received commands, even if no step is due
+COMMAND_POLL_INTERVAL = 0.1
+# how often (in seconds) the sim process publishes its metrics to the API process
+METRICS_PUBLISH_INTERVAL = 1.0
+
+DEFAULT_TLE = [
+    "1 58469U 23185H   24092.52931972  .00003325  00000+0  25755-3 0  9995",
+    "2 58469  97.6719 160.4649 0013302 174.6184 185.5186 15.02057459 18273",
+]
+
 @click.command()
 @click.option('--timing', default=10, help='Numerical speed of the simulation. 1 -> real time, 2 -> 2x real time, ... 0 -> as fast as possible.')
 @click.option('--time-step', default=20, help='Time step in seconds for the STK animation. Only applicable if simulator is stk, ignored otherwise.')
+@click.option('--ephemeris-segment', default=600, help='Length in seconds of the Chebyshev ephemeris segments used for the orbit. 0 -> evaluate SGP4 directly every step.')
+@click.option('--tle-file', default=None, type=click.Path(exists=True, dir_okay=False), help='TLE file with the satellites of a constellation. The first satellite is the primary one shown in the dashboard. If not given, a single satellite is simulated.')
+@click.option('--max-catch-up-steps', default=10, help='Maximum number of steps taken at once when the simulation falls behind the wall clock. Steps beyond that are skipped.')
+@click.option('--batch', is_flag=True, help='Run headless (no dashboard, no API, no real time pacing) and write the trajectory from --start to --end to --out.')
+@click.option('--start', type=click.DateTime(formats=["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]), help='Batch mode: start time (UTC).')
+@click.option('--end', type=click.DateTime(formats=["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]), help='Batch mode: end time (UTC).')
+@click.option('--step', default=10.0, help='Batch mode: time between two trajectory points in seconds.')
+@click.option('--out', default='trajectory.npz', type=click.Path(dir_okay=False), help='Batch mode: output file (.npz or .parquet).')
+@click.option('--metrics-file', default=None, type=click.Path(dir_okay=False), help='Write the latency metrics of the simulator (JSON) to this file on shutdown. Not used in batch mode.')
+@click.option('--single-process', is_flag=True, help='Run the simulator as a task in the event loop of the API instead of in separate processes (smaller footprint, e.g. for many instances per host).')
+@click.option('--prefetch-lookahead', default=0.0, help='Simulation seconds of upcoming ground track for which Sentinel images are loaded into the caches ahead of requests (e.g. 300). 0 -> no prefetch (default).')
+@click.option('--prefetch-concurrency', default=2, help='Number of images prefetched in parallel.')
+@click.option('--prefetch-bandwidth', default=0.0, help='Download budget of the prefetch in MB/s. 0 -> unlimited.')
+
+def main(timing, time_step, ephemeris_segment, tle_file, max_catch_up_steps, batch, start, end, step, out, metrics_file, single_process,
+         prefetch_lookahead, prefetch_concurrency, prefetch_bandwidth):
+    if batch:
+        if start is None or end is None:
+            raise click.UsageError("--batch requires --start and --end")
+        sim_engine = create_sim_engine(timing, time_step, ephemeris_segment, tle_file)
+        run_batch(sim_engine,
+                  start.replace(tzinfo=datetime.timezone.utc).timestamp(),
+                  end.replace(tzinfo=datetime.timezone.utc).timestamp(),
+                  step, out)
+        return
 
-def main(timing, time_step):
+    prefetch = dict(lookahead=prefetch_lookahead, concurrency=prefetch_concurrency, bandwidth_mb=prefetch_bandwidth)
+    if single_process:
+        run_single_process(timing, time_step, ephemeris_segment, tle_file, max_catch_up_steps, metrics_file, prefetch)
+        return
+
+    # positions and clock: shared memory block, written by the sim and read lock-free by the API
+    state_block = SharedStateBlock.create(n_satellites=len(read_tle_file(tle_file)) if tle_file else 0)
+    # low rate data (metrics): manager dict
     manager = multiprocessing.Manager()
     shared_data_dict = manager.dict()
-    shared_data_dict["satellite_position"] = (0.0, 0.0, 0.0)  # (lon, lat, alt)
 
     sim_proc = multiprocessing.Process(
         target=run_sim,
-        args=(shared_data_dict, timing, time_step)
+        args=(shared_data_dict, state_block.name, timing, time_step, ephemeris_segment, tle_file, max_catch_up_steps, metrics_file)
     )
     
     api_proc = multiprocessing.Process(
         target=run_api, 
-        args=(shared_data_dict,)
+        args=(shared_data_dict, state_block.name, tle_file, prefetch)
     )
 
     sim_proc.start()
@@ -40,31 +88,128 @@ def main(timing, time_step):
         api_proc.join()
     except KeyboardInterrupt:
         print("\nShutting down...")
-        sim_proc.terminate()
-        api_proc.terminate()
+        # the children got the Ctrl+C as well: give them a moment to clean up (e.g. write the metrics file)
+        for proc in (sim_proc, api_proc):
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+    finally:
+        state_block.close(unlink=True)
 
-def run_api(shared_data_dict):
+def run_api(shared_data_dict, state_block_name, tle_file=None, prefetch=None):
+    # imported here so headless batch runs don't need the imaging providers (network access, mapbox token)
+    from api import api
     api.state.shared_data =    shared_data_dict
+    api.state.state_block = SharedStateBlock.attach(state_block_name)
+    configure_api_orbit(api, tle_file)
+    start_prefetch(api, prefetch)
     uvicorn.run(api, host="0.0.0.0", port=8000)
 
-def run_sim(shared_data_dict, timing, time_step):
+def configure_api_orbit(api, tle_file=None):
+    # the API propagates the orbit itself for predictions (e.g. access windows)
+    api.state.constellation = Constellation.from_tle_file(tle_file) if tle_file else None
+    api.state.primary_tle = api.state.constellation.get_tle(api.state.constellation.ids[0]) if tle_file else DEFAULT_TLE
+
+def start_prefetch(api, prefetch=None):
+    # Sentinel images along the upcoming ground track of the primary satellite are loaded into the caches in the background
+    if not prefetch or prefetch['lookahead'] <= 0:
+        return
+    from api import get_ephemeris, sentinel
+    from prefetch import ImageryPrefetcher
+    api.state.prefetcher = ImageryPrefetcher(
+        sentinel, get_ephemeris(), api.state.state_block.read_clock,
+        lookahead=prefetch['lookahead'],
+        concurrency=prefetch['concurrency'],
+        bandwidth=prefetch['bandwidth_mb'] * 1024 ** 2 or None,
+    )
+    api.state.prefetcher.start()
+
+def run_single_process(timing, time_step, ephemeris_segment, tle_file=None, max_catch_up_steps=10, metrics_file=None, prefetch=None):
+    """
+    Simulator and API in one process: the simulation loop runs as a task in the uvicorn event loop and
+    the API reads the state directly from memory. The simulation steps run in the event loop, so large
+    constellations delay API requests by the duration of a step.
+    """
+    from api import api
+    sim_engine = create_sim_engine(timing, time_step, ephemeris_segment, tle_file, max_catch_up_steps)
+    n_satellites = len(sim_engine.constellation) if isinstance(sim_engine, ConstellationSimulator) else 0
+    state_block = SharedStateBlock.in_memory(n_satellites)
+    camera = Camera(state_block=state_block)
+    api.state.shared_data = {}
+    api.state.state_block = state_block
+    configure_api_orbit(api, tle_file)
+    start_prefetch(api, prefetch)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        gui = AsyncWebGuiConnector()
+        tasks = gui.start() + [asyncio.create_task(run_sim_async(sim_engine, api.state.shared_data, metrics_file))]
+        yield
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await gui.close()
+
+    api.router.lifespan_context = lifespan
+    uvicorn.run(api, host="0.0.0.0", port=8000)
+
+async def run_sim_async(sim_engine, shared_data_dict, metrics_file=None):
+    sim_engine.reset()
+    last_metrics_publish = 0.0
+    try:
+        while True:
+            sim_engine.sim_step()
+            if time.time() - last_metrics_publish >= METRICS_PUBLISH_INTERVAL:
+                last_metrics_publish = time.time()
+                publish_metrics(shared_data_dict, sim_engine)
+            # commands come from the polling task of the gui connector, which runs while we sleep
+            await asyncio.sleep(min(sim_engine.time_until_next_step(), COMMAND_POLL_INTERVAL))
+    finally:
+        if metrics_file:
+            metrics.dump(metrics_file, extra={'clock': sim_engine.clock.get_stats()})
+
+def publish_metrics(shared_data_dict, sim_engine):
+    shared_data_dict["metrics"] = metrics.snapshot()
+    shared_data_dict["clock_stats"] = sim_engine.clock.get_stats()
+
+def create_sim_engine(timing, time_step, ephemeris_segment, tle_file=None, max_catch_up_steps=10):
+    if tle_file:
+        constellation = Constellation.from_tle_file(tle_file)
+        print(f"[SIM] Loaded constellation with {len(constellation)} satellites from {tle_file}")
+        return ConstellationSimulator("SatelliteName", constellation, t0=None, timing_mode=timing, time_step=time_step, ephemeris_segment=ephemeris_segment, max_catch_up_steps=max_catch_up_steps)
+    return Simulator("SatelliteName", TLE=DEFAULT_TLE, t0=None, timing_mode=timing, time_step=time_step, ephemeris_segment=ephemeris_segment, max_catch_up_steps=max_catch_up_steps)
+
+def run_sim(shared_data_dict, state_block_name, timing, time_step, ephemeris_segment, tle_file=None, max_catch_up_steps=10, metrics_file=None):
 
     # 3. initialize the simulation GUI if needed
     gui = WebGuiConnector()
 
     # 4. Initialize the simulation engine
-    line1 = "1 58469U 23185H   24092.52931972  .00003325  00000+0  25755-3 0  9995"
-    line2 = "2 58469  97.6719 160.4649 0013302 174.6184 185.5186 15.02057459 18273"
-    sim_engine = Simulator("SatelliteName", TLE=[line1, line2], t0=None, timing_mode=timing, time_step=time_step)
+    sim_engine = create_sim_engine(timing, time_step, ephemeris_segment, tle_file, max_catch_up_steps)
 
     # 5. Add subsystems (only the camera in this case)
-    camera = Camera(shared_data_dict=shared_data_dict)
+    camera = Camera(state_block=SharedStateBlock.attach(state_block_name))
     # 6. Run the simulation
     sim_engine.reset()
 
-    while True:
-        sim_step = sim_engine.sim_step() # returns none if no step is taken (e.g. because the time for teh next step has not yet come
-        time.sleep(0.1)
+    # the main process stops us with SIGTERM -> turn it into an exception so the metrics are still written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    last_metrics_publish = 0.0
+    try:
+        while True:
+            sim_step = sim_engine.sim_step() # returns none if no step is taken (e.g. because the time for teh next step has not yet come
+
+            if time.time() - last_metrics_publish >= METRICS_PUBLISH_INTERVAL:
+                last_metrics_publish = time.time()
+                publish_metrics(shared_data_dict, sim_engine)
+
+            # sleep until the next step is due, but wake up regularly to handle commands
+            time.sleep(min(sim_engine.time_until_next_step(), COMMAND_POLL_INTERVAL))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if metrics_file:
+            metrics.dump(metrics_file, extra={'clock': sim_engine.clock.get_stats()})
     
 if __name__ == '__main__':
     main()
\ No newline at end of file
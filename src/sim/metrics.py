@@ -0,0 +1,107 @@
+"""
+Latency metrics of the simulator.
+
+Every measured operation (a simulation step, the propagation, each event bus
+subscriber) gets a `LatencyHistogram` with logarithmic buckets (four per
+doubling, from 1 us to ~100 s). Recording a value is a few arithmetic
+operations on a fixed size list, so the histograms cost the same after a
+minute and after a week and can stay enabled in production. Quantiles are
+read from the buckets and are accurate to one bucket (~19 %).
+
+The sim process periodically copies `metrics.snapshot()` into the shared data
+dict, where the API serves it on /metrics.
+"""
+import json
+import math
+import time
+
+BUCKETS_PER_OCTAVE = 4
+N_BUCKETS = 108  # bucket 0: <= 1 us, last bucket: > 2 ** 26.5 us (~95 s)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        us = seconds * 1e6
+        i = 0 if us <= 1.0 else min(int(math.log2(us) * BUCKETS_PER_OCTAVE) + 1, N_BUCKETS - 1)
+        self.counts[i] += 1
+
+    def quantile(self, q):
+        """Upper bound (seconds) of the bucket containing the q-quantile."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if cumulative >= rank:
+                return min(2 ** (i / BUCKETS_PER_OCTAVE) * 1e-6, self.max)
+        return self.max
+
+    def snapshot(self, buckets=False):
+        summary = {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1e3 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1e3,
+            'p90_ms': self.quantile(0.9) * 1e3,
+            'p99_ms': self.quantile(0.99) * 1e3,
+            'max_ms': self.max * 1e3,
+            'total_s': self.total,
+        }
+        if buckets:
+            # upper bound in ms -> count, only non-empty buckets
+            summary['buckets'] = {f"{2 ** (i / BUCKETS_PER_OCTAVE) * 1e-3:.6g}": n for i, n in enumerate(self.counts) if n}
+        return summary
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}  # name -> callable returning a number, evaluated on snapshot
+        self.started = time.time()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def reset(self):
+        # cleared in place: the event bus and the simulator keep references to their histograms
+        for histogram in self.histograms.values():
+            histogram.clear()
+        self.started = time.time()
+
+    def snapshot(self, buckets=False):
+        return {
+            'since': self.started,
+            'histograms': {name: h.snapshot(buckets) for name, h in sorted(self.histograms.items())},
+            'gauges': {name: func() for name, func in sorted(self.gauges.items())},
+        }
+
+    def dump(self, path, extra=None):
+        snapshot = self.snapshot(buckets=True)
+        if extra:
+            snapshot.update(extra)
+        with open(path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        print(f"[METRICS] Metrics written to {path}")
+
+
+# metrics of the process (like the default event bus)
+metrics = Metrics()
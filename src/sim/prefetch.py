@@ -0,0 +1,221 @@
+"""
+Predictive prefetch of Sentinel imagery along the upcoming ground track of the primary satellite.
+
+The API knows the orbit and the simulation clock, so it knows where the satellite will be
+over the next minutes. A planner thread propagates the orbit `lookahead` simulation seconds
+ahead of the clock and queues one image every `spacing_km` of ground track; a pool of
+`concurrency` workers loads them into the STAC search and raster tile caches of the provider
+(`prefetch_image`). When /data/current/image/sentinel is requested over that area, the image
+is assembled from the caches instead of searched and downloaded.
+
+- Points the clock has passed before a worker gets to them are skipped.
+- `bandwidth` (bytes per second, None = unlimited) bounds the downloads: a worker waits until
+  the budget is positive again before it starts the next image (burst of one second).
+- When the clock is reset or its speed changes (or the simulation time jumps), the queued
+  prefetches are cancelled and the track is planned again from the new time. Images that are
+  already loading finish, their result is simply cached.
+
+Only the primary satellite is prefetched, with the default image size and bands.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clock import sim_time_at
+from metrics import metrics
+
+DEFAULT_LOOKAHEAD = 300.0  # simulation seconds
+DEFAULT_CONCURRENCY = 2
+DEFAULT_SPACING_KM = 5.0
+# ground speed of a satellite in low earth orbit, to turn the spacing into a time step
+GROUND_SPEED_KM_S = 7.0
+# prefetched images are this much larger than the requested ones, so a request between two prefetched
+# points doesn't miss a tile at the edge (the image boxes are not aligned to the pixel grid)
+MARGIN_KM = 1.0
+# how often (wall clock seconds) the planner follows the clock
+PLAN_INTERVAL = 1.0
+# failures are printed at most this often (seconds), e.g. while the catalog is unreachable
+ERROR_PRINT_INTERVAL = 60.0
+
+
+class ImageryPrefetcher:
+    def __init__(self, provider, ephemeris, read_clock, lookahead=DEFAULT_LOOKAHEAD, concurrency=DEFAULT_CONCURRENCY,
+                 bandwidth=None, spacing_km=DEFAULT_SPACING_KM, size_km=10, spectral_bands=('red', 'green', 'blue'),
+                 interval=PLAN_INTERVAL):
+        self.provider = provider  # SentinelProvider (prefetch_image)
+        self.ephemeris = ephemeris
+        self.read_clock = read_clock  # published clock state, see clock.sim_time_at
+        self.lookahead = lookahead
+        self.bandwidth = bandwidth
+        self.step = spacing_km / GROUND_SPEED_KM_S
+        self.size_km = size_km  # size of the requested images
+        self.spectral_bands = list(spectral_bands)
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prefetch")
+        # reentrant: the done callback of a task that finished before it was registered runs in plan()
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # planning state: the clock the track was planned for and how far it is planned
+        self.clock_key = None
+        self.last_time = None
+        self.planned_until = None
+        self.generation = 0  # bumped by cancel(), tasks of older generations are dropped
+        self.futures = set()
+
+        # bandwidth budget (token bucket)
+        self.budget_lock = threading.Lock()
+        self.budget = float(bandwidth or 0)
+        self.budget_time = time.monotonic()
+
+        # statistics
+        self.planned = 0
+        self.completed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.downloaded = 0  # bytes
+        self._last_error_print = 0.0
+        self.image_histogram = metrics.histogram("prefetch.image")
+        for counter in ("planned", "completed", "skipped", "cancelled", "failed", "downloaded"):
+            metrics.gauge(f"prefetch.{counter}", lambda counter=counter: getattr(self, counter))
+        metrics.gauge("prefetch.queued", lambda: len(self.futures))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="prefetch-planner", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+    def plan(self, now=None):
+        """Follow the clock once: cancel on a reset / speed change and queue the track up to the lookahead."""
+        state = self.read_clock()
+        t = sim_time_at(state, now)
+        if t is None:
+            # paused or as fast as possible: nothing to plan ahead of (the queued points stay valid while paused)
+            return
+        clock_key = (state['sim_t0'], state['speed'])
+        if clock_key != self.clock_key or t < self.last_time or (self.planned_until is not None and t > self.planned_until):
+            # reset, speed change or a jump past the planned track
+            if self.clock_key is not None:
+                self.cancel()
+            self.clock_key = clock_key
+            self.planned_until = None
+        self.last_time = t
+
+        start = t if self.planned_until is None else self.planned_until + self.step
+        times = np.arange(start, t + self.lookahead, self.step)
+        if len(times) == 0:
+            return
+        lon, lat, _ = self.ephemeris.get_lonlatalt(times)
+        with self.lock:
+            generation = self.generation
+            for point in zip(times.tolist(), lon.tolist(), lat.tolist()):
+                future = self.executor.submit(self._prefetch, generation, *point)
+                self.futures.add(future)
+                future.add_done_callback(self._done)
+        self.planned += len(times)
+        self.planned_until = float(times[-1])
+
+    def cancel(self):
+        """Drop the queued prefetches (images that are loading finish)."""
+        with self.lock:
+            self.generation += 1
+            futures = list(self.futures)
+        for future in futures:
+            if future.cancel():
+                self.cancelled += 1
+
+    def stats(self):
+        return {
+            "planned": self.planned,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "downloaded_bytes": self.downloaded,
+            "queued": len(self.futures),
+            "planned_until": self.planned_until,
+        }
+
+    # ------------------------------------
+    # Helper Functions
+    # ------------------------------------
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.plan()
+            except Exception as e:
+                self._print_error(f"planning failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def _done(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _prefetch(self, generation, t, lon, lat):
+        if self._dropped(generation, t):
+            return
+        self._wait_for_budget(generation)
+        if self._dropped(generation, t):
+            return
+        start = time.perf_counter()
+        try:
+            downloaded = self.provider.prefetch_image(lon, lat, size_km=self.size_km + MARGIN_KM, spectral_bands=self.spectral_bands)
+        except Exception as e:
+            # e.g. the catalog is unreachable (an area without images is not an error, nothing is loaded)
+            self.failed += 1
+            self._print_error(f"prefetch at ({lon:.3f}, {lat:.3f}) failed: {e}")
+            return
+        self.image_histogram.record(time.perf_counter() - start)
+        self.completed += 1
+        self.downloaded += downloaded
+        self._charge(downloaded)
+
+    def _dropped(self, generation, t):
+        # planned for a clock that was reset since, or the satellite is already past this point
+        if generation != self.generation:
+            self.cancelled += 1
+            return True
+        now = sim_time_at(self.read_clock())
+        if now is not None and t < now:
+            self.skipped += 1
+            return True
+        return False
+
+    def _wait_for_budget(self, generation):
+        if not self.bandwidth:
+            return
+        while generation == self.generation and not self.stop_event.is_set():
+            with self.budget_lock:
+                self._refill()
+                if self.budget > 0:
+                    return
+                wait = -self.budget / self.bandwidth
+            self.stop_event.wait(min(wait, self.interval))
+
+    def _charge(self, downloaded):
+        if not self.bandwidth:
+            return
+        with self.budget_lock:
+            self._refill()
+            self.budget -= downloaded
+
+    def _refill(self):
+        # called with the budget lock held; at most one second of budget is saved up
+        now = time.monotonic()
+        self.budget = min(self.bandwidth, self.budget + (now - self.budget_time) * self.bandwidth)
+        self.budget_time = now
+
+    def _print_error(self, message):
+        if time.time() - self._last_error_print >= ERROR_PRINT_INTERVAL:
+            self._last_error_print = time.time()
+            print(f"[PREFETCH] {message}")
@@ -0,0 +1,300 @@
+"""
+Latest simulation state in a fixed-layout shared memory block.
+
+The sim process (Camera) is the only writer, any number of API processes read
+the block without locks. Each section of the block (primary satellite, clock,
+constellation) is framed by two copies of a sequence counter (seqlock): the
+writer increments the counter at the end of the section, writes the data and
+then copies the counter to the start of the section. A reader copies the
+section from start to end and retries if the two counters differ, so it never
+returns a torn update and never blocks the writer. For the small sections this
+is a single struct.unpack_from call per read.
+
+Every primary position is also appended to a ring buffer (history), so a
+reader that polls the block (e.g. the position stream of the API) gets every
+step, not just the latest one, as long as it doesn't fall behind by more than
+the size of the ring. Each ring slot is framed by its entry number.
+
+A writer killed in the middle of a write leaves the two counters of the section
+different for good: a reader stops retrying after READ_TIMEOUT seconds and raises
+TornReadError instead of spinning forever.
+
+Layout (little endian):
+
+    header:         n_satellites u64 | history_size u64
+    primary:        seq u64 | lon, lat, alt, time_unix f64 | seq u64
+    clock:          seq u64 | running, speed, anchor_wall, anchor_epsec, sim_t0, time_epsec f64 | seq u64
+    constellation:  seq u64 | time_unix f64 | count u64 | ids_version u64 | ids S16[N] | lon, lat, alt f64[N, 3] | seq u64
+    history:        count u64 | history_size * (entry + 1 u64 | lon, lat, alt, time_unix f64 | entry + 1 u64)
+
+Unset values are NaN (e.g. time_unix before the first step, anchor_wall of a
+clock that is not anchored). The number of constellation slots is fixed when
+the block is created.
+"""
+from multiprocessing import shared_memory
+import math
+import struct
+import time
+
+import numpy as np
+
+SEQ = struct.Struct("<Q")
+HEADER = struct.Struct("<QQ")
+PRIMARY = struct.Struct("<Q4dQ")
+CLOCK = struct.Struct("<Q6dQ")
+CONSTELLATION_HEADER = struct.Struct("<QdQQ")
+POSITION = struct.Struct("<3d")
+HISTORY_SLOT = struct.Struct("<Q4dQ")
+DEFAULT_HISTORY_SIZE = 4096
+ID_DTYPE = np.dtype("S16")
+NAN = float("nan")
+# longest time (seconds) a reader retries a section that is being written (a write takes microseconds)
+READ_TIMEOUT = 0.1
+
+
+class TornReadError(RuntimeError):
+    """A section stayed inconsistent for READ_TIMEOUT seconds: the writer stopped in the middle of a write."""
+
+
+class SharedStateBlock:
+    def __init__(self, buffer, n_satellites, history_size=DEFAULT_HISTORY_SIZE, shm=None):
+        self.buffer = buffer
+        self.n_satellites = n_satellites
+        self.history_size = history_size
+        self.shm = shm  # SharedMemory the buffer belongs to (None for an in-memory block)
+
+        # (start, end) offsets of the two sequence counters of each section
+        self.primary = (HEADER.size, HEADER.size + PRIMARY.size - SEQ.size)
+        self.clock = (self.primary[1] + SEQ.size, self.primary[1] + SEQ.size + CLOCK.size - SEQ.size)
+        constellation_start = self.clock[1] + SEQ.size
+        ids_offset = constellation_start + CONSTELLATION_HEADER.size
+        self.positions_offset = ids_offset + n_satellites * ID_DTYPE.itemsize
+        self.constellation = (constellation_start, self.positions_offset + n_satellites * POSITION.size)
+        self.history_offset = self.constellation[1] + SEQ.size
+        self._history_count = 0  # writer side
+        self.ids = np.ndarray((n_satellites,), dtype=ID_DTYPE, buffer=buffer, offset=ids_offset)
+        self.positions = np.ndarray((n_satellites, 3), dtype="<f8", buffer=buffer, offset=self.positions_offset)
+
+        # reader side cache of the decoded ids, refreshed when ids_version changes
+        self._ids_version = 0
+        self._ids = []
+        self._index = {}
+        self._written_ids = []  # writer side
+
+    @staticmethod
+    def size(n_satellites, history_size=DEFAULT_HISTORY_SIZE):
+        return (HEADER.size + PRIMARY.size + CLOCK.size + CONSTELLATION_HEADER.size + SEQ.size
+                + n_satellites * (ID_DTYPE.itemsize + POSITION.size) + SEQ.size + history_size * HISTORY_SLOT.size)
+
+    @classmethod
+    def create(cls, n_satellites=0, history_size=DEFAULT_HISTORY_SIZE):
+        """New shared memory block, to be attached by the other processes through `block.name`."""
+        shm = shared_memory.SharedMemory(create=True, size=cls.size(n_satellites, history_size))
+        block = cls(shm.buf, n_satellites, history_size, shm)
+        block._initialize()
+        return block
+
+    @classmethod
+    def attach(cls, name):
+        # processes started by the creator share its resource tracker, so the block is unlinked only once
+        shm = shared_memory.SharedMemory(name=name)
+        n_satellites, history_size = HEADER.unpack_from(shm.buf, 0)
+        return cls(shm.buf, n_satellites, history_size, shm)
+
+    @classmethod
+    def in_memory(cls, n_satellites=0, history_size=DEFAULT_HISTORY_SIZE):
+        """Block in ordinary memory, for a writer and readers in the same process."""
+        block = cls(bytearray(cls.size(n_satellites, history_size)), n_satellites, history_size)
+        block._initialize()
+        return block
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        # the numpy views reference the buffer and have to go first
+        self.ids = self.positions = self.buffer = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+
+    # --------------------------------------------------------
+    # Writer
+    # --------------------------------------------------------
+
+    def write_primary(self, lon, lat, alt, time_unix):
+        seq = self._begin_write(self.primary)
+        struct.pack_into("<4d", self.buffer, self.primary[0] + SEQ.size, lon, lat, alt, time_unix)
+        self._end_write(self.primary, seq)
+        self._append_history(lon, lat, alt, time_unix)
+
+    def write_clock(self, running, speed, anchor_wall, anchor_epsec, sim_t0, time_epsec):
+        seq = self._begin_write(self.clock)
+        struct.pack_into("<6d", self.buffer, self.clock[0] + SEQ.size, float(running), speed,
+                         NAN if anchor_wall is None else anchor_wall, anchor_epsec, sim_t0, time_epsec)
+        self._end_write(self.clock, seq)
+
+    def write_constellation(self, ids, lon, lat, alt, time_unix):
+        count = len(ids)
+        if count > self.n_satellites:
+            raise ValueError(f"Constellation has {count} satellites, the state block only {self.n_satellites} slots")
+        ids_version = CONSTELLATION_HEADER.unpack_from(self.buffer, self.constellation[0])[3]
+        seq = self._begin_write(self.constellation)
+        if list(ids) != self._written_ids:
+            # the ids only change with the constellation -> only copied (and decoded by readers) then
+            self.ids[:count] = ids
+            self._written_ids = list(ids)
+            ids_version += 1
+        self.positions[:count, 0] = lon
+        self.positions[:count, 1] = lat
+        self.positions[:count, 2] = alt
+        struct.pack_into("<dQQ", self.buffer, self.constellation[0] + SEQ.size, time_unix, count, ids_version)
+        self._end_write(self.constellation, seq)
+
+    # --------------------------------------------------------
+    # Readers
+    # --------------------------------------------------------
+
+    def read_primary(self):
+        """(lon, lat, alt), time_unix of the primary satellite, (None, None) before the first write."""
+        deadline = None
+        while True:
+            seq_start, lon, lat, alt, time_unix, seq_end = PRIMARY.unpack_from(self.buffer, self.primary[0])
+            if seq_start == seq_end:
+                break
+            deadline = _retry_deadline(deadline, "primary")
+        if math.isnan(time_unix):
+            return None, None
+        return (lon, lat, alt), time_unix
+
+    def read_clock(self):
+        """Clock state as dict with the ClockState fields, None before the first write."""
+        deadline = None
+        while True:
+            seq_start, running, speed, anchor_wall, anchor_epsec, sim_t0, time_epsec, seq_end = CLOCK.unpack_from(self.buffer, self.clock[0])
+            if seq_start == seq_end:
+                break
+            deadline = _retry_deadline(deadline, "clock")
+        if math.isnan(sim_t0):
+            return None
+        return {
+            'running': bool(running),
+            'speed': speed,
+            'anchor_wall': None if math.isnan(anchor_wall) else anchor_wall,
+            'anchor_epsec': anchor_epsec,
+            'sim_t0': sim_t0,
+            'time_epsec': time_epsec,
+        }
+
+    def read_constellation_ids(self):
+        deadline = None
+        while True:
+            seq_start, _, count, ids_version = CONSTELLATION_HEADER.unpack_from(self.buffer, self.constellation[0])
+            if ids_version == self._ids_version:
+                return self._ids
+            ids = [sat_id.decode() for sat_id in self.ids[:count].tolist()]
+            if SEQ.unpack_from(self.buffer, self.constellation[1])[0] == seq_start:
+                break
+            deadline = _retry_deadline(deadline, "constellation")
+        self._ids, self._ids_version = ids, ids_version
+        self._index = {sat_id: i for i, sat_id in enumerate(ids)}
+        return ids
+
+    def read_constellation(self):
+        """ids, positions (count, 3) and time_unix of the constellation (time_unix is None before the first write)."""
+        ids = self.read_constellation_ids()
+        deadline = None
+        while True:
+            seq_start, time_unix, count, _ = CONSTELLATION_HEADER.unpack_from(self.buffer, self.constellation[0])
+            positions = self.positions[:count].copy()
+            if SEQ.unpack_from(self.buffer, self.constellation[1])[0] == seq_start:
+                break
+            deadline = _retry_deadline(deadline, "constellation")
+        return ids, positions, None if math.isnan(time_unix) else time_unix
+
+    def read_satellite(self, sat_id):
+        """(lon, lat, alt), time_unix of a constellation member, (None, None) if the id is unknown."""
+        self.read_constellation_ids()
+        i = self._index.get(sat_id)
+        if i is None:
+            return None, None
+        deadline = None
+        while True:
+            seq_start, time_unix, count, _ = CONSTELLATION_HEADER.unpack_from(self.buffer, self.constellation[0])
+            position = POSITION.unpack_from(self.buffer, self.positions_offset + i * POSITION.size)
+            if SEQ.unpack_from(self.buffer, self.constellation[1])[0] == seq_start:
+                break
+            deadline = _retry_deadline(deadline, "constellation")
+        if i >= count or math.isnan(time_unix):
+            return None, None
+        return position, time_unix
+
+    def history_count(self):
+        """Number of primary positions written so far (the entry number of the next one)."""
+        return SEQ.unpack_from(self.buffer, self.history_offset)[0]
+
+    def read_history(self, cursor):
+        """
+        Primary positions with entry numbers >= cursor, oldest first, as a list of
+        (entry, lon, lat, alt, time_unix). Returns (entries, next cursor, number of entries lost because
+        they were already overwritten in the ring).
+        """
+        count = self.history_count()
+        first = max(cursor, count - self.history_size)
+        lost = first - cursor
+        entries = []
+        for entry in range(first, count):
+            seq_start, lon, lat, alt, time_unix, seq_end = HISTORY_SLOT.unpack_from(self.buffer, self._history_slot(entry))
+            if seq_start == seq_end == entry + 1:
+                entries.append((entry, lon, lat, alt, time_unix))
+            else:
+                lost += 1  # overwritten while we were reading
+        return entries, count, lost
+
+    # --------------------------------------------------------
+    # Helper functions
+    # --------------------------------------------------------
+
+    def _initialize(self):
+        HEADER.pack_into(self.buffer, 0, self.n_satellites, self.history_size)
+        PRIMARY.pack_into(self.buffer, self.primary[0], 0, NAN, NAN, NAN, NAN, 0)
+        CLOCK.pack_into(self.buffer, self.clock[0], 0, NAN, NAN, NAN, NAN, NAN, NAN, 0)
+        CONSTELLATION_HEADER.pack_into(self.buffer, self.constellation[0], 0, NAN, 0, 0)
+        SEQ.pack_into(self.buffer, self.constellation[1], 0)
+        SEQ.pack_into(self.buffer, self.history_offset, 0)
+
+    def _begin_write(self, section):
+        # readers copy from start to end: a changed end counter tells them a write started during their copy
+        seq = SEQ.unpack_from(self.buffer, section[1])[0] + 1
+        SEQ.pack_into(self.buffer, section[1], seq)
+        return seq
+
+    def _end_write(self, section, seq):
+        SEQ.pack_into(self.buffer, section[0], seq)
+
+    def _history_slot(self, entry):
+        return self.history_offset + SEQ.size + (entry % self.history_size) * HISTORY_SLOT.size
+
+    def _append_history(self, lon, lat, alt, time_unix):
+        entry = self._history_count
+        offset = self._history_slot(entry)
+        # same framing as the sections, with the entry number as sequence: end first, start last
+        SEQ.pack_into(self.buffer, offset + HISTORY_SLOT.size - SEQ.size, entry + 1)
+        struct.pack_into("<4d", self.buffer, offset + SEQ.size, lon, lat, alt, time_unix)
+        SEQ.pack_into(self.buffer, offset, entry + 1)
+        self._history_count = entry + 1
+        SEQ.pack_into(self.buffer, self.history_offset, entry + 1)
+
+
+def _retry_deadline(deadline, section):
+    # called after an inconsistent copy of a section: starts the deadline on the first retry, raises once it passed
+    now = time.monotonic()
+    if deadline is None:
+        return now + READ_TIMEOUT
+    if now > deadline:
+        raise TornReadError(f"the {section} section of the shared state block is not consistent - did the simulator die during a write?")
+    return deadline
@@ -1,25 +1,35 @@
 import datetime
+import math
 from time import time
 from pyorbital.orbital import Orbital, astronomy
 
-from pydispatch import dispatcher
 import time
 import numpy as np
 
-TOPIC_SIMULATION_COMMAND = "simulation.command"
-TOPIC_SATELLITE_GROUND_POSITION = "satellite.ground_position"
-TOPIC_SIMULATION_STEP_FORWARD = "simulation.step_forward"
-TOPIC_SIMULATION_TICK = "simulation.tick"
+from clock import SimulationClock
+from metrics import metrics
+from ephemeris import ChebyshevEphemeris, unix_to_datetime64
+from eventbus import (bus, TOPIC_SIMULATION_COMMAND, TOPIC_SATELLITE_GROUND_POSITION, TOPIC_SIMULATION_STEP_FORWARD,
+                      TOPIC_SIMULATION_TICK, TOPIC_CONSTELLATION_GROUND_POSITION, TOPIC_SIMULATION_CLOCK, StepForward,
+                      SimulationTick, GroundPosition, ConstellationGroundPosition, ClockState)
 
 
 
 class Simulator:
-    def __init__(self, name, TLE, t0=None, timing_mode=0, time_step=10):        
+    def __init__(self, name, TLE, t0=None, timing_mode=0, time_step=10, ephemeris_segment=600, max_catch_up_steps=10):
         self.name = name
         self.satellite = Orbital(name, line1=TLE[0], line2=TLE[1])
 
+        # piecewise Chebyshev fit of the orbit, refitted lazily as the clock advances. None -> direct SGP4 calls
+        self.ephemeris = None
+        if ephemeris_segment:
+            self.ephemeris = ChebyshevEphemeris(self.satellite, segment_seconds=ephemeris_segment)
+
         self.timing_mode = timing_mode  # 0 = as fast as possible, 1 = real time, 2 = 2x real time, etc.
         self.time_step = time_step  # in seconds
+        self.clock = SimulationClock(max_catch_up_steps=max_catch_up_steps)
+        self.step_histogram = metrics.histogram("sim.step")  # whole sim_step, including the tick subscribers
+        self.propagation_histogram = metrics.histogram("sim.propagation")
 
         self.sim_t0 = t0
         if self.sim_t0 is None:
@@ -27,79 +37,109 @@ class Simulator:
 
         self.reset()
 
-        dispatcher.connect(self.on_command, signal=TOPIC_SIMULATION_COMMAND)
+        bus.subscribe(TOPIC_SIMULATION_COMMAND, self.on_command)
 
     def get_orbital_location(self, time):
-        np_t = np.datetime64(int(self.utcg_time), 's')
-        lon, lat, alt = self.satellite.get_lonlatalt(np_t)
+        if self.ephemeris is not None:
+            return self.ephemeris.get_lonlatalt(time)
+        lon, lat, alt = self.satellite.get_lonlatalt(unix_to_datetime64(time))
         return (lon, lat, alt)
+
+    def set_tle(self, TLE):
+        self.satellite = Orbital(self.name, line1=TLE[0], line2=TLE[1])
+        if self.ephemeris is not None:
+            self.ephemeris.invalidate(self.satellite)
     
     def reset(self):
+        if self.ephemeris is not None:
+            self.ephemeris.invalidate()
         self.utcg_time = self.sim_t0
         self.currentTime_EpSec = 0
-        self.start_time = None
+        self.clock.reset()
         self.sim_is_running = False
         self.sim_outstanding_rewind_command = False
+        self._publish_clock_state()
 
     def sim_step(self):
+        start = time.perf_counter()
+        try:
+            return self._sim_step()
+        finally:
+            self.step_histogram.record(time.perf_counter() - start)
+
+    def _sim_step(self):
         # tick in any case. this is used to e.g. fetch commands -> needed even if the sim is not running
         self.tick()
 
         if self.sim_is_running:
-            print(f"[SIM] Advancing simulation by {self.time_step} seconds.")
-            if not self.start_time:
-                self.start_time = time.time()
-            if self.timing_mode: 
-                # wait until real time catches up. if timing_mode=0, we run as fast as possible -> this is skipped
-                if (time.time() - self.start_time)*self.timing_mode < self.currentTime_EpSec:
-                    return False
-                
-            self.currentTime_EpSec += self.time_step
-            self.utcg_time = self.sim_t0 + self.currentTime_EpSec
-                
-                # This is done for compatibility with other software (non public)
-            for i in range(3, -1, -1):
-                dispatcher.send(
-                    signal=TOPIC_SIMULATION_STEP_FORWARD,
-                    sender=str(self),
-                    data={'counter': i},
-                    time=self.utcg_time,
-                    time_epsec=self.currentTime_EpSec,
-                )
-
-            self._publish_satellite_ground_position(self.utcg_time, self.currentTime_EpSec)
+            if self.clock.anchor_wall is None:
+                self.clock.start(self.currentTime_EpSec, self.timing_mode)
+                self._publish_clock_state()
+            # number of steps needed to catch up with the wall clock. if timing_mode=0, we run as fast as possible -> one step
+            steps, dropped = self.clock.steps_due(self.currentTime_EpSec, self.time_step)
+            if steps == 0:
+                return False
+
+            if dropped:
+                print(f"[SIM] Simulation is behind the wall clock, skipping {dropped} steps.")
+                self.currentTime_EpSec += dropped * self.time_step
+            for _ in range(steps):
+                self._advance()
+
         if self.sim_outstanding_rewind_command:
             self.sim_outstanding_rewind_command = False
             self.reset()
 
-    def tick(self):
-        dispatcher.send(
-            signal=TOPIC_SIMULATION_TICK,
-            sender=str(self),
-            data={},
-            time=self.utcg_time,
+    def time_until_next_step(self):
+        """Wall clock seconds until the next step is due (inf while the simulation is not running)."""
+        if not self.sim_is_running:
+            return math.inf
+        return self.clock.time_until_next_step(self.currentTime_EpSec)
+
+    def _advance(self):
+        print(f"[SIM] Advancing simulation by {self.time_step} seconds.")
+        self.currentTime_EpSec += self.time_step
+        self.utcg_time = self.sim_t0 + self.currentTime_EpSec
+
+        # This is done for compatibility with other software (non public)
+        for i in range(3, -1, -1):
+            bus.publish(TOPIC_SIMULATION_STEP_FORWARD, StepForward(i, self.utcg_time, self.currentTime_EpSec))
+
+        self._publish_satellite_ground_position(self.utcg_time, self.currentTime_EpSec)
+
+    def _publish_clock_state(self):
+        # lets e.g. the API compute the simulation time (and position) between two steps
+        bus.publish(TOPIC_SIMULATION_CLOCK, ClockState(
+            running=self.sim_is_running,
+            speed=self.clock.speed,
+            anchor_wall=self.clock.anchor_wall,
+            anchor_epsec=self.clock.anchor_epsec,
+            sim_t0=self.sim_t0,
             time_epsec=self.currentTime_EpSec,
-        )
+        ))
+
+    def tick(self):
+        bus.publish(TOPIC_SIMULATION_TICK, SimulationTick(self.utcg_time, self.currentTime_EpSec))
 
     def _publish_satellite_ground_position(self, utcg_time, sim_time):
+        start = time.perf_counter()
         lon, lat, alt = self.get_orbital_location(utcg_time)
-        dispatcher.send(
-            signal=TOPIC_SATELLITE_GROUND_POSITION,
-            sender=str(self),
-            data={'lon': lon, 'lat': lat, 'alt': alt},
+        self.propagation_histogram.record(time.perf_counter() - start)
+        bus.publish(TOPIC_SATELLITE_GROUND_POSITION, GroundPosition(
+            lon=lon, lat=lat, alt=alt,
             time=datetime.datetime.fromtimestamp(utcg_time).isoformat(),
+            time_unix=utcg_time,
             time_epsec=sim_time,
-        )
+        ))
 
     
-    def on_command(self, sender, data):
-        command = data.get('command', '')
+    def on_command(self, event):
+        command = event.command
         print(f"[SIM COMMAND] Command received: {command}")
         if command == 'start':
             print("[SIM COMMAND] Start simulation command received.")
-            {'step_size_seconds': 1, 'replay_speed': 1.0}
-            self.set_sim_speed(step_size = data.get('parameters', {}).get('step_size_seconds', 10),
-                               replay_speed = data.get('parameters', {}).get('replay_speed', 1.0))
+            self.set_sim_speed(step_size = event.parameters.get('step_size_seconds', 10),
+                               replay_speed = event.parameters.get('replay_speed', 1.0))
             self.sim_is_running = True
         elif command == 'pause':
             print("[SIM COMMAND] Pause simulation command received.")
@@ -110,6 +150,7 @@ class Simulator:
             self.sim_outstanding_rewind_command = True
         else:
             print(f"[SIM COMMAND] Unknown command received: {command}")
+        self._publish_clock_state()
 
     def set_sim_speed(self, step_size: int, replay_speed: float):
         if step_size > 0:
@@ -122,6 +163,36 @@ class Simulator:
         else:
             self.timing_mode = 0  # as fast as possible
 
-        # correct the start time to account for speed change. Otherwise there will be jumps in the timeline
-        self.start_time = time.time() - (self.currentTime_EpSec / self.timing_mode if self.timing_mode > 0 else 0)
-        
\ No newline at end of file
+        # re-anchor the clock to account for speed change. Otherwise there will be jumps in the timeline
+        self.clock.start(self.currentTime_EpSec, self.timing_mode)
+
+
+class ConstellationSimulator(Simulator):
+    """
+    Simulates a whole constellation. The primary satellite is published on
+    TOPIC_SATELLITE_GROUND_POSITION as before (dashboard, single satellite API),
+    all satellites are propagated in one batched call per step and published
+    as one columnar message on TOPIC_CONSTELLATION_GROUND_POSITION.
+    """
+    def __init__(self, name, constellation, primary_id=None, t0=None, timing_mode=0, time_step=10, ephemeris_segment=600, max_catch_up_steps=10):
+        self.constellation = constellation
+        self.primary_id = primary_id if primary_id is not None else constellation.ids[0]
+        super().__init__(name, TLE=constellation.get_tle(self.primary_id), t0=t0, timing_mode=timing_mode,
+                         time_step=time_step, ephemeris_segment=ephemeris_segment, max_catch_up_steps=max_catch_up_steps)
+        self.constellation_propagation_histogram = metrics.histogram("sim.constellation_propagation")
+
+    def get_constellation_location(self, time):
+        return self.constellation.get_lonlatalt(time)
+
+    def _publish_satellite_ground_position(self, utcg_time, sim_time):
+        super()._publish_satellite_ground_position(utcg_time, sim_time)
+
+        start = time.perf_counter()
+        lon, lat, alt = self.get_constellation_location(utcg_time)
+        self.constellation_propagation_histogram.record(time.perf_counter() - start)
+        bus.publish(TOPIC_CONSTELLATION_GROUND_POSITION, ConstellationGroundPosition(
+            ids=self.constellation.ids, lon=lon, lat=lat, alt=alt,
+            time=datetime.datetime.fromtimestamp(utcg_time).isoformat(),
+            time_unix=utcg_time,
+            time_epsec=sim_time,
+        ))
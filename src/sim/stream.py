@@ -0,0 +1,83 @@
+"""
+Push feed of the primary satellite position for the API (WebSocket and SSE).
+
+One broadcaster task per API process follows the position history of the
+shared state block and hands every new position to the connected clients.
+Each client has its own decimation (every n-th step and/or a minimum wall
+clock interval between two frames) and its own bounded queue: if a client
+can't keep up, its oldest frames are dropped (and counted) instead of slowing
+down the broadcaster, the other clients or the simulator.
+
+The broadcaster only runs while clients are connected.
+"""
+import asyncio
+import datetime
+import time
+
+# how often the broadcaster checks the state block for new positions (seconds)
+POLL_INTERVAL = 0.02
+
+
+class StreamClient:
+    def __init__(self, every_n=1, min_interval=0.0, queue_size=100):
+        self.every_n = max(1, every_n)
+        self.min_interval = min_interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.received = 0  # positions offered (before decimation)
+        self.sent = 0
+        self.dropped = 0  # frames dropped because the client was too slow (or lost in the ring buffer)
+        self._last_frame = 0.0
+
+    def offer(self, frame, now):
+        self.received += 1
+        if (self.received - 1) % self.every_n or now - self._last_frame < self.min_interval:
+            return
+        self._last_frame = now
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+    async def frames(self):
+        while True:
+            frame = await self.queue.get()
+            self.sent += 1
+            yield {**frame, "dropped": self.dropped}
+
+
+class PositionBroadcaster:
+    def __init__(self, state_block, poll_interval=POLL_INTERVAL):
+        self.state_block = state_block
+        self.poll_interval = poll_interval
+        self.clients = set()
+        self.task = None
+
+    def connect(self, **options):
+        client = StreamClient(**options)
+        self.clients.add(client)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return client
+
+    def disconnect(self, client):
+        self.clients.discard(client)
+
+    async def _run(self):
+        cursor = self.state_block.history_count()  # clients get the positions from now on
+        while self.clients:
+            entries, cursor, lost = self.state_block.read_history(cursor)
+            now = time.time()
+            clients = list(self.clients)
+            if lost:
+                for client in clients:
+                    client.dropped += lost
+            for entry, lon, lat, alt, time_unix in entries:
+                frame = {
+                    "seq": entry,
+                    "lon-lat-alt": [lon, lat, alt],
+                    "timestamp": datetime.datetime.fromtimestamp(time_unix).isoformat(),
+                    "time_unix": time_unix,
+                }
+                for client in clients:
+                    client.offer(frame, now)
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,45 @@
+"""Torn reads of the shared state block: python -m pytest test_shared_state.py (from src/sim)."""
+import pytest
+
+import shared_state
+from shared_state import SharedStateBlock, TornReadError
+
+
+@pytest.fixture
+def block(monkeypatch):
+    monkeypatch.setattr(shared_state, "READ_TIMEOUT", 0.01)
+    block = SharedStateBlock.in_memory(2)
+    block.write_primary(10.0, 20.0, 500.0, 1000.0)
+    block.write_clock(True, 1.0, 1000.0, 0.0, 1000.0, 0.0)
+    block.write_constellation(["A", "B"], [1.0, 2.0], [3.0, 4.0], [500.0, 510.0], 1000.0)
+    return block
+
+
+def test_consistent_sections_are_read(block):
+    assert block.read_primary() == ((10.0, 20.0, 500.0), 1000.0)
+    assert block.read_clock()["speed"] == 1.0
+    assert block.read_constellation_ids() == ["A", "B"]
+    assert block.read_satellite("B")[1] == 1000.0
+
+
+def test_primary_left_mid_write_raises(block):
+    # writer killed between _begin_write and _end_write: the sequence counters never match again
+    block._begin_write(block.primary)
+    with pytest.raises(TornReadError):
+        block.read_primary()
+
+
+def test_clock_left_mid_write_raises(block):
+    block._begin_write(block.clock)
+    with pytest.raises(TornReadError):
+        block.read_clock()
+
+
+def test_constellation_left_mid_write_raises(block):
+    block._begin_write(block.constellation)
+    with pytest.raises(TornReadError):
+        block.read_constellation_ids()
+    with pytest.raises(TornReadError):
+        block.read_constellation()
+    with pytest.raises(TornReadError):
+        block.read_satellite("A")